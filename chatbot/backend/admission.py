@@ -0,0 +1,174 @@
+# admission.py
+#
+# Overload protection for model-bound chat requests: a bounded admission
+# queue with per-request deadlines, retries with jittered exponential backoff
+# for transient model errors, and a circuit breaker that stops calling the
+# model while it keeps failing.
+
+import asyncio
+from contextlib import asynccontextmanager
+import math
+import random
+import time
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    GOOGLE_TRANSIENT = (google_exceptions.TooManyRequests, google_exceptions.ServiceUnavailable,
+                        google_exceptions.InternalServerError, google_exceptions.DeadlineExceeded,
+                        google_exceptions.GatewayTimeout)
+except ImportError:
+    GOOGLE_TRANSIENT = ()
+
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError, asyncio.TimeoutError) + GOOGLE_TRANSIENT
+
+
+def is_transient(error):
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed; `reason` is "queue_full" or "deadline"."""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Chat service overloaded ({reason})")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionQueue:
+    """At most `max_concurrency` requests run; up to `max_queue` more wait.
+
+    A request arriving to a full queue is rejected at once, and one that is
+    still waiting when its deadline passes gives up, so the backlog (and the
+    memory it holds) stays bounded however slow the model gets.
+    """
+
+    def __init__(self, max_concurrency=32, max_queue=64):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.active = 0
+        self.admitted = 0
+        self.shed = {"queue_full": 0, "deadline": 0}
+        self._service_seconds = None  # moving average of time holding a slot
+
+    def retry_after(self):
+        """Seconds until a new request would likely get a slot (1-60)."""
+        service = self._service_seconds or 1.0
+        return max(1, min(60, math.ceil(service * (self.waiting + 1) / self.max_concurrency)))
+
+    def check(self):
+        """Raise Overloaded now if a new request could not even queue."""
+        if self._slots.locked() and self.waiting >= self.max_queue:
+            self.shed["queue_full"] += 1
+            raise Overloaded("queue_full", self.retry_after())
+
+    @asynccontextmanager
+    async def slot(self, deadline):
+        """Hold a slot until the block exits; `deadline` is a time.monotonic() value."""
+        self.check()
+
+        if self._slots.locked():
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                self.shed["deadline"] += 1
+                raise Overloaded("deadline", self.retry_after()) from None
+            finally:
+                self.waiting -= 1
+        else:
+            await self._slots.acquire()
+
+        self.admitted += 1
+        self.active += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._slots.release()
+            elapsed = time.monotonic() - started
+            self._service_seconds = elapsed if self._service_seconds is None else \
+                0.9 * self._service_seconds + 0.1 * elapsed
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queue_depth": self.waiting,
+            "admitted": self.admitted,
+            "shed": dict(self.shed),
+            "mean_service_ms": round(self._service_seconds * 1000, 1) if self._service_seconds else None,
+        }
+
+
+async def retry_with_backoff(call, deadline, attempts=3, base_delay=0.25, max_delay=4.0, on_retry=None):
+    """Await `call()` until it succeeds, retrying transient errors with
+    full-jitter exponential backoff; no attempt or sleep runs past `deadline`."""
+    for attempt in range(attempts):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise asyncio.TimeoutError("Request deadline exceeded")
+        try:
+            return await asyncio.wait_for(call(), remaining)
+        except Exception as e:
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            if attempt == attempts - 1 or not is_transient(e) or time.monotonic() + delay >= deadline:
+                raise
+            if on_retry is not None:
+                on_retry(e)
+            await asyncio.sleep(delay)
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures. While open,
+    `allow()` is False; after `reset_seconds` one probe call is let through
+    and its outcome closes or re-opens the circuit. A probe that never
+    reports back (e.g. the client went away) is replaced after `reset_seconds`."""
+
+    def __init__(self, failure_threshold=5, reset_seconds=30):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self.opened = 0
+        self._probe_started = None
+
+    def allow(self):
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.reset_seconds:
+                return False
+            self.state = "half_open"
+        now = time.monotonic()
+        if self._probe_started is not None and now - self._probe_started < self.reset_seconds:
+            return False
+        self._probe_started = now
+        return True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probe_started = None
+
+    def release(self):
+        """Forget a call whose outcome says nothing about the model's health."""
+        self._probe_started = None
+
+    def record_failure(self):
+        self.failures += 1
+        self._probe_started = None
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                self.opened += 1
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def stats(self):
+        return {"state": self.state, "consecutive_failures": self.failures, "times_opened": self.opened,
+                "failure_threshold": self.failure_threshold, "reset_seconds": self.reset_seconds}
@@ -0,0 +1,113 @@
+# bench_conversation_store.py
+#
+# Chat-shaped SQLite load (read the last 5 messages, then write a user + bot
+# message) at 1, 8 and 64 concurrent users. Compares the old single shared
+# connection (commit per message, no index) with ConversationStore.
+#
+#   cd chatbot/backend
+#   python benchmarks/bench_conversation_store.py --exchanges 4000 --seed-users 2000
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conversation_store import ConversationStore
+
+
+class SharedConnectionStore:
+    """The original layout: one connection, one lock, one commit per message."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                          "user_id TEXT, sender TEXT, message TEXT, timestamp TEXT)")
+        self.lock = threading.Lock()
+
+    def get_history(self, user_id, limit=5):
+        with self.lock:
+            rows = self.conn.execute("SELECT sender, message FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+                                     (user_id, limit)).fetchall()
+        return list(reversed(rows))
+
+    def save(self, user_id, messages):
+        for sender, message in messages:
+            with self.lock:
+                self.conn.execute("INSERT INTO messages (user_id, sender, message, timestamp) VALUES (?, ?, ?, ?)",
+                                  (user_id, sender, message, datetime.utcnow().isoformat()))
+                self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class PooledStore:
+    def __init__(self, path):
+        self.store = ConversationStore(path)
+
+    def get_history(self, user_id, limit=5):
+        return self.store.get_history(user_id, limit)
+
+    def save(self, user_id, messages):
+        self.store.append(user_id, messages).result()
+
+    def close(self):
+        self.store.close()
+
+
+def seed(path, users, per_user):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                 "user_id TEXT, sender TEXT, message TEXT, timestamp TEXT)")
+    now = datetime.utcnow().isoformat()
+    conn.executemany("INSERT INTO messages (user_id, sender, message, timestamp) VALUES (?, ?, ?, ?)",
+                     ((f"user{u}", "user" if i % 2 == 0 else "bot", f"seed message {i}", now)
+                      for i in range(per_user) for u in range(users)))
+    conn.commit()
+    conn.close()
+
+
+def run(store, exchanges, concurrency, users):
+    def exchange(i):
+        user_id = f"user{i % users}"
+        started = time.perf_counter()
+        store.get_history(user_id)
+        store.save(user_id, [("user", f"message {i}"), ("bot", f"reply {i}")])
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = sorted(pool.map(exchange, range(exchanges)))
+    elapsed = time.perf_counter() - started
+    return {
+        "exchanges_per_sec": round(exchanges / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2),
+    }
+
+
+def main(args):
+    for concurrency in (1, 8, 64):
+        for name, factory in (("shared-connection", SharedConnectionStore), ("conversation-store", PooledStore)):
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, "conversations.db")
+                seed(path, args.seed_users, args.seed_messages)
+                store = factory(path)
+                result = run(store, args.exchanges, concurrency, args.seed_users)
+                store.close()
+            print(f"{concurrency:>3} users  {name:<19} {result}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--exchanges", type=int, default=4000)
+    parser.add_argument("--seed-users", type=int, default=2000)
+    parser.add_argument("--seed-messages", type=int, default=50)
+    main(parser.parse_args())
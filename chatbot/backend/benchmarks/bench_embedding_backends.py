@@ -0,0 +1,94 @@
+# bench_embedding_backends.py
+#
+# Encode latency, throughput and resident memory of the SentenceTransformer
+# (PyTorch) backend versus the int8 ONNX backend. Each backend runs in its own
+# subprocess so memory numbers are not polluted by the other.
+#
+#   cd chatbot/backend
+#   python onnx_embedder.py export
+#   python benchmarks/bench_embedding_backends.py
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+TEXTS = [
+    "I feel anxious before exams and can't focus on anything.",
+    "How do I sleep better when my thoughts keep racing at night?",
+    "Grounding techniques can help when a panic attack starts.",
+    "I have been feeling low since I moved away from my friends.",
+]
+
+
+def rss_mb():
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return None
+
+
+def measure(backend, args):
+    baseline_rss = rss_mb()
+    started = time.perf_counter()
+    if backend == "onnx":
+        from onnx_embedder import OnnxEmbedder
+        model = OnnxEmbedder(args.model_dir)
+    else:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(args.model, device="cpu")
+    load_ms = (time.perf_counter() - started) * 1000
+
+    model.encode(TEXTS)  # warm-up
+
+    single = []
+    for i in range(args.single):
+        started = time.perf_counter()
+        model.encode([TEXTS[i % len(TEXTS)]])
+        single.append(time.perf_counter() - started)
+    single.sort()
+
+    corpus = [f"{TEXTS[i % len(TEXTS)]} ({i})" for i in range(args.corpus)]
+    started = time.perf_counter()
+    model.encode(corpus, batch_size=args.batch_size)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "backend": backend,
+        "load_ms": round(load_ms, 1),
+        "single_p50_ms": round(single[len(single) // 2] * 1000, 2),
+        "single_p99_ms": round(single[int(len(single) * 0.99)] * 1000, 2),
+        "batch_texts_per_sec": round(len(corpus) / elapsed, 1),
+        "rss_mb": round(rss_mb(), 1),
+        "model_rss_mb": round(rss_mb() - baseline_rss, 1),
+    }
+
+
+def main(args):
+    if args.backend:
+        print(json.dumps(measure(args.backend, args)))
+        return
+
+    for backend in ("sentence-transformers", "onnx"):
+        command = [sys.executable, os.path.abspath(__file__), "--backend", backend,
+                   "--model", args.model, "--model-dir", args.model_dir, "--single", str(args.single),
+                   "--corpus", str(args.corpus), "--batch-size", str(args.batch_size)]
+        output = subprocess.run(command, cwd=BACKEND_DIR, capture_output=True, text=True, check=True).stdout
+        print(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", choices=["sentence-transformers", "onnx"])
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--model-dir", default="onnx_model")
+    parser.add_argument("--single", type=int, default=200)
+    parser.add_argument("--corpus", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=32)
+    main(parser.parse_args())
@@ -0,0 +1,89 @@
+# bench_embedding_batcher.py
+#
+# Compares per-request query encoding with EmbeddingBatcher under concurrent load.
+#
+#   cd chatbot/backend
+#   python benchmarks/bench_embedding_batcher.py --requests 2000 --concurrency 64
+
+import argparse
+import asyncio
+import functools
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sentence_transformers import SentenceTransformer
+
+from embedding_batcher import EmbeddingBatcher
+
+QUERIES = [
+    "I feel anxious before exams",
+    "how do I sleep better",
+    "I can't stop overthinking at night",
+    "what are grounding techniques for panic attacks",
+    "I feel lonely since moving to a new city",
+    "how can I talk to my family about therapy",
+]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def drive(encode_one, total, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            await encode_one(f"{QUERIES[i % len(QUERIES)]} ({i})")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+    return {
+        "queries_per_sec": round(total / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+async def main(args):
+    model = SentenceTransformer(args.model)
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+
+    async def run_blocking(func, *a):
+        return await asyncio.get_running_loop().run_in_executor(executor, functools.partial(func, *a))
+
+    async def per_request(text):
+        return (await run_blocking(model.encode, [text]))[0]
+
+    batcher = EmbeddingBatcher(lambda texts: model.encode(texts, batch_size=len(texts)), run_blocking,
+                               window_ms=args.window_ms, max_batch_size=args.max_batch_size)
+
+    await drive(per_request, 50, args.concurrency)  # warm-up
+
+    baseline = await drive(per_request, args.requests, args.concurrency)
+    batched = await drive(batcher.encode, args.requests, args.concurrency)
+
+    print(f"per-request : {baseline}")
+    print(f"batched     : {batched}")
+    print(f"batcher     : {batcher.stats()}")
+    print(f"speedup     : {batched['queries_per_sec'] / baseline['queries_per_sec']:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--window-ms", type=float, default=5.0)
+    parser.add_argument("--max-batch-size", type=int, default=64)
+    asyncio.run(main(parser.parse_args()))
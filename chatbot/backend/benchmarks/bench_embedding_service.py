@@ -0,0 +1,151 @@
+# bench_embedding_service.py
+#
+# `uvicorn --workers N` with every worker loading its own embedding model and
+# Chroma client, versus thin workers sharing one embedding_service.py process.
+# Reports total resident memory of the process tree, time until all workers
+# are ready, and chat latency under load. Uses the stub chat model.
+#
+#   cd chatbot/backend
+#   python benchmarks/bench_embedding_service.py --workers 4 --embedder sentence-transformers
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else None
+
+
+def tree_rss_mb(root_pids):
+    """Resident memory of the given processes and all their descendants (Linux)."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    total, stack = 0, list(root_pids)
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                total += int(f.read().split("VmRSS:")[1].split()[0])
+        except (OSError, IndexError):
+            pass
+    return round(total / 1024, 1)
+
+
+async def wait_all_ready(client, confirmations=30):
+    # Requests land on arbitrary workers; require a run of consecutive 200s
+    streak = 0
+    while streak < confirmations:
+        try:
+            streak = streak + 1 if (await client.get("/readyz")).status_code == 200 else 0
+        except httpx.TransportError:
+            streak = 0
+        if not streak:
+            await asyncio.sleep(0.2)
+
+
+async def chat_load(client, concurrency, requests):
+    latencies = []
+
+    async def user(n):
+        for i in range(requests // concurrency):
+            started = time.perf_counter()
+            response = await client.post("/chat", json={"message": f"How do I sleep better? ({n}/{i})",
+                                                        "user_id": f"bench{n}"})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(n) for n in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {"requests": len(latencies), "throughput_rps": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1)}
+
+
+async def seed(workdir, env, args):
+    # Chroma clients in separate processes do not see each other's writes, so
+    # the corpus is ingested by a single worker before the measured run
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+                               "--log-level", "warning"], cwd=workdir, env=env, stdout=subprocess.DEVNULL)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=120) as client:
+            await wait_all_ready(client, confirmations=1)
+            response = await client.post("/ingest", json={"source": "bench", "content": "\n\n".join(
+                f"Sleep tip {i}. Keep a regular schedule and avoid screens before bed." for i in range(200))})
+            response.raise_for_status()
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def run_mode(mode, args):
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ, CHAT_MODEL_BACKEND="stub", STUB_MODEL_LATENCY_MS=str(args.model_latency_ms),
+               EMBEDDING_BACKEND=args.embedder, SUMMARY_ENABLED="0",
+               PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])))
+    processes = []
+    await seed(workdir, env, args)
+    started = time.perf_counter()
+    try:
+        if mode == "service":
+            socket_path = os.path.join(workdir, "embed.sock")
+            env["EMBEDDING_SERVICE_SOCKET"] = socket_path
+            processes.append(subprocess.Popen([sys.executable, os.path.join(BACKEND_DIR, "embedding_service.py"),
+                                               "--socket", socket_path],
+                                              cwd=workdir, env=env, stdout=subprocess.DEVNULL))
+        processes.append(subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+                                           "--workers", str(args.workers), "--log-level", "warning"],
+                                          cwd=workdir, env=env, stdout=subprocess.DEVNULL))
+
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=120) as client:
+            await wait_all_ready(client)
+            ready_seconds = round(time.perf_counter() - started, 2)
+            idle_rss = tree_rss_mb(process.pid for process in processes)
+            load = await chat_load(client, args.concurrency, args.requests)
+            loaded_rss = tree_rss_mb(process.pid for process in processes)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {"mode": mode, "workers": args.workers, "ready_seconds": ready_seconds,
+            "rss_idle_mb": idle_rss, "rss_after_load_mb": loaded_rss, **load}
+
+
+async def main(args):
+    for mode in ("per-worker", "service"):
+        print(json.dumps(await run_mode(mode, args)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--embedder", default="sentence-transformers")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--model-latency-ms", type=float, default=50)
+    parser.add_argument("--port", type=int, default=8767)
+    asyncio.run(main(parser.parse_args()))
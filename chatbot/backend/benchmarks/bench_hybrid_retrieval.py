@@ -0,0 +1,169 @@
+# bench_hybrid_retrieval.py
+#
+# Retrieval quality and latency of the dense, lexical, hybrid and auto modes
+# of HybridRetriever on a labelled test corpus: a few hundred "fact" chunks
+# (medications, hotline numbers, named techniques) hidden among generic
+# wellbeing filler, queried both with keywords and in natural language.
+# Reports hit rate and MRR at k, and query latency (embedding excluded).
+#
+#   cd chatbot/backend
+#   python benchmarks/bench_hybrid_retrieval.py --filler 5000
+#   python benchmarks/bench_hybrid_retrieval.py --embedder onnx
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+
+from embedders import load_embedder
+from retrieval import ChromaRetriever, HybridRetriever, NumpyRetriever
+
+MEDICATIONS = [
+    ("Sertraline", "Zoloft", "an SSRI antidepressant", "depression and panic disorder", "nausea and trouble sleeping"),
+    ("Fluoxetine", "Prozac", "an SSRI antidepressant", "depression and bulimia", "headaches and restlessness"),
+    ("Escitalopram", "Lexapro", "an SSRI antidepressant", "generalized anxiety", "fatigue and sweating"),
+    ("Bupropion", "Wellbutrin", "an atypical antidepressant", "depression and quitting smoking", "dry mouth and insomnia"),
+    ("Venlafaxine", "Effexor", "an SNRI antidepressant", "depression and anxiety", "dizziness when doses are missed"),
+    ("Lithium", "Lithobid", "a mood stabiliser", "bipolar disorder", "thirst and a fine tremor"),
+    ("Quetiapine", "Seroquel", "an atypical antipsychotic", "bipolar disorder and schizophrenia", "drowsiness and weight gain"),
+    ("Lamotrigine", "Lamictal", "a mood stabiliser", "bipolar depression", "a rash that needs urgent attention"),
+    ("Buspirone", "Buspar", "an anti-anxiety medicine", "generalized anxiety", "light-headedness"),
+    ("Mirtazapine", "Remeron", "an antidepressant", "depression with poor sleep", "increased appetite"),
+    ("Hydroxyzine", "Atarax", "an antihistamine", "short-term anxiety", "a dry mouth"),
+    ("Propranolol", "Inderal", "a beta blocker", "physical symptoms of performance anxiety", "cold hands"),
+    ("Trazodone", "Desyrel", "an antidepressant", "insomnia", "morning grogginess"),
+    ("Clonazepam", "Klonopin", "a benzodiazepine", "panic disorder", "dependence with long-term use"),
+]
+HOTLINES = [
+    ("In the US, call or text 988 to reach the Suicide and Crisis Lifeline at any hour.", ["988", "us suicide lifeline number"],
+     ["who can I call in America if I am thinking about ending my life"]),
+    ("Text HOME to 741741 to reach a volunteer crisis counselor by text message.", ["741741", "crisis text line"],
+     ["can I text someone when I am in crisis instead of calling"]),
+    ("In the UK and Ireland, Samaritans answer calls on 116 123 day and night.", ["116 123", "samaritans"],
+     ["is there a phone line in Britain for people who are struggling"]),
+    ("LGBTQ young people can reach the Trevor Project on 1-866-488-7386.", ["trevor project", "866 488 7386"],
+     ["support line for queer teenagers"]),
+    ("In Australia, Lifeline can be reached on 13 11 14.", ["13 11 14", "lifeline australia"],
+     ["crisis phone number in australia"]),
+    ("In India, the Tele-MANAS mental health helpline is 14416.", ["14416", "tele-manas"],
+     ["mental health helpline number in india"]),
+]
+TECHNIQUES = [
+    ("Box breathing: breathe in for four counts, hold for four, breathe out for four and hold for four again.",
+     ["box breathing"], ["a breathing exercise where you count to four on every step"]),
+    ("The 5-4-3-2-1 grounding exercise: name five things you see, four you can touch, three you hear, two you smell and one you taste.",
+     ["5-4-3-2-1 grounding"], ["how do I calm down by paying attention to what is around me"]),
+    ("Progressive muscle relaxation means tensing each muscle group for five seconds and then letting it go, from the feet up.",
+     ["progressive muscle relaxation"], ["tensing and releasing my body to relax"]),
+    ("Cognitive restructuring: write the anxious thought down, list evidence for and against it, then write a more balanced thought.",
+     ["cognitive restructuring"], ["how can I challenge negative thoughts on paper"]),
+    ("Opposite action is a DBT skill: when an emotion urges you to withdraw, do the opposite and reach out.",
+     ["opposite action dbt"], ["what to do when sadness makes me want to hide from everyone"]),
+]
+FILLER = [
+    "Looking after your {topic} takes small, regular steps rather than big changes.",
+    "Many people notice their {topic} gets harder during stressful weeks, and that is normal.",
+    "Talking to someone you trust about {topic} can make it feel more manageable.",
+    "If {topic} is affecting your daily life, consider speaking with a doctor or counsellor.",
+    "Medication is only one option for {topic}; therapy and routines also help.",
+    "Some people find breathing exercises or a short walk useful for {topic}.",
+    "Keeping a journal about {topic} can help you spot patterns over time.",
+    "You can call a friend or a support line when {topic} feels overwhelming.",
+]
+TOPICS = ["sleep", "stress", "mood", "anxiety", "focus", "energy", "motivation", "relationships", "loneliness", "self-esteem"]
+
+
+def build_corpus(filler, seed=7):
+    rng = random.Random(seed)
+    documents, queries = [], []
+
+    for generic, brand, kind, use, side_effects in MEDICATIONS:
+        documents.append(f"{generic} ({brand}) is {kind} sometimes prescribed for {use}. "
+                         f"Common side effects include {side_effects}; talk to your prescriber before changing the dose.")
+        target = len(documents) - 1
+        queries += [(f"{generic.lower()} side effects", "keyword", target), (brand.lower(), "keyword", target),
+                    (f"is the medicine for {use} going to cause {side_effects.split(' and ')[0]}", "natural", target)]
+    for items in (HOTLINES, TECHNIQUES):
+        for text, keyword_queries, natural_queries in items:
+            documents.append(text)
+            queries += [(q, "keyword", len(documents) - 1) for q in keyword_queries]
+            queries += [(q, "natural", len(documents) - 1) for q in natural_queries]
+
+    for _ in range(filler):
+        documents.append(" ".join(rng.choice(FILLER).format(topic=rng.choice(TOPICS)) for _ in range(3)))
+    return documents, queries
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def main(args):
+    documents, queries = build_corpus(args.filler)
+    embedder = load_embedder(args.embedder, args.onnx_model_dir)
+
+    started = time.perf_counter()
+    vectors = embedder.encode(documents, batch_size=256)
+    embed_corpus_seconds = time.perf_counter() - started
+
+    with tempfile.TemporaryDirectory() as tmp:
+        client = chromadb.PersistentClient(path=os.path.join(tmp, "rag_data"))
+        chroma = ChromaRetriever(client.get_or_create_collection(name="bench"), client)
+        ids = [f"doc_{i}" for i in range(len(documents))]
+        batch = chroma.max_batch_size()
+        for start in range(0, len(documents), batch):
+            chroma.upsert(ids[start:start + batch], documents[start:start + batch],
+                          vectors[start:start + batch].tolist(), [{"source": "bench"}] * len(ids[start:start + batch]))
+        dense = NumpyRetriever(chroma, os.path.join(tmp, "numpy_index"))
+        hybrid = HybridRetriever(dense)
+
+        started = time.perf_counter()
+        query_vectors = embedder.encode([text for text, _, _ in queries], batch_size=256)
+        embed_query_ms = (time.perf_counter() - started) / len(queries) * 1000
+
+        results = {"documents": len(documents), "queries": len(queries), "k": args.k,
+                   "embedder": args.embedder, "index_build_seconds": round(hybrid.build_seconds, 3),
+                   "embed_corpus_seconds": round(embed_corpus_seconds, 2),
+                   "embed_query_ms": round(embed_query_ms, 3), "modes": {}}
+        for mode in ("dense", "lexical", "hybrid", "auto"):
+            hybrid.mode = mode
+            hybrid.paths = dict.fromkeys(hybrid.paths, 0)
+            per_kind, latencies = {}, []
+            for _ in range(args.repeat):
+                for (text, kind, target), vector in zip(queries, query_vectors):
+                    started = time.perf_counter()
+                    found = hybrid.query(vector.tolist(), args.k, text)
+                    latencies.append(time.perf_counter() - started)
+                    rank = found.index(documents[target]) + 1 if documents[target] in found else None
+                    stats = per_kind.setdefault(kind, {"hits": 0, "reciprocal_rank": 0.0, "n": 0})
+                    stats["n"] += 1
+                    stats["hits"] += rank is not None
+                    stats["reciprocal_rank"] += 1 / rank if rank else 0
+
+            results["modes"][mode] = {
+                **{f"{kind}_hit@{args.k}": round(stats["hits"] / stats["n"], 3) for kind, stats in per_kind.items()},
+                **{f"{kind}_mrr": round(stats["reciprocal_rank"] / stats["n"], 3) for kind, stats in per_kind.items()},
+                "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+                "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            }
+        # Which path the auto mode's queries took
+        results["auto_paths"] = dict(hybrid.paths)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filler", type=int, default=5000, help="generic chunks around the labelled ones")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5, help="passes over the queries when timing")
+    parser.add_argument("--embedder", default="sentence-transformers")
+    parser.add_argument("--onnx-model-dir", default="onnx_model")
+    main(parser.parse_args())
@@ -0,0 +1,114 @@
+# bench_ingest_jobs.py
+#
+# Chat latency while a bulk ingest runs: idle, during an in-process
+# /ingest/bulk request, and during a background /ingest/jobs job. Starts its
+# own uvicorn server with the stub chat model in a scratch directory.
+#
+#   cd chatbot/backend
+#   python benchmarks/bench_ingest_jobs.py --paragraphs 5000
+
+import argparse
+import asyncio
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else None
+
+
+def corpus(paragraphs, tag):
+    return "\n\n".join(
+        f"{tag} paragraph {i}. " + " ".join(f"Sentence {j} of section {i} describes a coping technique." for j in range(8))
+        for i in range(paragraphs)
+    )
+
+
+async def chat_load(client, stop, concurrency):
+    latencies = []
+
+    async def user(n):
+        i = 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            await client.post("/chat", json={"message": f"I feel stressed ({n}/{i})", "user_id": f"bench{n}"})
+            latencies.append(time.perf_counter() - started)
+            i += 1
+
+    await asyncio.gather(*(user(n) for n in range(concurrency)))
+    return latencies
+
+
+def summarize(latencies):
+    return {"requests": len(latencies),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1)}
+
+
+async def measure(client, concurrency, ingest=None, idle_seconds=5):
+    stop = asyncio.Event()
+    load = asyncio.create_task(chat_load(client, stop, concurrency))
+    started = time.perf_counter()
+    if ingest is None:
+        await asyncio.sleep(idle_seconds)
+    else:
+        await ingest()
+    stop.set()
+    result = summarize(await load)
+    result["seconds"] = round(time.perf_counter() - started, 1)
+    return result
+
+
+async def main(args):
+    workdir = tempfile.mkdtemp()
+    env = dict(os.environ, CHAT_MODEL_BACKEND="stub", STUB_MODEL_LATENCY_MS=str(args.model_latency_ms),
+               SUMMARY_ENABLED="0", INGEST_WORKERS=str(args.workers),
+               PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])))
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port)],
+                              cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=600) as client:
+            while True:
+                try:
+                    if (await client.get("/readyz")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.2)
+
+            async def inline():
+                await client.post("/ingest/bulk", json={"documents": [{"content": corpus(args.paragraphs, "inline"),
+                                                                       "source": "bench-inline"}]})
+
+            async def job():
+                job_id = (await client.post("/ingest/jobs", json={"documents": [{"content": corpus(args.paragraphs, "job"),
+                                                                                 "source": "bench-job"}]})).json()["job_id"]
+                while (await client.get(f"/ingest/jobs/{job_id}")).json()["status"] in ("queued", "running"):
+                    await asyncio.sleep(0.2)
+
+            print(f"idle            : {await measure(client, args.concurrency)}")
+            print(f"/ingest/bulk    : {await measure(client, args.concurrency, inline)}")
+            print(f"/ingest/jobs    : {await measure(client, args.concurrency, job)}")
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--paragraphs", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--model-latency-ms", type=float, default=50)
+    parser.add_argument("--port", type=int, default=8765)
+    asyncio.run(main(parser.parse_args()))
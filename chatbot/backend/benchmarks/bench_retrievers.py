@@ -0,0 +1,90 @@
+# bench_retrievers.py
+#
+# Query latency of ChromaRetriever versus NumpyRetriever on a synthetic,
+# topic-clustered corpus of normalized 384-d vectors, plus how often each
+# returns the exact top-k (Chroma's HNSW index is approximate).
+#
+#   cd chatbot/backend
+#   python benchmarks/bench_retrievers.py --docs 20000 --queries 500
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+
+from retrieval import ChromaRetriever, NumpyRetriever
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def time_queries(retriever, queries, k):
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        results.append(retriever.query(query, k))
+        latencies.append(time.perf_counter() - started)
+    return results, {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "queries_per_sec": round(len(queries) / sum(latencies), 1),
+    }
+
+
+def main(args):
+    rng = np.random.default_rng(7)
+    # Real sentence embeddings cluster by topic; queries land near a topic
+    topics = rng.standard_normal((args.topics, args.dim)).astype(np.float32)
+    vectors = topics[rng.integers(0, args.topics, args.docs)] + 0.6 * rng.standard_normal((args.docs, args.dim))
+    vectors = (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+    queries = topics[rng.integers(0, args.topics, args.queries)] + 0.6 * rng.standard_normal((args.queries, args.dim))
+    queries = [(q / np.linalg.norm(q)).tolist() for q in queries]
+    exact = [[f"doc_{i}" for i in np.argsort(-(vectors @ np.asarray(q, dtype=np.float32)))[:args.k]] for q in queries]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        client = chromadb.PersistentClient(path=os.path.join(tmp, "rag_data"))
+        chroma = ChromaRetriever(client.get_or_create_collection(name="bench"), client)
+        batch = chroma.max_batch_size()
+        for start in range(0, args.docs, batch):
+            ids = [f"doc_{i}" for i in range(start, min(start + batch, args.docs))]
+            chroma.upsert(ids, ids, vectors[start:start + batch].tolist(), [{"source": "bench"}] * len(ids))
+
+        started = time.perf_counter()
+        numpy_retriever = NumpyRetriever(chroma, os.path.join(tmp, "numpy_index"))
+        build_ms = (time.perf_counter() - started) * 1000
+
+        chroma_results, chroma_stats = time_queries(chroma, queries, args.k)
+        numpy_results, numpy_stats = time_queries(numpy_retriever, queries, args.k)
+
+        started = time.perf_counter()
+        NumpyRetriever(chroma, os.path.join(tmp, "numpy_index"))
+        mmap_ms = (time.perf_counter() - started) * 1000
+
+    def recall(results):
+        return sum(len(set(r) & set(e)) for r, e in zip(results, exact)) / (len(exact) * args.k)
+
+    same = sum(set(a) == set(b) for a, b in zip(chroma_results, numpy_results)) / len(queries)
+    print(f"docs={args.docs} dim={args.dim} k={args.k}")
+    print(f"chroma : {chroma_stats}  recall@{args.k} vs exact {recall(chroma_results):.3f}")
+    print(f"numpy  : {numpy_stats}  recall@{args.k} vs exact {recall(numpy_results):.3f}"
+          f"  (build {build_ms:.0f} ms, reopen from mmap {mmap_ms:.1f} ms)")
+    print(f"same top-{args.k} documents as chroma: {same:.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--topics", type=int, default=200)
+    parser.add_argument("-k", type=int, default=3)
+    main(parser.parse_args())
@@ -0,0 +1,307 @@
+# loadtest.py
+#
+# Offline load test for the chatbot API. Starts main.py under uvicorn in a
+# scratch directory with the stub chat model (and, by default, the stub
+# embedder), seeds the knowledge base, then runs closed-loop virtual users
+# sending a weighted mix of /chat, /chat/stream, /context/{user_id} and
+# /ingest requests. Prints one JSON document with throughput and latency
+# percentiles per endpoint (and mean time per chat stage from /metrics), so
+# results can be saved and compared between commits.
+#
+#   cd chatbot/backend
+#   python benchmarks/loadtest.py --users 1,8,32 --duration 20 --output before.json
+#   python benchmarks/loadtest.py --users 1,8,32 --duration 20 --compare before.json
+#   python benchmarks/loadtest.py --embedder sentence-transformers --env RETRIEVER_BACKEND=numpy
+#
+# --url points it at an already running server instead.
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TOPICS = ["stress", "sleep", "anxiety", "exams", "loneliness", "work", "panic", "motivation", "grief", "anger"]
+MESSAGES = [
+    "I can't stop worrying about {topic}, what can I do?",
+    "How do I deal with {topic} before bed?",
+    "Any breathing exercises that help with {topic}?",
+    "I've been feeling low because of {topic} lately.",
+    "What is a healthy way to talk to friends about {topic}?",
+]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else None
+
+
+def parse_pairs(text, cast=str):
+    pairs = {}
+    for item in filter(None, (part.strip() for part in text.split(","))):
+        key, _, value = item.partition("=")
+        pairs[key.strip()] = cast(value.strip())
+    return pairs
+
+
+def document(topic, n, paragraphs=6):
+    return "\n\n".join(
+        f"Guide to {topic}, part {n}.{p}. " + " ".join(
+            f"Technique {s} for {topic} is to notice the feeling, name it and take one small step." for s in range(6))
+        for p in range(paragraphs)
+    )
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- requests ---
+# Each sender returns True if the request succeeded
+
+async def send_chat(client, user):
+    response = await client.post("/chat", json={"message": random.choice(MESSAGES).format(topic=random.choice(TOPICS)),
+                                                "user_id": user, "name": user})
+    return response.status_code < 400
+
+
+async def send_chat_stream(client, user):
+    payload = {"message": random.choice(MESSAGES).format(topic=random.choice(TOPICS)), "user_id": user, "name": user}
+    async with client.stream("POST", "/chat/stream", json=payload) as response:
+        body = b"".join([chunk async for chunk in response.aiter_bytes()])
+    # Stream failures still answer 200, with an error event
+    return response.status_code < 400 and b"event: error" not in body
+
+
+async def send_context(client, user):
+    return (await client.get(f"/context/{user}")).status_code < 400
+
+
+async def send_ingest(client, user):
+    # A handful of sources per user, so most ingests re-ingest a known document
+    topic = random.choice(TOPICS)
+    response = await client.post("/ingest", json={"content": document(topic, random.randrange(1000)),
+                                                  "source": f"loadtest-{user}-{topic}"})
+    return response.status_code < 400
+
+
+SENDERS = {"chat": send_chat, "chat_stream": send_chat_stream, "context": send_context, "ingest": send_ingest}
+
+
+# --- load generation ---
+
+async def virtual_user(client, name, mix, think, stop, record):
+    endpoints, weights = list(mix), list(mix.values())
+    while not stop.is_set():
+        endpoint = random.choices(endpoints, weights)[0]
+        started = time.perf_counter()
+        try:
+            ok = await SENDERS[endpoint](client, name)
+        except httpx.HTTPError:
+            ok = False
+        record(endpoint, time.perf_counter() - started, ok)
+        if think:
+            await asyncio.sleep(random.expovariate(1 / think))
+
+
+def summarize(latencies, errors, seconds):
+    count = len(latencies) + errors
+    result = {"requests": count, "errors": errors, "throughput_rps": round(count / seconds, 2)}
+    if latencies:
+        result.update({f"p{pct}_ms": round(percentile(latencies, pct) * 1000, 2) for pct in (50, 90, 95, 99)})
+        result["max_ms"] = round(max(latencies) * 1000, 2)
+        result["mean_ms"] = round(sum(latencies) / len(latencies) * 1000, 2)
+    return result
+
+
+async def stage_totals(client):
+    """{stage: (sum_seconds, count)} from the chat_stage_seconds histogram."""
+    try:
+        text = (await client.get("/metrics")).text
+    except httpx.HTTPError:
+        return {}
+    totals = {}
+    for kind, stage, value in re.findall(r'^chat_stage_seconds_(sum|count)\{stage="([^"]+)"\} (\S+)$', text, re.M):
+        total = totals.setdefault(stage, [0.0, 0])
+        total[0 if kind == "sum" else 1] = float(value)
+    return totals
+
+
+async def run_level(client, users, args, mix):
+    samples = {endpoint: ([], [0]) for endpoint in mix}
+    measuring = False
+
+    def record(endpoint, seconds, ok):
+        if not measuring:
+            return
+        latencies, errors = samples[endpoint]
+        if ok:
+            latencies.append(seconds)
+        else:
+            errors[0] += 1
+
+    stop = asyncio.Event()
+    tasks = [asyncio.create_task(virtual_user(client, f"lt{users}-{n}", mix, args.think_ms / 1000, stop, record))
+             for n in range(users)]
+    await asyncio.sleep(args.warmup)
+
+    before = await stage_totals(client)
+    measuring = True
+    started = time.perf_counter()
+    await asyncio.sleep(args.duration)
+    measuring = False
+    elapsed = time.perf_counter() - started
+    after = await stage_totals(client)
+
+    stop.set()
+    await asyncio.gather(*tasks)
+
+    all_latencies = [value for latencies, _ in samples.values() for value in latencies]
+    all_errors = sum(errors[0] for _, errors in samples.values())
+    stages = {}
+    for stage, (total, count) in after.items():
+        previous_total, previous_count = before.get(stage, (0.0, 0))
+        if count > previous_count:
+            stages[stage] = {"calls": int(count - previous_count),
+                             "mean_ms": round((total - previous_total) / (count - previous_count) * 1000, 3)}
+
+    return {
+        "users": users,
+        "seconds": round(elapsed, 2),
+        "total": summarize(all_latencies, all_errors, elapsed),
+        "endpoints": {endpoint: summarize(latencies, errors[0], elapsed)
+                      for endpoint, (latencies, errors) in samples.items()},
+        "stages": stages,
+    }
+
+
+async def wait_ready(client, server, timeout=600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError("Server exited during startup")
+        try:
+            if (await client.get("/readyz")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Server did not become ready")
+
+
+def compare(baseline, results):
+    """Print p50/p99/throughput changes against a saved run to stderr."""
+    previous = {run["users"]: run for run in baseline["runs"]}
+    for run in results["runs"]:
+        old = previous.get(run["users"])
+        if old is None:
+            continue
+        for endpoint, stats in run["endpoints"].items():
+            old_stats = old["endpoints"].get(endpoint)
+            if not old_stats or "p50_ms" not in stats or "p50_ms" not in old_stats:
+                continue
+            changes = []
+            for key in ("p50_ms", "p99_ms", "throughput_rps"):
+                delta = (stats[key] - old_stats[key]) / old_stats[key] * 100 if old_stats[key] else 0
+                changes.append(f"{key} {old_stats[key]} -> {stats[key]} ({delta:+.1f}%)")
+            print(f"users={run['users']:<4} {endpoint:<12} " + ", ".join(changes), file=sys.stderr)
+
+
+async def main(args):
+    mix = parse_pairs(args.mix, float)
+    unknown = set(mix) - set(SENDERS)
+    if unknown:
+        raise SystemExit(f"Unknown endpoints in --mix: {', '.join(sorted(unknown))}")
+
+    server = workdir = None
+    base_url = args.url
+    if base_url is None:
+        workdir = tempfile.mkdtemp()
+        env = dict(os.environ, CHAT_MODEL_BACKEND="stub", STUB_MODEL_LATENCY_MS=str(args.model_latency_ms),
+                   EMBEDDING_BACKEND=args.embedder, STUB_EMBED_LATENCY_MS=str(args.embed_latency_ms),
+                   PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])))
+        env.update(parse_pairs(args.env))
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+                                   "--log-level", "warning"],
+                                  cwd=workdir, env=env, stdout=subprocess.DEVNULL,
+                                  stderr=None if args.server_logs else subprocess.DEVNULL)
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            await wait_ready(client, server)
+            if args.seed_documents:
+                await client.post("/ingest/bulk", json={"documents": [
+                    {"content": document(TOPICS[i % len(TOPICS)], i), "source": f"seed-{i}"}
+                    for i in range(args.seed_documents)]})
+
+            runs = []
+            for users in (int(level) for level in args.users.split(",")):
+                runs.append(await run_level(client, users, args, mix))
+                print(f"users={users}: {runs[-1]['total']}", file=sys.stderr)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if workdir is not None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "config": {"mix": mix, "duration": args.duration, "warmup": args.warmup, "think_ms": args.think_ms,
+                       "model_latency_ms": args.model_latency_ms, "embedder": args.embedder,
+                       "embed_latency_ms": args.embed_latency_ms, "env": parse_pairs(args.env), "url": args.url},
+        },
+        "runs": runs,
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds per level")
+    parser.add_argument("--warmup", type=float, default=3, help="unmeasured seconds per level")
+    parser.add_argument("--mix", default="chat=0.8,context=0.15,ingest=0.05",
+                        help="endpoint weights: chat, chat_stream, context, ingest")
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between a user's requests")
+    parser.add_argument("--model-latency-ms", type=float, default=800)
+    parser.add_argument("--embedder", default="stub", help="stub, sentence-transformers or onnx")
+    parser.add_argument("--embed-latency-ms", type=float, default=0, help="added per stub encode call")
+    parser.add_argument("--seed-documents", type=int, default=50)
+    parser.add_argument("--env", default="", help="extra server settings, e.g. RETRIEVER_BACKEND=numpy")
+    parser.add_argument("--url", help="use a running server instead of starting one")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--output", help="also write the JSON results here")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--server-logs", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,84 @@
+# chunking.py
+#
+# Splits documents into retrieval chunks along paragraph and sentence
+# boundaries, aiming for a token-size target with a small overlap, and hashes
+# each chunk so re-ingestion can skip the ones that have not changed.
+
+import hashlib
+import re
+
+from prompt_builder import estimate_tokens
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[A-Z0-9])")
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def split_sentences(paragraph, max_tokens):
+    """Sentences of `paragraph`; overlong ones are cut at word boundaries."""
+    sentences = []
+    for sentence in SENTENCE_END.split(paragraph):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        if estimate_tokens(sentence) <= max_tokens:
+            sentences.append(sentence)
+            continue
+        words, piece = sentence.split(), []
+        for word in words:
+            if piece and estimate_tokens(" ".join(piece + [word])) > max_tokens:
+                sentences.append(" ".join(piece))
+                piece = []
+            piece.append(word)
+        if piece:
+            sentences.append(" ".join(piece))
+    return sentences
+
+
+def chunk_document(text, target_tokens=200, overlap_tokens=40, min_chars=30):
+    """Chunks of about `target_tokens`, repeating up to `overlap_tokens` of
+    trailing sentences at the start of the next chunk.
+
+    A chunk is closed early at a paragraph break once it is at least half
+    full, so chunks tend to follow the document's own structure.
+    """
+    chunks = []
+    current, size, fresh = [], 0, 0
+
+    def close(overlap):
+        nonlocal current, size, fresh
+        chunk = " ".join(current)
+        if len(chunk) > min_chars:
+            chunks.append(chunk)
+        # Carry the tail sentences forward, unless that would repeat the whole chunk
+        carried, carried_size = [], 0
+        for sentence in reversed(current if overlap else []):
+            cost = estimate_tokens(sentence)
+            if carried_size + cost > overlap_tokens:
+                break
+            carried.insert(0, sentence)
+            carried_size += cost
+        if len(carried) == len(current):
+            carried, carried_size = [], 0
+        current, size, fresh = carried, carried_size, 0
+
+    for paragraph in PARAGRAPH_BREAK.split(text):
+        # Single line breaks (lists, headings) also end a sentence
+        sentences = [sentence for line in paragraph.splitlines()
+                     for sentence in split_sentences(" ".join(line.split()), target_tokens)]
+        for sentence in sentences:
+            cost = estimate_tokens(sentence)
+            if fresh and size + cost > target_tokens:
+                close(overlap=True)
+            current.append(sentence)
+            size += cost
+            fresh += 1
+        if fresh and size >= target_tokens // 2:
+            close(overlap=False)
+
+    if fresh:
+        close(overlap=False)
+    return chunks
@@ -0,0 +1,309 @@
+# conversation_store.py
+#
+# SQLite-backed message store shared by all chat requests. Reads use a small
+# pool of WAL-mode connections; writes go through one background thread that
+# commits everything queued while its previous transaction ran (group commit).
+# Old messages can be moved to a separate archive database (attached as
+# `archive`) so the hot table stays small; reads page across both.
+
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from itertools import takewhile
+import queue
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT,
+    sender TEXT,
+    message TEXT,
+    timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_messages_user_id ON messages(user_id, id);
+CREATE TABLE IF NOT EXISTS summaries (
+    user_id TEXT PRIMARY KEY,
+    summary TEXT,
+    through_id INTEGER,
+    updated TEXT
+);
+"""
+
+ARCHIVE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS archive.messages (
+    id INTEGER PRIMARY KEY,
+    user_id TEXT,
+    sender TEXT,
+    message TEXT,
+    timestamp TEXT
+);
+CREATE INDEX IF NOT EXISTS archive.idx_messages_user_id ON messages(user_id, id);
+"""
+
+COLUMNS = ("id", "sender", "message", "timestamp")
+
+
+class ConversationStore:
+    def __init__(self, path, pool_size=4, batch_max=256, archive_path=None):
+        self.path = path
+        self.batch_max = batch_max
+        self.archive_path = archive_path
+
+        setup = self._connect()
+        # Only takes effect on a new file; enable_incremental_vacuum() converts older ones
+        setup.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        setup.execute("PRAGMA journal_mode=WAL")
+        setup.executescript(SCHEMA)
+        if archive_path:
+            setup.execute("PRAGMA archive.journal_mode=WAL")
+            setup.executescript(ARCHIVE_SCHEMA)
+        setup.close()
+
+        self._pool = queue.Queue()
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+
+        self.transactions = 0
+        self.rows_written = 0
+        self._archive_lock = threading.Lock()
+
+        self._writes = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="conversation-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        if self.archive_path:
+            conn.execute("ATTACH DATABASE ? AS archive", (self.archive_path,))
+            conn.execute("PRAGMA archive.synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled read connection."""
+        conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    # --- writes ---
+
+    def append(self, user_id, messages):
+        """Queue `(sender, message)` pairs for `user_id`.
+
+        Returns a Future that resolves once the rows are committed, so callers
+        can wait (or `asyncio.wrap_future` it) without holding a thread.
+        """
+        done = Future()
+        timestamp = datetime.utcnow().isoformat()
+        rows = [(user_id, sender, message, timestamp) for sender, message in messages]
+        self._writes.put((rows, done))
+        return done
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            item = self._writes.get()
+            if item is None:
+                break
+            pending = [item]
+            stopping = False
+            # Gather whatever queued up while the last transaction was running
+            while len(pending) < self.batch_max:
+                try:
+                    item = self._writes.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                pending.append(item)
+
+            self._commit(conn, pending)
+            if stopping:
+                break
+        conn.close()
+
+    def _commit(self, conn, pending):
+        rows = [row for batch, _ in pending for row in batch]
+        try:
+            with conn:
+                conn.executemany(
+                    "INSERT INTO messages (user_id, sender, message, timestamp) VALUES (?, ?, ?, ?)", rows
+                )
+        except Exception as e:
+            for _, done in pending:
+                done.set_exception(e)
+            return
+        self.transactions += 1
+        self.rows_written += len(rows)
+        for _, done in pending:
+            done.set_result(len(rows))
+
+    # --- reads ---
+
+    def get_history(self, user_id, limit=5):
+        """Last `limit` (sender, message) pairs for `user_id`, oldest first."""
+        with self.connection() as conn:
+            rows = conn.execute(
+                "SELECT sender, message FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT ?", (user_id, limit)
+            ).fetchall()
+        return list(reversed(rows))
+
+    def get_summary(self, user_id):
+        """Rolling summary of `user_id`'s older turns and the last message id it covers."""
+        with self.connection() as conn:
+            row = conn.execute("SELECT summary, through_id FROM summaries WHERE user_id = ?", (user_id,)).fetchone()
+        return row if row else ("", 0)
+
+    def unsummarized(self, user_id, after_id, keep_recent, limit=50):
+        """Messages newer than `after_id` that have left the recent window, as (id, sender, message)."""
+        with self.connection() as conn:
+            return conn.execute("""
+                SELECT id, sender, message FROM messages
+                WHERE user_id = ? AND id > ? AND id < COALESCE((
+                    SELECT MIN(id) FROM (
+                        SELECT id FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT ?
+                    )
+                ), 0)
+                ORDER BY id LIMIT ?
+            """, (user_id, after_id, user_id, keep_recent, limit)).fetchall()
+
+    def save_summary(self, user_id, summary, through_id):
+        with self.connection() as conn, conn:
+            conn.execute("""
+                INSERT INTO summaries (user_id, summary, through_id, updated) VALUES (?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    summary = excluded.summary, through_id = excluded.through_id, updated = excluded.updated
+            """, (user_id, summary, through_id, datetime.utcnow().isoformat()))
+
+    # --- paging and export ---
+    # Archiving moves the oldest ids first, so every archived id is below every
+    # id still in the hot table and one id cursor spans both. Both tables are
+    # read in one statement (one snapshot), so a retention run can't move rows
+    # out from under a read that has only finished one of them.
+
+    def _select(self, op, order):
+        select = f"SELECT id, sender, message, timestamp FROM {{}} WHERE user_id = ? AND id {op} ?"
+        tables = ["archive.messages", "messages"] if self.archive_path else ["messages"]
+        return " UNION ALL ".join(map(select.format, tables)) + f" ORDER BY id {order} LIMIT ?", len(tables)
+
+    def page(self, user_id, before_id=None, after_id=None, limit=50):
+        """Up to `limit` messages of `user_id` as dicts, oldest first.
+
+        With `after_id`, the first messages after it; otherwise the latest
+        messages before `before_id` (or the latest overall). Keyset paging on
+        the (user_id, id) index, so deep pages cost the same as the first.
+        """
+        if after_id is not None:
+            (sql, tables), cursor = self._select(">", "ASC"), after_id
+        else:
+            (sql, tables), cursor = self._select("<", "DESC"), before_id if before_id is not None else 2 ** 63 - 1
+        with self.connection() as conn:
+            rows = conn.execute(sql, (user_id, cursor) * tables + (limit,)).fetchall()
+        if after_id is None:
+            rows.reverse()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def iter_chunks(self, user_id, chunk_size=1000):
+        """Yield all of `user_id`'s messages oldest first, as lists of up to
+        `chunk_size` dicts, so memory stays flat however long the history is.
+        A pooled connection is only held while a chunk is being read."""
+        sql, tables = self._select(">", "ASC")
+        cursor = 0
+        while True:
+            with self.connection() as conn:
+                rows = conn.execute(sql, (user_id, cursor) * tables + (chunk_size,)).fetchall()
+            if rows:
+                cursor = rows[-1][0]
+                yield [dict(zip(COLUMNS, row)) for row in rows]
+            if len(rows) < chunk_size:
+                break
+
+    # --- retention ---
+
+    def archive(self, older_than_days, batch_size=2000, compact=True):
+        """Move messages older than `older_than_days` out of the hot table.
+
+        Rows go to the archive database when one is configured and are
+        deleted otherwise (their gist survives in the rolling summaries).
+        Works oldest-id-first in short transactions so live chat writes
+        interleave; `compact` then returns the freed pages to the filesystem
+        and truncates the WAL. A file created before incremental vacuum was
+        enabled can't give pages back until enable_incremental_vacuum() has
+        run; the result then reports `vacuum_needed`. Concurrent calls run
+        one after the other.
+        """
+        with self._archive_lock:
+            return self._archive(older_than_days, batch_size, compact)
+
+    def _archive(self, older_than_days, batch_size, compact):
+        cutoff = (datetime.utcnow() - timedelta(days=older_than_days)).isoformat()
+        moved = 0
+        conn = self._connect()
+        # Take the write lock up front rather than upgrading mid-transaction
+        conn.isolation_level = "IMMEDIATE"
+        try:
+            while True:
+                # Ids follow write time, so the old rows are a prefix of the table
+                rows = conn.execute("SELECT id, timestamp FROM messages ORDER BY id LIMIT ?", (batch_size,)).fetchall()
+                old = [row_id for row_id, _ in takewhile(lambda row: row[1] is None or row[1] < cutoff, rows)]
+                if not old:
+                    break
+                with conn:
+                    if self.archive_path:
+                        # OR IGNORE: a batch copied before an interrupted delete is simply copied again
+                        conn.execute("""
+                            INSERT OR IGNORE INTO archive.messages (id, user_id, sender, message, timestamp)
+                            SELECT id, user_id, sender, message, timestamp FROM messages WHERE id BETWEEN ? AND ?
+                        """, (old[0], old[-1]))
+                    conn.execute("DELETE FROM messages WHERE id BETWEEN ? AND ?", (old[0], old[-1]))
+                moved += len(old)
+                if len(old) < len(rows) or len(rows) < batch_size:
+                    break
+
+            # A full VACUUM would rewrite the file under the write lock for
+            # longer than chat writes wait, so it is left to the offline step
+            vacuum_needed = conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2
+            if compact and moved:
+                if not vacuum_needed:
+                    # executescript steps the pragma to completion; execute() frees a single page
+                    conn.executescript("PRAGMA incremental_vacuum;")
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+            remaining = conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        finally:
+            conn.close()
+        result = {"cutoff": cutoff, "archived" if self.archive_path else "deleted": moved, "hot_rows": remaining}
+        if vacuum_needed:
+            result["vacuum_needed"] = True
+        return result
+
+    def enable_incremental_vacuum(self):
+        """Switch an older database file to incremental vacuum with a one-off
+        full VACUUM. It rewrites the whole file while holding the write lock,
+        so run it while the server is stopped."""
+        conn = self._connect()
+        try:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                conn.execute("VACUUM")
+        finally:
+            conn.close()
+
+    def close(self):
+        self._writes.put(None)
+        self._writer.join()
+        while not self._pool.empty():
+            self._pool.get().close()
+
+    def stats(self):
+        return {
+            "write_queue": self._writes.qsize(),
+            "transactions": self.transactions,
+            "rows_written": self.rows_written,
+        }
@@ -0,0 +1,27 @@
+# embedders.py
+#
+# Loads the configured embedding backend. Shared by the API process and the
+# ingestion worker processes so both produce the same vectors.
+
+import os
+
+
+def load_embedder(backend="sentence-transformers", onnx_model_dir="onnx_model", threads=None):
+    if backend == "service":
+        # Ingestion workers embedding through the shared embedding_service.py process
+        from embedding_service import RemoteEmbedder, ServiceClient
+        return RemoteEmbedder(ServiceClient(os.environ["EMBEDDING_SERVICE_SOCKET"]))
+
+    if backend == "stub":
+        from stubs import StubEmbedder
+        return StubEmbedder(latency_ms=float(os.getenv("STUB_EMBED_LATENCY_MS", "0")))
+
+    if backend == "onnx":
+        from onnx_embedder import OnnxEmbedder
+        return OnnxEmbedder(onnx_model_dir, threads=threads)
+
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer('all-MiniLM-L6-v2')
@@ -0,0 +1,101 @@
+# embedding_batcher.py
+#
+# Collects query embeddings requested by concurrent chats for a short window
+# and encodes them as one batch, which is far cheaper per query than
+# encoding batches of one.
+
+import asyncio
+import time
+
+
+class EmbeddingBatcher:
+    """Micro-batches `encode(texts) -> vectors` calls across concurrent callers.
+
+    The first queued text opens a window of `window_ms`; everything queued
+    before it closes (or before `max_batch_size` is reached) is encoded in a
+    single call on `run_blocking`. A window of 0 encodes every text on its own.
+    """
+
+    def __init__(self, encode, run_blocking, window_ms=5.0, max_batch_size=64):
+        self._encode = encode
+        self._run_blocking = run_blocking
+        self.window = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._pending = []
+        self._timer = None
+        # The loop only keeps weak references to tasks; a collected batch
+        # would leave its callers waiting forever
+        self._tasks = set()
+
+        self.batches = 0
+        self.items = 0
+        self.max_seen = 0
+        self.in_flight = 0
+        self.encode_seconds = 0.0
+        self.wait_seconds = 0.0
+        self.size_counts = {}
+
+    async def encode(self, text):
+        """Return the embedding of `text` as a list of floats."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future, time.perf_counter()))
+
+        if self.window <= 0 or len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[:self.max_batch_size], self._pending[self.max_batch_size:]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        texts = [text for text, _, _ in batch]
+        started = time.perf_counter()
+        self.in_flight += 1
+        try:
+            vectors = await self._run_blocking(self._encode, texts)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self.in_flight -= 1
+
+        finished = time.perf_counter()
+        self.batches += 1
+        self.items += len(batch)
+        self.max_seen = max(self.max_seen, len(batch))
+        self.encode_seconds += finished - started
+        self.wait_seconds += sum(started - queued for _, _, queued in batch)
+        self.size_counts[len(batch)] = self.size_counts.get(len(batch), 0) + 1
+
+        for (_, future, _), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector.tolist() if hasattr(vector, "tolist") else list(vector))
+
+    def stats(self):
+        return {
+            "queue_depth": len(self._pending),
+            "batches_in_flight": self.in_flight,
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size,
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": round(self.items / self.batches, 2) if self.batches else 0,
+            "largest_batch": self.max_seen,
+            "batch_sizes": dict(sorted(self.size_counts.items())),
+            "mean_encode_ms": round(self.encode_seconds / self.batches * 1000, 2) if self.batches else 0,
+            "mean_wait_ms": round(self.wait_seconds / self.items * 1000, 2) if self.items else 0,
+        }
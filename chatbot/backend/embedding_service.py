@@ -0,0 +1,287 @@
+# embedding_service.py
+#
+# One process that owns the embedding model and the retriever and serves them
+# to every API worker over a Unix socket, so `uvicorn --workers N` keeps a
+# single model copy and a single Chroma client. Single-text encodes from all
+# workers are micro-batched together (see embedding_batcher.py).
+#
+#   cd chatbot/backend
+#   python embedding_service.py --socket /tmp/wellmind-embed.sock &
+#   EMBEDDING_SERVICE_SOCKET=/tmp/wellmind-embed.sock uvicorn main:app --workers 4
+#
+# The service reads EMBEDDING_BACKEND, ONNX_MODEL_DIR, RETRIEVER_BACKEND,
+# NUMPY_INDEX_DIR and RETRIEVAL_MODE like main.py does. Frames are
+# [header length][payload length][JSON header][raw payload]; vectors travel as
+# float32 bytes.
+
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import functools
+import json
+import os
+import queue
+import socket
+import struct
+import time
+
+import numpy as np
+
+from embedding_batcher import EmbeddingBatcher
+
+FRAME = struct.Struct("!II")
+
+
+def pack(header, payload=b""):
+    head = json.dumps(header).encode("utf-8")
+    return FRAME.pack(len(head), len(payload)) + head + payload
+
+
+def pack_vectors(vectors):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    return list(vectors.shape), vectors.tobytes()
+
+
+def unpack_vectors(shape, payload):
+    return np.frombuffer(payload, dtype=np.float32).reshape(shape)
+
+
+# --- service side ---
+
+class EmbeddingService:
+    def __init__(self, embedder, retriever, threads=4, window_ms=5.0, max_batch_size=64):
+        self.embedder = embedder
+        self.retriever = retriever
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="embedding-service")
+        self.batcher = EmbeddingBatcher(self._encode, self._run_blocking, window_ms, max_batch_size)
+        self.connections = 0
+        self.requests = 0
+
+    async def _run_blocking(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args, **kwargs))
+
+    def _encode(self, texts):
+        return self.embedder.encode(texts, batch_size=len(texts))
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                try:
+                    head_size, payload_size = FRAME.unpack(await reader.readexactly(FRAME.size))
+                    header = json.loads(await reader.readexactly(head_size))
+                    payload = await reader.readexactly(payload_size) if payload_size else b""
+                except asyncio.IncompleteReadError:
+                    break
+                self.requests += 1
+                try:
+                    response = await self.dispatch(header, payload)
+                except Exception as e:
+                    response = ({"error": f"{type(e).__name__}: {e}"}, b"")
+                writer.write(pack(*response))
+                await writer.drain()
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def dispatch(self, header, payload):
+        op = header["op"]
+        if op == "encode":
+            texts = header["texts"]
+            if len(texts) == 1:
+                vectors = [await self.batcher.encode(texts[0])]
+            else:
+                vectors = await self._run_blocking(self._encode, texts)
+            shape, data = pack_vectors(vectors)
+            return {"shape": shape}, data
+        if op == "query":
+            vector = unpack_vectors(header["shape"], payload)
+            documents = await self._run_blocking(self.retriever.query, vector.tolist(), header["k"], header.get("text"))
+            return {"documents": documents}, b""
+        if op == "upsert":
+            embeddings = unpack_vectors(header["shape"], payload).tolist()
+            await self._run_blocking(self.retriever.upsert, header["ids"], header["documents"], embeddings,
+                                     header["metadatas"])
+            return {}, b""
+        if op == "source_hashes":
+            return {"hashes": await self._run_blocking(self.retriever.source_hashes, header["source"])}, b""
+        if op == "delete":
+            await self._run_blocking(self.retriever.delete, header["ids"])
+            return {}, b""
+        if op == "flush":
+            await self._run_blocking(self.retriever.flush)
+            return {}, b""
+        if op == "count":
+            return {"count": await self._run_blocking(self.retriever.count)}, b""
+        if op == "max_batch_size":
+            return {"max_batch_size": self.retriever.max_batch_size()}, b""
+        if op == "stats":
+            retriever_stats = self.retriever.stats() if hasattr(self.retriever, "stats") else None
+            return {"connections": self.connections, "requests": self.requests,
+                    "batcher": self.batcher.stats(), "retriever": retriever_stats}, b""
+        raise ValueError(f"Unknown op {op!r}")
+
+
+def load_service(threads, window_ms, max_batch_size):
+    from embedders import load_embedder
+    from retrieval import ChromaRetriever, HybridRetriever, NumpyRetriever
+    import chromadb
+
+    embedder = load_embedder(os.getenv("EMBEDDING_BACKEND", "sentence-transformers"),
+                             os.getenv("ONNX_MODEL_DIR", "onnx_model"))
+    chroma_client = chromadb.PersistentClient(path="./rag_data")
+    retriever = ChromaRetriever(chroma_client.get_or_create_collection(name="mental_health_docs"), chroma_client)
+    if os.getenv("RETRIEVER_BACKEND", "chroma") == "numpy":
+        retriever = NumpyRetriever(retriever, os.getenv("NUMPY_INDEX_DIR", "./numpy_index"))
+    if os.getenv("RETRIEVAL_MODE", "dense") != "dense":
+        retriever = HybridRetriever(retriever, os.getenv("RETRIEVAL_MODE"))
+    return EmbeddingService(embedder, retriever, threads, window_ms, max_batch_size)
+
+
+async def serve(path, service):
+    if os.path.exists(path):
+        os.unlink(path)
+    server = await asyncio.start_unix_server(service.handle, path=path)
+    print(f"Embedding service listening on {path}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+# --- API worker side ---
+
+class ServiceClient:
+    """Blocking request/response client with a pool of socket connections
+    (one per concurrent caller thread)."""
+
+    def __init__(self, path, timeout=60):
+        self.path = path
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.path)
+        return sock
+
+    def wait_ready(self, timeout=60):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self._idle.put(self._connect())
+                return
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.2)
+
+    def _exchange(self, sock, header, payload):
+        try:
+            sock.sendall(pack(header, payload))
+            head_size, payload_size = FRAME.unpack(self._read(sock, FRAME.size))
+            response = json.loads(self._read(sock, head_size))
+            return response, self._read(sock, payload_size) if payload_size else b""
+        except BaseException:
+            sock.close()
+            raise
+
+    @staticmethod
+    def _read(sock, size):
+        data = bytearray()
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("Embedding service closed the connection")
+            data += chunk
+        return bytes(data)
+
+    def call(self, header, payload=b""):
+        # Every op is idempotent, so a pooled connection that went stale (the
+        # service restarted) is retried once on a fresh one
+        try:
+            sock, pooled = self._idle.get_nowait(), True
+        except queue.Empty:
+            sock, pooled = self._connect(), False
+        try:
+            response, data = self._exchange(sock, header, payload)
+        except ConnectionError:
+            if not pooled:
+                raise
+            sock = self._connect()
+            response, data = self._exchange(sock, header, payload)
+        self._idle.put(sock)
+        if "error" in response:
+            raise RuntimeError(f"Embedding service: {response['error']}")
+        return response, data
+
+
+class RemoteEmbedder:
+    """SentenceTransformer-compatible `encode` backed by the service."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        response, data = self.client.call({"op": "encode", "texts": texts})
+        vectors = unpack_vectors(response["shape"], data)
+        return vectors[0] if single else vectors
+
+
+class RemoteRetriever:
+    """Retriever interface (see retrieval.py) backed by the service."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def max_batch_size(self):
+        return self.client.call({"op": "max_batch_size"})[0]["max_batch_size"]
+
+    def query(self, vector, k=3, text=None):
+        shape, data = pack_vectors(vector)
+        return self.client.call({"op": "query", "shape": shape, "k": k, "text": text}, data)[0]["documents"]
+
+    def upsert(self, ids, documents, embeddings, metadatas):
+        shape, data = pack_vectors(embeddings)
+        self.client.call({"op": "upsert", "ids": ids, "documents": documents, "metadatas": metadatas,
+                          "shape": shape}, data)
+
+    def source_hashes(self, source):
+        return self.client.call({"op": "source_hashes", "source": source})[0]["hashes"]
+
+    def delete(self, ids):
+        if ids:
+            self.client.call({"op": "delete", "ids": list(ids)})
+
+    def flush(self):
+        self.client.call({"op": "flush"})
+
+    def count(self):
+        return self.client.call({"op": "count"})[0]["count"]
+
+    def stats(self):
+        """The service's retriever stats (None if it has none), shaped like a
+        local retriever's; the rest of the service's stats are left out."""
+        return self.client.call({"op": "stats"})[0]["retriever"]
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--socket", default=os.getenv("EMBEDDING_SERVICE_SOCKET", "/tmp/wellmind-embed.sock"))
+    parser.add_argument("--threads", type=int, default=int(os.getenv("BLOCKING_WORKERS", "4")))
+    parser.add_argument("--window-ms", type=float, default=float(os.getenv("EMBED_BATCH_WINDOW_MS", "5")))
+    parser.add_argument("--max-batch-size", type=int, default=int(os.getenv("EMBED_MAX_BATCH_SIZE", "64")))
+    args = parser.parse_args()
+
+    service = load_service(args.threads, args.window_ms, args.max_batch_size)
+    try:
+        asyncio.run(serve(args.socket, service))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,176 @@
+# ingest_jobs.py
+#
+# Background ingestion jobs. Chunking and embedding run in a separate
+# (spawned, low-priority) process pool so bulk uploads do not compete with
+# live chat traffic for the API process's CPU; the API process only diffs
+# chunk hashes and writes results to the retriever.
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from collections import OrderedDict
+import logging
+import multiprocessing
+import os
+import time
+import uuid
+
+from chunking import chunk_document
+
+# Same logger as main.py, so job failures show up in the server log
+logger = logging.getLogger("uvicorn.error")
+
+# --- worker process side ---
+
+_worker_embedder = None
+
+
+def _init_worker(backend, onnx_model_dir, threads, niceness):
+    global _worker_embedder
+    if niceness:
+        os.nice(niceness)
+    from embedders import load_embedder
+    _worker_embedder = load_embedder(backend, onnx_model_dir, threads=threads)
+
+
+def _chunk(content, target_tokens, overlap_tokens):
+    return chunk_document(content, target_tokens, overlap_tokens)
+
+
+def _embed(texts):
+    return _worker_embedder.encode(texts, batch_size=len(texts))
+
+
+# --- API process side ---
+
+class IngestJobs:
+    """Runs submitted ingestion jobs and tracks their progress.
+
+    `plan(source, chunks)` returns (new_items, stale_ids, total) as in
+    main.plan_source, `write(items, embeddings)` stores one embedded batch and
+    `finish(stale_ids)` deletes stale chunks and flushes the retriever; all
+    three run through `run_blocking`.
+    """
+
+    def __init__(self, plan, write, finish, run_blocking, workers=1, batch_size=256,
+                 max_running=1, keep=100, target_tokens=200, overlap_tokens=40,
+                 backend="sentence-transformers", onnx_model_dir="onnx_model", worker_threads=1, niceness=10):
+        self._plan = plan
+        self._write = write
+        self._finish = finish
+        self._run_blocking = run_blocking
+        self.workers = workers
+        self.batch_size = batch_size
+        self.target_tokens = target_tokens
+        self.overlap_tokens = overlap_tokens
+        self.keep = keep
+        self._pool_args = (backend, onnx_model_dir, worker_threads, niceness)
+        self._pool = None
+        self._running = asyncio.Semaphore(max_running)
+        self._jobs = OrderedDict()
+        self._tasks = set()
+
+    def _executor(self):
+        # Spawned, not forked: the API process holds threads, SQLite and model state
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_worker, initargs=self._pool_args)
+        return self._pool
+
+    def submit(self, documents):
+        contents = {}
+        for doc in documents:
+            source = doc.get("source", "unknown")
+            contents[source] = "\n\n".join(filter(None, [contents.get(source), doc.get("content") or ""]))
+
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": "queued",
+            "sources": list(contents),
+            "sources_done": 0,
+            "chunks": 0,
+            "to_embed": 0,
+            "embedded": 0,
+            "deleted": 0,
+            "errors": [],
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "chunks_per_sec": None,
+        }
+        self._jobs[job["job_id"]] = job
+        while len(self._jobs) > self.keep:
+            oldest = next(iter(self._jobs.values()))
+            if oldest["status"] in ("queued", "running"):
+                break
+            self._jobs.popitem(last=False)
+
+        task = asyncio.create_task(self._run(job, contents))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def list(self):
+        return list(reversed(self._jobs.values()))
+
+    async def _run(self, job, contents):
+        async with self._running:
+            loop = asyncio.get_running_loop()
+            job["status"] = "running"
+            job["started_at"] = time.time()
+            started = time.perf_counter()
+
+            for source, content in contents.items():
+                pending = {}
+                try:
+                    chunks = await loop.run_in_executor(self._executor(), _chunk, content,
+                                                        self.target_tokens, self.overlap_tokens)
+                    new_items, stale_ids, total = await self._run_blocking(self._plan, source, chunks)
+                    job["chunks"] += total
+                    job["to_embed"] += len(new_items)
+
+                    # Keep every worker busy: up to `workers` batches in flight
+                    batches = [new_items[i:i + self.batch_size] for i in range(0, len(new_items), self.batch_size)]
+                    for batch in batches:
+                        if len(pending) >= self.workers:
+                            await self._store_first(pending, job, started)
+                        future = loop.run_in_executor(self._executor(), _embed, [text for _, text, _ in batch])
+                        pending[future] = batch
+                    while pending:
+                        await self._store_first(pending, job, started)
+
+                    await self._run_blocking(self._finish, stale_ids)
+                    job["deleted"] += len(stale_ids)
+                except Exception as e:
+                    job["errors"].append({"source": source, "error": str(e)})
+                    logger.exception(f"Ingest job {job['job_id']} failed on {source}")
+                    # Don't leave this source's other batches embedding for nothing
+                    for future in pending:
+                        future.cancel()
+                    await asyncio.gather(*pending, return_exceptions=True)
+                job["sources_done"] += 1
+
+            elapsed = time.perf_counter() - started
+            job["chunks_per_sec"] = round(job["embedded"] / elapsed, 1) if elapsed > 0 else None
+            job["finished_at"] = time.time()
+            if not job["errors"]:
+                job["status"] = "completed"
+            elif len(job["errors"]) < len(contents):
+                job["status"] = "completed_with_errors"
+            else:
+                job["status"] = "failed"
+
+    async def _store_first(self, pending, job, started):
+        future = next(iter(pending))
+        batch = pending.pop(future)
+        embeddings = await future
+        await self._run_blocking(self._write, batch, embeddings)
+        job["embedded"] += len(batch)
+        elapsed = time.perf_counter() - started
+        job["chunks_per_sec"] = round(job["embedded"] / elapsed, 1) if elapsed > 0 else None
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,114 @@
+# lexical_index.py
+#
+# In-memory BM25 inverted index over the ingested chunks. It catches exact
+# terms the embedding model blurs (medication names, hotline numbers) and
+# answers short keyword queries without a vector search.
+
+import heapq
+import math
+import re
+import threading
+
+TOKEN = re.compile(r"\w+")
+STOPWORDS = frozenset("""
+a an and are as at be been but by can could do does for from had has have how i if in into is it its
+me my of on or our so that the their them then there these they this to was we were what when where which
+who why will with would you your
+""".split())
+
+
+def tokenize(text):
+    """Lowercased word tokens without stopwords; a plural "s" is dropped so
+    "attacks" matches "attack". Numbers are kept as-is."""
+    tokens = []
+    for token in TOKEN.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss") and not token.isdigit():
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over documents keyed by id, with incremental add/delete."""
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._postings = {}      # term -> {slot: term frequency}
+        self._terms = {}         # slot -> {term: term frequency}
+        self._lengths = {}       # slot -> document length in tokens
+        self._documents = {}     # slot -> document text
+        self._slots = {}         # id -> slot
+        self._next_slot = 0
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def add(self, ids, documents):
+        """Index documents, replacing any already stored under the same id."""
+        with self._lock:
+            for doc_id, document in zip(ids, documents):
+                self._remove(doc_id)
+                slot = self._next_slot
+                self._next_slot += 1
+                counts = {}
+                for token in tokenize(document):
+                    counts[token] = counts.get(token, 0) + 1
+                for term, frequency in counts.items():
+                    self._postings.setdefault(term, {})[slot] = frequency
+                self._terms[slot] = counts
+                self._lengths[slot] = sum(counts.values())
+                self._documents[slot] = document
+                self._slots[doc_id] = slot
+                self._total_length += self._lengths[slot]
+
+    def delete(self, ids):
+        with self._lock:
+            for doc_id in ids:
+                self._remove(doc_id)
+
+    def _remove(self, doc_id):
+        slot = self._slots.pop(doc_id, None)
+        if slot is None:
+            return
+        for term in self._terms.pop(slot):
+            postings = self._postings[term]
+            del postings[slot]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(slot)
+        del self._documents[slot]
+
+    def idf(self, term):
+        df = len(self._postings.get(term, ()))
+        return math.log(1 + (len(self._slots) - df + 0.5) / (df + 0.5))
+
+    def document_frequency(self, term):
+        return len(self._postings.get(term, ()))
+
+    def search(self, text, k=3):
+        """Top `k` (score, document) pairs for `text`, best first."""
+        terms = set(tokenize(text))
+        with self._lock:
+            if not self._slots or not terms:
+                return []
+            average_length = self._total_length / len(self._slots)
+            scores = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = self.idf(term)
+                for slot, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[slot] / average_length)
+                    scores[slot] = scores.get(slot, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+            top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+            return [(score, self._documents[slot]) for slot, score in top]
+
+    def stats(self):
+        return {"documents": len(self._slots), "terms": len(self._postings),
+                "average_length": round(self._total_length / len(self._slots), 1) if self._slots else 0}
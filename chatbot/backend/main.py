@@ -2,24 +2,104 @@
 
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
-import google.generativeai as genai
-from sentence_transformers import SentenceTransformer
-import chromadb
+from admission import AdmissionQueue, CircuitBreaker, Overloaded, is_transient, retry_with_backoff
+from chunking import chunk_document, chunk_hash
+from conversation_store import ConversationStore
+from embedders import load_embedder
+from embedding_batcher import EmbeddingBatcher
+from ingest_jobs import IngestJobs
+import metrics
+from prompt_builder import PromptBuilder
+from retrieval import ChromaRetriever, HybridRetriever, NumpyRetriever
+from semantic_cache import SemanticCache
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+import asyncio
+import functools
+import json
+import logging
 import os
-import sqlite3
-from datetime import datetime
+import time
 
 # --- ENVIRONMENT ---
 load_dotenv()
+# "gemini" (default) or "stub" for offline runs without an API key
+CHAT_MODEL_BACKEND = os.getenv("CHAT_MODEL_BACKEND", "gemini")
 GOOGLE_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GOOGLE_API_KEY:
+# "sentence-transformers" (default), "onnx", or "stub" for offline runs
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "sentence-transformers")
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", "onnx_model")
+# "chroma" (default) or "numpy"
+RETRIEVER_BACKEND = os.getenv("RETRIEVER_BACKEND", "chroma")
+# "dense" (default), "hybrid", "lexical" or "auto": adds a BM25 index (see retrieval.HybridRetriever)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "dense")
+# When set, the embedding model and retriever live in one embedding_service.py
+# process shared by all uvicorn workers, and the settings above apply to it
+EMBEDDING_SERVICE_SOCKET = os.getenv("EMBEDDING_SERVICE_SOCKET")
+if CHAT_MODEL_BACKEND == "gemini" and not GOOGLE_API_KEY:
     raise ValueError("GEMINI_API_KEY not found in environment variables")
 
-genai.configure(api_key=GOOGLE_API_KEY)
+logger = logging.getLogger("uvicorn.error")
+
+# OTEL_ENABLED=1 adds OpenTelemetry spans per chat stage (OTLP export if
+# OTEL_EXPORTER_OTLP_ENDPOINT is set); Prometheus metrics are always on
+if os.getenv("OTEL_ENABLED", "0") == "1":
+    metrics.setup_tracing(endpoint=os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"))
+
+# --- LIFECYCLE ---
+# Models and databases load in the background after the server starts, so
+# /healthz answers immediately and /readyz flips once everything is warm.
+startup = {"ready": False, "error": None, "timings_ms": {}}
+background_tasks = set()
+
+@asynccontextmanager
+async def lifespan(app):
+    task = asyncio.create_task(start_up())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    yield
+    ingest_jobs.shutdown()
+    if store is not None:
+        store.close()
+    executor.shutdown(wait=False)
+
+async def start_up():
+    started = time.perf_counter()
+    try:
+        await run_blocking(load_resources)
+        await run_blocking(warm_up)
+    except Exception as e:
+        startup["error"] = str(e)
+        logger.exception("Startup failed")
+        return
+    startup["ready"] = True
+    logger.info(f"Chatbot ready in {(time.perf_counter() - started) * 1000:.0f} ms")
+    if RETENTION_DAYS > 0:
+        task = asyncio.create_task(retention_loop())
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+@contextmanager
+def timed_stage(stage):
+    started = time.perf_counter()
+    yield
+    elapsed = (time.perf_counter() - started) * 1000
+    startup["timings_ms"][stage] = round(elapsed, 1)
+    logger.info(f"Startup stage {stage}: {elapsed:.0f} ms")
 
 # --- FASTAPI APP ---
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+@app.middleware("http")
+async def require_ready(request: Request, call_next):
+    if not startup["ready"] and request.url.path not in ("/healthz", "/readyz", "/metrics"):
+        return JSONResponse({"detail": "Service is starting up"}, status_code=503, headers={"Retry-After": "5"})
+    return await call_next(request)
+
+# Added last so it is the outermost middleware: preflights are answered and
+# the 503s above carry CORS headers, so browsers see them as 503s
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -28,41 +108,291 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# --- GEMINI ---
-chat_model = genai.GenerativeModel("gemini-2.5-flash")
+@app.get("/healthz")
+def liveness():
+    if startup["error"]:
+        return JSONResponse({"status": "failed", "error": startup["error"]}, status_code=503)
+    return {"status": "alive"}
+
+@app.get("/readyz")
+def readiness():
+    body = {"ready": startup["ready"], "timings_ms": startup["timings_ms"]}
+    return body if startup["ready"] else JSONResponse(body, status_code=503)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+# --- CONCURRENCY ---
+# Encoding, Chroma and SQLite reads are blocking, so they run on a bounded
+# executor; CHAT_MAX_CONCURRENCY caps how many chats are in flight at once.
+CHAT_MAX_CONCURRENCY = int(os.getenv("CHAT_MAX_CONCURRENCY", "32"))
+BLOCKING_WORKERS = int(os.getenv("BLOCKING_WORKERS", "8"))
+executor = ThreadPoolExecutor(max_workers=BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+# --- ADMISSION CONTROL ---
+# At most CHAT_MAX_QUEUE chats wait for a slot. Beyond that, or once a chat
+# has waited past its CHAT_DEADLINE_SECONDS, it is shed with a Retry-After
+# hint. Transient model errors are retried with jittered backoff, and after
+# CIRCUIT_FAILURE_THRESHOLD consecutive failures the model is not called for
+# CIRCUIT_RESET_SECONDS; meanwhile chats get FALLBACK_REPLY.
+CHAT_MAX_QUEUE = int(os.getenv("CHAT_MAX_QUEUE", "64"))
+CHAT_DEADLINE_SECONDS = float(os.getenv("CHAT_DEADLINE_SECONDS", "30"))
+MODEL_RETRY_ATTEMPTS = int(os.getenv("MODEL_RETRY_ATTEMPTS", "3"))
+MODEL_RETRY_BASE_MS = float(os.getenv("MODEL_RETRY_BASE_MS", "250"))
+admission = AdmissionQueue(CHAT_MAX_CONCURRENCY, CHAT_MAX_QUEUE)
+model_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+    reset_seconds=float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+)
+FALLBACK_REPLY = (
+    "I'm sorry, I'm having trouble responding right now. Please try again in a few minutes. "
+    "If you are in crisis or thinking about harming yourself, please contact your local "
+    "emergency number or a crisis helpline right away."
+)
+
+def shed_response(e):
+    metrics.shed_total.inc(reason=e.reason)
+    # A full queue is the client's cue to back off (429); waiting out the deadline means we are saturated (503)
+    status_code = 429 if e.reason == "queue_full" else 503
+    return JSONResponse({"error": "Chat service is busy, please retry shortly", "reason": e.reason,
+                         "retry_after": e.retry_after},
+                        status_code=status_code, headers={"Retry-After": str(e.retry_after)})
 
-# --- EMBEDDING MODEL ---
-embedder = SentenceTransformer('all-MiniLM-L6-v2')
+async def run_blocking(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
 
-# --- CHROMA DB SETUP (✅ Optimal) ---
-chroma_client = chromadb.PersistentClient(path="./rag_data")
-collection = chroma_client.get_or_create_collection(name="mental_health_docs")
+# --- LAZILY LOADED RESOURCES ---
+# Set by load_resources() during startup
+chat_model = None
+embedder = None
+chroma_client = None
+collection = None
+retriever = None
+store = None
 
-# --- SQLITE DB SETUP ---
 DB_PATH = "conversations.db"
-conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-cursor = conn.cursor()
-cursor.execute("""
-CREATE TABLE IF NOT EXISTS messages (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id TEXT,
-    sender TEXT,
-    message TEXT,
-    timestamp TEXT
+# Messages older than RETENTION_DAYS move to RETENTION_ARCHIVE_PATH (or are
+# deleted if it is empty) every RETENTION_INTERVAL_HOURS; 0 days disables it.
+# The archive is only attached (and read by history and export) when
+# retention is on or RETENTION_ARCHIVE_PATH is set explicitly.
+RETENTION_DAYS = float(os.getenv("RETENTION_DAYS", "0"))
+RETENTION_ARCHIVE_PATH = os.getenv("RETENTION_ARCHIVE_PATH",
+                                   "conversations_archive.db" if RETENTION_DAYS > 0 else "")
+RETENTION_INTERVAL_HOURS = float(os.getenv("RETENTION_INTERVAL_HOURS", "24"))
+
+def load_resources():
+    global chat_model, embedder, chroma_client, collection, retriever, store
+
+    # --- GEMINI ---
+    with timed_stage("chat_model"):
+        if CHAT_MODEL_BACKEND == "stub":
+            from stubs import StubChatModel
+            chat_model = StubChatModel(latency_ms=float(os.getenv("STUB_MODEL_LATENCY_MS", "0")),
+                                       failure_rate=float(os.getenv("STUB_MODEL_FAILURE_RATE", "0")))
+        else:
+            import google.generativeai as genai
+            genai.configure(api_key=GOOGLE_API_KEY)
+            chat_model = genai.GenerativeModel("gemini-2.5-flash")
+
+    if EMBEDDING_SERVICE_SOCKET:
+        with timed_stage("embedding_service"):
+            from embedding_service import RemoteEmbedder, RemoteRetriever, ServiceClient
+            client = ServiceClient(EMBEDDING_SERVICE_SOCKET)
+            client.wait_ready(timeout=float(os.getenv("EMBEDDING_SERVICE_WAIT_SECONDS", "120")))
+            embedder = RemoteEmbedder(client)
+            retriever = RemoteRetriever(client)
+    else:
+        load_local_retrieval()
+
+    # --- SQLITE DB SETUP ---
+    with timed_stage("conversation_store"):
+        store = ConversationStore(DB_PATH, pool_size=int(os.getenv("DB_POOL_SIZE", "4")),
+                                  archive_path=RETENTION_ARCHIVE_PATH or None)
+
+def load_local_retrieval():
+    global embedder, chroma_client, collection, retriever
+
+    # --- EMBEDDING MODEL ---
+    # EMBEDDING_BACKEND=onnx uses the int8 ONNX export (see onnx_embedder.py)
+    with timed_stage("embedder"):
+        embedder = load_embedder(EMBEDDING_BACKEND, ONNX_MODEL_DIR)
+
+    # --- CHROMA DB SETUP (✅ Optimal) ---
+    with timed_stage("chroma"):
+        import chromadb
+        chroma_client = chromadb.PersistentClient(path="./rag_data")
+        collection = chroma_client.get_or_create_collection(name="mental_health_docs")
+
+    # RETRIEVER_BACKEND=numpy serves queries from a memory-mapped matrix (see retrieval.py)
+    with timed_stage("retriever"):
+        retriever = ChromaRetriever(collection, chroma_client)
+        if RETRIEVER_BACKEND == "numpy":
+            retriever = NumpyRetriever(retriever, os.getenv("NUMPY_INDEX_DIR", "./numpy_index"))
+
+    if RETRIEVAL_MODE != "dense":
+        with timed_stage("lexical_index"):
+            retriever = HybridRetriever(retriever, RETRIEVAL_MODE)
+
+def warm_up():
+    """Pay the first-call costs (kernel selection, index loading) before real traffic."""
+    with timed_stage("warmup_encode"):
+        vector = encode_batch(["How can I feel calmer today?"])[0].tolist()
+    with timed_stage("warmup_query"):
+        retriever.query(vector, 1)
+    with timed_stage("warmup_history"):
+        store.get_history("__warmup__", 1)
+
+def encode_batch(texts):
+    return embedder.encode(texts, batch_size=len(texts))
+
+# Concurrent chat queries are encoded together; EMBED_BATCH_WINDOW_MS=0 disables batching
+embed_batcher = EmbeddingBatcher(
+    encode_batch, run_blocking,
+    window_ms=float(os.getenv("EMBED_BATCH_WINDOW_MS", "5")),
+    max_batch_size=int(os.getenv("EMBED_MAX_BATCH_SIZE", "64"))
 )
-""")
-conn.commit()
 
-def store_message(user_id, sender, message):
-    cursor.execute("INSERT INTO messages (user_id, sender, message, timestamp) VALUES (?, ?, ?, ?)",
-                   (user_id, sender, message, datetime.utcnow().isoformat()))
-    conn.commit()
+# --- CONVERSATIONS ---
+def get_history(user_id, limit=5):
+    return store.get_history(user_id, limit)
+
+def format_history(rows):
+    return "\n".join([f"{sender}: {msg}" for sender, msg in rows])
 
 def get_context(user_id, limit=5):
-    cursor.execute("SELECT sender, message FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT ?", (user_id, limit))
-    rows = cursor.fetchall()
-    context = "\n".join([f"{sender}: {msg}" for sender, msg in reversed(rows)])
-    return context
+    return format_history(get_history(user_id, limit))
+
+async def retention_loop():
+    while True:
+        await run_retention()
+        await asyncio.sleep(RETENTION_INTERVAL_HOURS * 3600)
+
+async def run_retention():
+    started = time.perf_counter()
+    try:
+        result = await run_blocking(store.archive, RETENTION_DAYS)
+    except Exception as e:
+        logger.exception("Retention run failed")
+        return {"error": str(e)}
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    logger.info(f"Retention run: {result}")
+    if result.get("vacuum_needed"):
+        logger.warning(f"{DB_PATH} can't return freed pages until it is converted: run "
+                       "ConversationStore.enable_incremental_vacuum() while the server is stopped")
+    return result
+
+# --- PROMPT ASSEMBLY ---
+# Each prompt section gets its own (estimated) token budget; turns older than
+# the last HISTORY_LIMIT messages are folded into a per-user rolling summary.
+HISTORY_LIMIT = int(os.getenv("HISTORY_LIMIT", "5"))
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "1") == "1"
+SUMMARY_TRIGGER_MESSAGES = int(os.getenv("SUMMARY_TRIGGER_MESSAGES", "6"))
+prompt_builder = PromptBuilder(
+    summary_budget=int(os.getenv("PROMPT_BUDGET_SUMMARY", "300")),
+    history_budget=int(os.getenv("PROMPT_BUDGET_HISTORY", "600")),
+    knowledge_budget=int(os.getenv("PROMPT_BUDGET_KNOWLEDGE", "900")),
+    message_budget=int(os.getenv("PROMPT_BUDGET_MESSAGE", "400"))
+)
+summarizing = set()
+
+# --- SEMANTIC CACHE ---
+# Optional: serves stored replies for near-duplicate opening questions,
+# skipping retrieval and generation. Only turns without history are cached:
+# a reply to a follow-up depends on the conversation, not just the question.
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "0") == "1"
+semantic_cache = SemanticCache(
+    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+    ttl_seconds=float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600")),
+    max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+) if SEMANTIC_CACHE_ENABLED else None
+
+def cacheable(history):
+    return semantic_cache is not None and not history
+
+def cached_reply(query_embedding, history, user_name):
+    if not cacheable(history):
+        return None
+    with metrics.stage("cache_lookup"):
+        return semantic_cache.lookup(query_embedding, namespace=user_name)
+
+def remember_reply(query_embedding, history, user_name, bot_reply, cost_seconds):
+    if cacheable(history) and bot_reply:
+        semantic_cache.store(query_embedding, bot_reply, namespace=user_name, cost_seconds=cost_seconds)
+
+# --- INGESTION ---
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "256"))
+
+CHUNK_TARGET_TOKENS = int(os.getenv("CHUNK_TARGET_TOKENS", "200"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+
+def plan_source(source, chunks):
+    """Diff a document's chunks against what is stored for `source`.
+
+    Chunk ids are `{source}_{hash}`, so an unchanged chunk keeps its id and
+    embedding; only new chunks are embedded and vanished ones are deleted.
+    """
+    planned = {}
+    for position, chunk in enumerate(chunks):
+        digest = chunk_hash(chunk)
+        planned.setdefault(digest, (f"{source}_{digest[:16]}", chunk, {"source": source, "hash": digest, "position": position}))
+
+    stored = retriever.source_hashes(source)
+    stored_hashes = {digest for digest in stored.values() if digest}
+    new_items = [item for digest, item in planned.items() if digest not in stored_hashes]
+    stale_ids = [chunk_id for chunk_id, digest in stored.items() if digest not in planned]
+    return new_items, stale_ids, len(planned)
+
+def write_chunks(items, embeddings):
+    retriever.upsert(
+        [chunk_id for chunk_id, _, _ in items],
+        [text for _, text, _ in items],
+        embeddings.tolist() if hasattr(embeddings, "tolist") else embeddings,
+        [metadata for _, _, metadata in items]
+    )
+
+def finish_source(stale_ids):
+    retriever.delete(stale_ids)
+    retriever.flush()
+
+def ingest_documents(documents, batch_size=INGEST_BATCH_SIZE):
+    """Incrementally (re-)ingest documents, embedding only changed chunks.
+
+    Documents sharing a source are ingested as one. New chunks from all
+    documents are pooled into fixed-size embed/upsert batches.
+    """
+    batch_size = max(1, min(batch_size, retriever.max_batch_size()))
+    contents = {}
+    for doc in documents:
+        source = doc.get("source", "unknown")
+        contents[source] = "\n\n".join(filter(None, [contents.get(source), doc.get("content") or ""]))
+
+    started = time.perf_counter()
+    items, stale, per_source = [], [], {}
+    for source, content in contents.items():
+        chunks = chunk_document(content, CHUNK_TARGET_TOKENS, CHUNK_OVERLAP_TOKENS)
+        new_items, stale_ids, total = plan_source(source, chunks)
+        items.extend(new_items)
+        stale.extend(stale_ids)
+        per_source[source] = {"chunks": total, "embedded": len(new_items),
+                              "unchanged": total - len(new_items), "deleted": len(stale_ids)}
+
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        write_chunks(batch, embedder.encode([text for _, text, _ in batch], batch_size=len(batch)))
+    finish_source(stale)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "sources": per_source,
+        "chunks": sum(stats["chunks"] for stats in per_source.values()),
+        "embedded": len(items),
+        "deleted": len(stale),
+        "batch_size": batch_size,
+        "seconds": round(elapsed, 3),
+        "chunks_per_sec": round(len(items) / elapsed, 1) if elapsed > 0 else None
+    }
 
 @app.post("/ingest")
 async def ingest_document(request: Request):
@@ -73,20 +403,60 @@ async def ingest_document(request: Request):
     if not content:
         return {"error": "No content provided"}
 
-    # Chunk the content (simplified here)
-    chunks = [chunk.strip() for chunk in content.split('\n') if len(chunk.strip()) > 30]
+    stats = await run_blocking(ingest_documents, [{"content": content, "source": source}],
+                               int(data.get("batch_size", INGEST_BATCH_SIZE)))
 
-    embeddings = embedder.encode(chunks).tolist()
+    return {"status": f"Ingested {stats['chunks']} chunks from '{source}'", **stats}
 
-    for i, chunk in enumerate(chunks):
-        collection.add(
-            documents=[chunk],
-            embeddings=[embeddings[i]],
-            ids=[f"{source}_{i}"],
-            metadatas=[{"source": source}]
-        )
+@app.post("/ingest/bulk")
+async def ingest_bulk(request: Request):
+    """Ingest many documents per request: {"documents": [{"content", "source"}], "batch_size"}"""
+    data = await request.json()
+    documents = [doc for doc in data.get("documents") or [] if doc.get("content")]
+
+    if not documents:
+        return {"error": "No documents provided"}
+
+    stats = await run_blocking(ingest_documents, documents, int(data.get("batch_size", INGEST_BATCH_SIZE)))
+
+    return {"status": f"Ingested {stats['chunks']} chunks from {len(stats['sources'])} documents", **stats}
+
+# Large uploads: chunking and embedding run in a separate process pool and the
+# request returns a job id straight away
+ingest_jobs = IngestJobs(
+    plan_source, write_chunks, finish_source, run_blocking,
+    workers=int(os.getenv("INGEST_WORKERS", "1")),
+    batch_size=INGEST_BATCH_SIZE,
+    target_tokens=CHUNK_TARGET_TOKENS,
+    overlap_tokens=CHUNK_OVERLAP_TOKENS,
+    backend="service" if EMBEDDING_SERVICE_SOCKET else EMBEDDING_BACKEND,
+    onnx_model_dir=ONNX_MODEL_DIR,
+    worker_threads=int(os.getenv("INGEST_WORKER_THREADS", "1"))
+)
+
+@app.post("/ingest/jobs", status_code=202)
+async def submit_ingest_job(request: Request):
+    """Queue {"documents": [{"content", "source"}]} (or a single content/source) for background ingestion."""
+    data = await request.json()
+    documents = data.get("documents") or [{"content": data.get("content"), "source": data.get("source", "unknown")}]
+    documents = [doc for doc in documents if doc.get("content")]
 
-    return {"status": f"Ingested {len(chunks)} chunks from '{source}'"}
+    if not documents:
+        return JSONResponse({"error": "No documents provided"}, status_code=400)
+
+    job = ingest_jobs.submit(documents)
+    return {"job_id": job["job_id"], "status": job["status"]}
+
+@app.get("/ingest/jobs")
+def list_ingest_jobs():
+    return {"jobs": ingest_jobs.list()}
+
+@app.get("/ingest/jobs/{job_id}")
+def get_ingest_job(job_id: str):
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found"}, status_code=404)
+    return job
 
 @app.post("/chat")
 async def chat_with_bot(request: Request):
@@ -98,51 +468,263 @@ async def chat_with_bot(request: Request):
     if not user_message:
         return {"response": "Please enter a message."}
 
+    deadline = time.monotonic() + CHAT_DEADLINE_SECONDS
     try:
-        # Embed user query
-        query_embedding = embedder.encode([user_message])[0].tolist()
+        with metrics.request("chat") as outcome:
+            try:
+                async with admission.slot(deadline):
+                    query_embedding, history, summary = await load_turn(user_message, user_id)
+                    bot_reply = cached_reply(query_embedding, history, user_name)
 
-        # Retrieve top 3 relevant docs
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=3
-        )
+                    if bot_reply is not None:
+                        outcome["outcome"] = "cache_hit"
+                    else:
+                        started = time.perf_counter()
+                        prompt = await build_prompt(user_message, user_name, query_embedding, history, summary)
+
+                        # Get response without blocking the event loop
+                        with metrics.stage("generate"):
+                            response = await generate(prompt, deadline)
+                            if response is None:
+                                outcome["outcome"] = "fallback"
+                                return {"response": FALLBACK_REPLY, "fallback": True}
+                            bot_reply = response.text
+                        remember_reply(query_embedding, history, user_name, bot_reply, time.perf_counter() - started)
+
+                    await save_exchange(user_id, user_message, bot_reply)
+
+                    return {"response": bot_reply}
+            except Overloaded as e:
+                outcome["outcome"] = "shed"
+                return shed_response(e)
+    except Exception as e:
+        stage = getattr(e, "chat_stage", "unknown")
+        logger.exception(f"Chat failed in stage {stage}")
+        return JSONResponse({"error": "Chat request failed", "stage": stage}, status_code=500)
+
+@app.post("/chat/stream")
+async def chat_stream(request: Request):
+    """Same as /chat, but forwards reply chunks as Server-Sent Events.
+
+    Each chunk is sent as `data: {"token": ...}`; the stream ends with an
+    `event: done` carrying the full reply, or `event: error`. A request that
+    cannot even be queued gets a 429 before the stream starts.
+    """
+    data = await request.json()
+    user_message = data.get("message")
+    user_id = data.get("user_id", "anonymous")
+    user_name = data.get("name", "Friend")
+    deadline = time.monotonic() + CHAT_DEADLINE_SECONDS
 
-        # Format retrieved docs
-        docs = results.get("documents", [[]])[0]
-        rag_context = "\n\n".join(docs)
+    try:
+        admission.check()
+    except Overloaded as e:
+        return shed_response(e)
 
-        # Retrieve conversation context
-        chat_history = get_context(user_id)
+    async def events():
+        if not user_message:
+            yield sse_event({"response": "Please enter a message."}, "done")
+            return
 
-        # Build prompt
-        prompt = f"""
-You are a compassionate mental health assistant. The user's name is {user_name}.
+        try:
+            with metrics.request("chat_stream") as outcome:
+                try:
+                    async with admission.slot(deadline):
+                        query_embedding, history, summary = await load_turn(user_message, user_id)
+                        bot_reply = cached_reply(query_embedding, history, user_name)
 
-Conversation history:
-{chat_history}
+                        if bot_reply is not None:
+                            outcome["outcome"] = "cache_hit"
+                            yield sse_event({"token": bot_reply})
+                        else:
+                            started = time.perf_counter()
+                            prompt = await build_prompt(user_message, user_name, query_embedding, history, summary)
 
-Relevant knowledge:
-{rag_context}
+                            # Includes time spent waiting on the client between chunks
+                            parts = []
+                            with metrics.stage("generate"):
+                                stream = await generate(prompt, deadline, stream=True)
+                                if stream is None:
+                                    outcome["outcome"] = "fallback"
+                                    yield sse_event({"token": FALLBACK_REPLY})
+                                    yield sse_event({"response": FALLBACK_REPLY, "fallback": True}, "done")
+                                    return
+                                async for chunk in stream:
+                                    if chunk.text:
+                                        parts.append(chunk.text)
+                                        yield sse_event({"token": chunk.text})
 
-User's message:
-{user_message}
+                            bot_reply = "".join(parts)
+                            remember_reply(query_embedding, history, user_name, bot_reply, time.perf_counter() - started)
 
-Respond empathetically and informatively using the above context and knowledge.
-"""
+                        await save_exchange(user_id, user_message, bot_reply)
+                        yield sse_event({"response": bot_reply}, "done")
+                except Overloaded as e:
+                    outcome["outcome"] = "shed"
+                    metrics.shed_total.inc(reason=e.reason)
+                    yield sse_event({"error": "Chat service is busy, please retry shortly", "reason": e.reason,
+                                     "retry_after": e.retry_after}, "error")
+        except Exception as e:
+            stage = getattr(e, "chat_stage", "unknown")
+            logger.exception(f"Chat stream failed in stage {stage}")
+            yield sse_event({"error": "Chat request failed", "stage": stage}, "error")
 
-        # Get response
-        response = chat_model.generate_content(prompt)
-        bot_reply = response.text
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
-        # Store conversation
-        store_message(user_id, "user", user_message)
-        store_message(user_id, "bot", bot_reply)
+async def generate(prompt, deadline, stream=False):
+    """Call the chat model, retrying transient errors until `deadline`.
 
-        return {"response": bot_reply}
+    Returns None when the reply should be FALLBACK_REPLY: the circuit is
+    open, or the model kept failing or timed out. For streams only opening
+    the stream is retried; chunks already sent cannot be taken back.
+    """
+    if not model_breaker.allow():
+        metrics.fallback_total.inc(reason="circuit_open")
+        return None
+    budget = deadline - time.monotonic()
+    try:
+        response = await retry_with_backoff(
+            lambda: chat_model.generate_content_async(prompt, stream=stream), deadline,
+            attempts=MODEL_RETRY_ATTEMPTS, base_delay=MODEL_RETRY_BASE_MS / 1000,
+            on_retry=lambda e: metrics.model_retries_total.inc()
+        )
     except Exception as e:
-        return {"response": f"Error: {str(e)}"}
+        if not is_transient(e):
+            # The model answered; this request was the problem
+            model_breaker.record_success()
+            raise
+        if isinstance(e, asyncio.TimeoutError) and budget < CHAT_DEADLINE_SECONDS / 2:
+            # Most of the deadline went on queueing, not on the model
+            model_breaker.release()
+            metrics.fallback_total.inc(reason="deadline")
+            return None
+        model_breaker.record_failure()
+        logger.warning(f"Chat model unavailable, serving fallback: {e!r}")
+        metrics.fallback_total.inc(reason="model_error")
+        return None
+    model_breaker.record_success()
+    return response
+
+def sse_event(payload, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload)}\n\n"
+
+async def load_turn(user_message, user_id):
+    # Embed user query (batched with other in-flight chats) while loading history
+    query_embedding, history, (summary, _) = await asyncio.gather(
+        metrics.timed("embed", embed_batcher.encode(user_message)),
+        metrics.timed("history", run_blocking(get_history, user_id, HISTORY_LIMIT)),
+        metrics.timed("summary", run_blocking(store.get_summary, user_id))
+    )
+    return query_embedding, history, summary
+
+async def build_prompt(user_message, user_name, query_embedding, history, summary=""):
+    # Retrieve top 3 relevant docs
+    with metrics.stage("retrieve"):
+        docs = await run_blocking(retriever.query, query_embedding, 3, user_message)
+
+    with metrics.stage("prompt"):
+        return prompt_builder.build(user_name, user_message, history, docs, summary)
+
+async def save_exchange(user_id, user_message, bot_reply):
+    # Both messages are committed in one transaction by the store's writer
+    with metrics.stage("store"):
+        await asyncio.wrap_future(store.append(user_id, [("user", user_message), ("bot", bot_reply)]))
+    schedule_summary(user_id)
+
+def schedule_summary(user_id):
+    if not SUMMARY_ENABLED or user_id in summarizing:
+        return
+    summarizing.add(user_id)
+    task = asyncio.create_task(refresh_summary(user_id))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def refresh_summary(user_id):
+    """Fold turns that have left the recent-history window into the user's summary."""
+    try:
+        summary, through_id = await run_blocking(store.get_summary, user_id)
+        rows = await run_blocking(store.unsummarized, user_id, through_id, HISTORY_LIMIT)
+        if len(rows) < SUMMARY_TRIGGER_MESSAGES:
+            return
+
+        # Background work should not add load to a model that is already failing
+        if model_breaker.state != "closed":
+            return
+
+        prompt = prompt_builder.summary_prompt(summary, [(sender, message) for _, sender, message in rows])
+        with metrics.stage("summarize"):
+            response = await chat_model.generate_content_async(prompt)
+        await run_blocking(store.save_summary, user_id, response.text.strip(), rows[-1][0])
+    except Exception:
+        logger.exception(f"Summary update failed for {user_id}")
+    finally:
+        summarizing.discard(user_id)
+
+# Point-in-time gauges read from the components when /metrics is scraped
+metrics.registry.gauge("embed_batcher_queue_depth", "Queries waiting for the next embedding batch",
+                       fn=lambda: embed_batcher.stats()["queue_depth"])
+metrics.registry.gauge("conversation_store_write_queue", "Message batches waiting for the SQLite writer",
+                       fn=lambda: store.stats()["write_queue"] if store is not None else None)
+metrics.registry.gauge("chat_admission_queue_depth", "Chats waiting for a slot",
+                       fn=lambda: admission.waiting)
+metrics.registry.gauge("chat_admission_active", "Chats holding a slot",
+                       fn=lambda: admission.active)
+metrics.registry.gauge("chat_model_circuit_open", "1 while the chat model circuit breaker is open or half-open",
+                       fn=lambda: int(model_breaker.state != "closed"))
+metrics.registry.gauge("semantic_cache_hit_rate", "Semantic cache hits / lookups since startup",
+                       fn=lambda: semantic_cache.stats()["hit_rate"] if semantic_cache is not None else None)
 
 @app.get("/context/{user_id}")
 def get_user_context(user_id: str):
     return {"context": get_context(user_id)}
+
+HISTORY_PAGE_MAX = int(os.getenv("HISTORY_PAGE_MAX", "200"))
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+
+@app.get("/history/{user_id}")
+async def get_user_history(user_id: str, before: int | None = None, after: int | None = None, limit: int = 50):
+    """One page of messages, oldest first. Follow `next_before` to go back in
+    time, or pass `after` (e.g. the last id seen) to fetch newer messages."""
+    limit = max(1, min(limit, HISTORY_PAGE_MAX))
+    messages = await run_blocking(store.page, user_id, before, after, limit)
+    full = len(messages) == limit
+    return {
+        "messages": messages,
+        "next_before": messages[0]["id"] if messages and full and after is None else None,
+        "next_after": messages[-1]["id"] if messages and full and after is not None else None,
+    }
+
+@app.get("/history/{user_id}/export")
+def export_user_history(user_id: str):
+    """Every message of the user (archived ones included) as NDJSON, streamed in chunks."""
+    lines = ("".join(json.dumps(row) + "\n" for row in chunk) for chunk in store.iter_chunks(user_id, EXPORT_CHUNK_SIZE))
+    filename = "".join(c if c.isalnum() or c in "-_." else "_" for c in user_id)
+    return StreamingResponse(lines, media_type="application/x-ndjson",
+                             headers={"Content-Disposition": f'attachment; filename="{filename}-messages.ndjson"'})
+
+@app.post("/history/retention")
+async def run_history_retention():
+    if RETENTION_DAYS <= 0:
+        return JSONResponse({"error": "Retention is disabled (RETENTION_DAYS=0)"}, status_code=400)
+    return await run_retention()
+
+@app.get("/stats/embedding")
+def get_embedding_stats():
+    return embed_batcher.stats()
+
+@app.get("/stats/retrieval")
+async def get_retrieval_stats():
+    stats = await run_blocking(retriever.stats) if hasattr(retriever, "stats") else None
+    return stats if stats is not None else {"mode": "dense"}
+
+@app.get("/stats/admission")
+def get_admission_stats():
+    return {**admission.stats(), "circuit": model_breaker.stats()}
+
+@app.get("/stats/cache")
+def get_cache_stats():
+    if semantic_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **semantic_cache.stats()}
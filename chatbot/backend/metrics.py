@@ -0,0 +1,226 @@
+# metrics.py
+#
+# Minimal in-process metrics for the chat pipeline, exported in Prometheus
+# text format, plus optional OpenTelemetry spans (OTEL_ENABLED=1).
+#
+# Recording a stage costs two perf_counter() calls and a few dict updates
+# under a lock, so it is cheap enough to leave on in production.
+
+from bisect import bisect_left
+from contextlib import contextmanager
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _label_text(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_label_text(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), fn=None):
+        super().__init__(name, help, labelnames)
+        self._fn = fn
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def render(self):
+        if self._fn is not None:
+            try:
+                value = self._fn()
+            except Exception:
+                return []
+            if value is None:
+                return []
+            return self.header() + [f"{self.name} {value}"]
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_label_text(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self._values.items()]
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_label_text(self.labelnames, key, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# --- chat pipeline ---
+
+registry = Registry()
+stage_seconds = registry.histogram("chat_stage_seconds", "Time spent in each chat pipeline stage", ["stage"])
+stage_errors = registry.counter("chat_stage_errors_total", "Exceptions raised per chat pipeline stage", ["stage"])
+stage_in_flight = registry.gauge("chat_stage_in_flight", "Chat pipeline stages currently executing", ["stage"])
+request_seconds = registry.histogram("chat_request_seconds", "End-to-end chat request time", ["endpoint", "outcome"])
+requests_in_flight = registry.gauge("chat_requests_in_flight", "Chat requests currently being served", ["endpoint"])
+shed_total = registry.counter("chat_shed_total", "Chat requests rejected by admission control", ["reason"])
+fallback_total = registry.counter("chat_fallback_total", "Chat replies served from the canned fallback", ["reason"])
+model_retries_total = registry.counter("chat_model_retries_total", "Chat model calls retried after a transient error")
+
+_tracer = None
+
+
+def setup_tracing(service_name="wellmind-chatbot", endpoint=None):
+    """Enable OpenTelemetry spans for stages; exports over OTLP when `endpoint` is set."""
+    global _tracer
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    if endpoint:
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint)))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer("wellmind.chatbot")
+
+
+@contextmanager
+def stage(name):
+    """Time a pipeline stage. A failing stage is counted and its name is
+    attached to the exception as `chat_stage` for the handler to report."""
+    span = _tracer.start_as_current_span(name) if _tracer is not None else None
+    if span is not None:
+        span.__enter__()
+    stage_in_flight.inc(stage=name)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        stage_errors.inc(stage=name)
+        if not hasattr(e, "chat_stage"):
+            try:
+                e.chat_stage = name
+            except AttributeError:
+                pass
+        if span is not None:
+            span.__exit__(type(e), e, e.__traceback__)
+            span = None
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, stage=name)
+        stage_in_flight.dec(stage=name)
+        if span is not None:
+            span.__exit__(None, None, None)
+
+
+async def timed(name, awaitable):
+    """Await `awaitable` inside stage(name), for use with asyncio.gather."""
+    with stage(name):
+        return await awaitable
+
+
+@contextmanager
+def request(endpoint):
+    """Track one chat request. The yielded dict's "outcome" (default "ok",
+    "error" if the block raises) becomes the histogram label."""
+    labels = {"outcome": "ok"}
+    requests_in_flight.inc(endpoint=endpoint)
+    started = time.perf_counter()
+    try:
+        yield labels
+    except Exception:
+        labels["outcome"] = "error"
+        raise
+    finally:
+        request_seconds.observe(time.perf_counter() - started, endpoint=endpoint, outcome=labels["outcome"])
+        requests_in_flight.dec(endpoint=endpoint)
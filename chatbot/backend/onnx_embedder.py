@@ -0,0 +1,177 @@
+# onnx_embedder.py
+#
+# CPU embedding backend: all-MiniLM-L6-v2 exported to ONNX with int8 dynamic
+# quantization, run with onnxruntime. Produces vectors compatible with the
+# SentenceTransformer model (mean pooling + L2 normalization).
+#
+#   cd chatbot/backend
+#   python onnx_embedder.py export            # writes ./onnx_model
+#   python onnx_embedder.py parity            # compares against SentenceTransformer
+#
+# Exporting also needs torch, sentence-transformers and the `onnx` package;
+# serving only needs onnxruntime and tokenizers.
+#
+# Select it in main.py with EMBEDDING_BACKEND=onnx (ONNX_MODEL_DIR to relocate).
+
+import argparse
+import json
+import os
+
+import numpy as np
+
+MODEL_FILE = "model_int8.onnx"
+CONFIG_FILE = "embedder_config.json"
+
+PARITY_TEXTS = [
+    "I feel anxious before exams and can't focus.",
+    "How do I sleep better when my thoughts keep racing?",
+    "Grounding techniques like 5-4-3-2-1 can help during a panic attack.",
+    "Call your local crisis line if you are thinking about harming yourself.",
+    "Regular exercise, sunlight and routine support a healthier mood.",
+    "My family doesn't understand why I want to see a therapist.",
+    "sleep",
+    "",
+]
+
+
+class OnnxEmbedder:
+    """Drop-in for the parts of SentenceTransformer that the chatbot uses."""
+
+    def __init__(self, model_dir="onnx_model", threads=None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, CONFIG_FILE)) as f:
+            self.config = json.load(f)
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config["max_length"])
+        self.tokenizer.enable_padding(pad_id=self.config.get("pad_id", 0))
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(os.path.join(model_dir, MODEL_FILE), options,
+                                            providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def get_sentence_embedding_dimension(self):
+        return self.config["dimension"]
+
+    def encode(self, texts, batch_size=32, **kwargs):
+        single = isinstance(texts, str)
+        if single:
+            texts = [texts]
+
+        out = []
+        for start in range(0, len(texts), batch_size):
+            out.append(self._encode_batch(texts[start:start + batch_size]))
+        vectors = np.concatenate(out) if out else np.zeros((0, self.config["dimension"]), dtype=np.float32)
+        return vectors[0] if single else vectors
+
+    def _encode_batch(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([e.type_ids for e in encodings], dtype=np.int64)
+
+        hidden = self.session.run(None, feeds)[0]
+
+        # Mean pooling over real tokens, as in the SentenceTransformer pipeline
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.config.get("normalize", True):
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+
+
+def export(model_name="all-MiniLM-L6-v2", model_dir="onnx_model"):
+    """Export `model_name` to ONNX and write an int8-quantized copy plus tokenizer."""
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize
+
+    class HiddenStates(torch.nn.Module):
+        # Keyword call and a plain tensor output keep the export independent
+        # of the transformers forward() signature and output classes
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids=None):
+            return self.model(input_ids=input_ids, attention_mask=attention_mask,
+                              token_type_ids=token_type_ids).last_hidden_state
+
+    os.makedirs(model_dir, exist_ok=True)
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer = HiddenStates(st[0].auto_model).eval()
+    tokenizer = st.tokenizer
+    tokenizer.save_pretrained(model_dir)
+
+    sample = tokenizer(["warm up sentence"], return_tensors="pt")
+    names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    fp32_path = os.path.join(model_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            tuple(sample[name] for name in names),
+            fp32_path,
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes={**{name: {0: "batch", 1: "sequence"} for name in names},
+                          "last_hidden_state": {0: "batch", 1: "sequence"}},
+            opset_version=17,
+            dynamo=False,
+        )
+
+    quantize_dynamic(fp32_path, os.path.join(model_dir, MODEL_FILE), weight_type=QuantType.QInt8)
+
+    with open(os.path.join(model_dir, CONFIG_FILE), "w") as f:
+        json.dump({
+            "source_model": model_name,
+            "max_length": st.max_seq_length,
+            "dimension": st.get_sentence_embedding_dimension(),
+            "pad_id": tokenizer.pad_token_id or 0,
+            "normalize": any(isinstance(module, Normalize) for module in st),
+        }, f, indent=2)
+    return model_dir
+
+
+def parity(model_name="all-MiniLM-L6-v2", model_dir="onnx_model", texts=PARITY_TEXTS, min_cosine=0.98):
+    """Cosine similarity between reference and ONNX vectors for the same texts."""
+    from sentence_transformers import SentenceTransformer
+
+    reference = SentenceTransformer(model_name, device="cpu").encode(texts, normalize_embeddings=True)
+    candidate = OnnxEmbedder(model_dir).encode(texts)
+    candidate = candidate / np.clip(np.linalg.norm(candidate, axis=1, keepdims=True), 1e-12, None)
+    cosines = (reference * candidate).sum(axis=1)
+
+    # Retrieval only cares that neighbours stay neighbours: compare rankings too
+    same_top1 = np.mean((reference @ reference.T).argsort(axis=1)[:, -2] ==
+                        (candidate @ candidate.T).argsort(axis=1)[:, -2])
+    return {
+        "min_cosine": round(float(cosines.min()), 5),
+        "mean_cosine": round(float(cosines.mean()), 5),
+        "nearest_neighbour_agreement": round(float(same_top1), 3),
+        "passed": bool(cosines.min() >= min_cosine),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["export", "parity"])
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--model-dir", default="onnx_model")
+    parser.add_argument("--min-cosine", type=float, default=0.98)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(f"Exported to {export(args.model, args.model_dir)}")
+    else:
+        result = parity(args.model, args.model_dir, min_cosine=args.min_cosine)
+        print(json.dumps(result, indent=2))
+        raise SystemExit(0 if result["passed"] else 1)
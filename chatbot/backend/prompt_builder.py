@@ -0,0 +1,103 @@
+# prompt_builder.py
+#
+# Assembles the chat prompt under a per-section token budget so long replies
+# and long documents cannot make prompts (and Gemini latency) grow unbounded.
+
+import math
+
+PROMPT_TEMPLATE = """
+You are a compassionate mental health assistant. The user's name is {user_name}.
+{summary_section}
+Conversation history:
+{chat_history}
+
+Relevant knowledge:
+{rag_context}
+
+User's message:
+{user_message}
+
+Respond empathetically and informatively using the above context and knowledge.
+"""
+
+SUMMARY_TEMPLATE = """
+Summarize this conversation between a user and a mental health assistant for the
+assistant's own reference. Keep names, feelings, goals, coping strategies tried
+and anything the user asked to remember. Use at most {max_words} words.
+
+Summary so far:
+{summary}
+
+New messages:
+{messages}
+"""
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English)."""
+    return math.ceil(len(text) / 4)
+
+
+def truncate_tokens(text, budget, keep="head"):
+    """Cut `text` to about `budget` tokens, keeping its start ("head") or end ("tail")."""
+    if estimate_tokens(text) <= budget:
+        return text
+    limit = max(budget, 0) * 4
+    if keep == "tail":
+        return "…" + text[len(text) - limit:]
+    return text[:limit] + "…"
+
+
+class PromptBuilder:
+    def __init__(self, summary_budget=300, history_budget=600, knowledge_budget=900, message_budget=400):
+        self.summary_budget = summary_budget
+        self.history_budget = history_budget
+        self.knowledge_budget = knowledge_budget
+        self.message_budget = message_budget
+
+    def history(self, rows):
+        """Most recent `(sender, message)` turns that fit the history budget."""
+        lines = []
+        remaining = self.history_budget
+        for sender, message in reversed(rows):
+            line = f"{sender}: {message}"
+            cost = estimate_tokens(line)
+            if cost > remaining:
+                # Keep a trimmed copy of the newest turn rather than dropping it
+                if not lines and remaining > 0:
+                    lines.append(truncate_tokens(line, remaining))
+                break
+            lines.append(line)
+            remaining -= cost
+        return "\n".join(reversed(lines))
+
+    def knowledge(self, docs):
+        """Retrieved documents in rank order until the knowledge budget runs out."""
+        parts = []
+        remaining = self.knowledge_budget
+        for doc in docs:
+            cost = estimate_tokens(doc)
+            if cost > remaining:
+                if remaining > 50:
+                    parts.append(truncate_tokens(doc, remaining))
+                break
+            parts.append(doc)
+            remaining -= cost
+        return "\n\n".join(parts)
+
+    def build(self, user_name, user_message, history_rows, docs, summary=""):
+        summary = truncate_tokens(summary, self.summary_budget, keep="tail") if summary else ""
+        return PROMPT_TEMPLATE.format(
+            user_name=user_name,
+            summary_section=f"\nSummary of earlier conversation:\n{summary}\n" if summary else "",
+            chat_history=self.history(history_rows),
+            rag_context=self.knowledge(docs),
+            user_message=truncate_tokens(user_message, self.message_budget),
+        )
+
+    def summary_prompt(self, summary, rows):
+        return SUMMARY_TEMPLATE.format(
+            max_words=int(self.summary_budget * 0.75),
+            summary=summary or "(none yet)",
+            messages="\n".join(truncate_tokens(f"{sender}: {message}", self.message_budget) for sender, message in rows),
+        )
@@ -0,0 +1,360 @@
+# retrieval.py
+#
+# Retrievers return the top-k documents for a query embedding (and the query
+# text, which only HybridRetriever uses). Chroma stays the durable store for
+# ingested chunks; NumpyRetriever serves queries from a contiguous in-process
+# matrix that is snapshotted to a memory-mapped file, so several workers share
+# the same pages; HybridRetriever adds a BM25 index on top of either.
+
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from filelock import FileLock
+
+from lexical_index import BM25Index, tokenize
+
+
+class ChromaRetriever:
+    def __init__(self, collection, client=None):
+        self.collection = collection
+        self.client = client
+
+    def max_batch_size(self):
+        return self.client.get_max_batch_size() if self.client is not None else 5000
+
+    def query(self, vector, k=3, text=None):
+        results = self.collection.query(query_embeddings=[vector], n_results=k)
+        return results.get("documents", [[]])[0]
+
+    def documents(self):
+        """(ids, documents) of every stored chunk."""
+        data = self.collection.get(include=["documents"])
+        return list(data["ids"]), list(data["documents"])
+
+    def upsert(self, ids, documents, embeddings, metadatas):
+        self.collection.upsert(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+
+    def source_hashes(self, source):
+        """{chunk id: content hash} for every stored chunk of `source` (hash is None for legacy chunks)."""
+        data = self.collection.get(where={"source": source}, include=["metadatas"])
+        return {chunk_id: (metadata or {}).get("hash") for chunk_id, metadata in zip(data["ids"], data["metadatas"])}
+
+    def delete(self, ids):
+        if ids:
+            self.collection.delete(ids=ids)
+
+    def flush(self):
+        pass
+
+    def count(self):
+        return self.collection.count()
+
+
+class NumpyRetriever:
+    """Exact top-k over normalized embeddings with one matrix-vector product.
+
+    Writes go through to the wrapped ChromaRetriever and update the in-memory
+    matrix; `flush()` replays them onto the newest snapshot on disk, under a
+    lock file shared by all processes, and writes the result. Other processes
+    notice a newer snapshot (checked at most every `refresh_seconds`) and
+    remap it. A snapshot whose ids don't match Chroma's is rebuilt on load.
+    """
+
+    def __init__(self, durable, snapshot_dir="numpy_index", refresh_seconds=1.0):
+        self.durable = durable
+        self.snapshot_dir = snapshot_dir
+        self.refresh_seconds = refresh_seconds
+        self._write_lock = threading.Lock()
+        self._checked = 0.0
+        self._loaded_mtime = None
+        self._dirty = False
+        self._pending = {}  # chunk id -> (document, vector, metadata), or None if deleted, since the last flush
+        # (matrix, ids, documents, metadatas) is swapped as one tuple. Writes
+        # append to the lists and to spare rows of `_buffer` first; queries
+        # only look at the matrix's rows, so they see a new chunk once the
+        # tuple holding the longer matrix is published
+        self._state = (np.zeros((0, 0), dtype=np.float32), [], [], [])
+        self._buffer = None   # writable rows behind the matrix (None while it is the mapped snapshot)
+        self._positions = {}  # chunk id -> row
+
+        os.makedirs(snapshot_dir, exist_ok=True)
+        self._file_lock = FileLock(os.path.join(snapshot_dir, "snapshot.lock"))
+        with self._file_lock:
+            if not (self._load_snapshot() and self._matches_durable()):
+                self._rebuild_from_durable()
+                self._write_snapshot()
+
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.snapshot_dir, "vectors.npy")
+
+    @property
+    def _documents_path(self):
+        return os.path.join(self.snapshot_dir, "documents.json")
+
+    @staticmethod
+    def _normalize(matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.clip(norms, 1e-12, None)
+
+    # --- snapshots ---
+
+    def _load_snapshot(self):
+        try:
+            mtime = os.path.getmtime(self._documents_path)
+            with open(self._documents_path) as f:
+                meta = json.load(f)
+            matrix = np.load(self._vectors_path, mmap_mode="r")
+        except (OSError, ValueError):
+            return False
+        if matrix.shape[0] != len(meta["ids"]):
+            return False
+        self._state = (matrix, meta["ids"], meta["documents"], meta["metadatas"])
+        self._positions = {chunk_id: i for i, chunk_id in enumerate(meta["ids"])}
+        self._buffer = None
+        self._loaded_mtime = mtime
+        return True
+
+    def _snapshot_mtime(self):
+        try:
+            return os.path.getmtime(self._documents_path)
+        except OSError:
+            return None
+
+    def _matches_durable(self):
+        """Whether the loaded snapshot holds exactly the chunks in Chroma (a
+        worker may have died between writing Chroma and flushing)."""
+        ids = self._state[1]
+        if self.durable.count() != len(ids):
+            return False
+        return set(self.durable.collection.get(include=[])["ids"]) == set(ids)
+
+    def _rebuild_from_durable(self):
+        data = self.durable.collection.get(include=["embeddings", "documents", "metadatas"])
+        embeddings = data.get("embeddings")
+        matrix = self._normalize(embeddings) if embeddings is not None and len(embeddings) else np.zeros((0, 0), np.float32)
+        self._state = (matrix, list(data["ids"]), list(data["documents"]), list(data["metadatas"]))
+        self._positions = {chunk_id: i for i, chunk_id in enumerate(data["ids"])}
+        self._buffer = matrix
+        self._dirty = True
+
+    def _write_snapshot(self):
+        # Caller holds self._file_lock
+        matrix, ids, documents, metadatas = self._state
+        # Write-then-rename: readers holding the old mapping keep valid pages
+        with open(self._vectors_path + ".tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(matrix, dtype=np.float32))
+        with open(self._documents_path + ".tmp", "w") as f:
+            json.dump({"ids": ids, "documents": documents, "metadatas": metadatas}, f)
+        os.replace(self._vectors_path + ".tmp", self._vectors_path)
+        os.replace(self._documents_path + ".tmp", self._documents_path)
+        self._loaded_mtime = os.path.getmtime(self._documents_path)
+        self._pending = {}
+        self._dirty = False
+
+    def flush(self):
+        """Persist the writes made since the last snapshot."""
+        with self._write_lock:
+            if not self._dirty:
+                return
+            with self._file_lock:
+                # Another process flushed since we loaded: start from its
+                # snapshot so its chunks aren't overwritten, then redo ours
+                if self._snapshot_mtime() != self._loaded_mtime and self._load_snapshot():
+                    upserts = [(chunk_id, *entry) for chunk_id, entry in self._pending.items() if entry is not None]
+                    if upserts:
+                        ids, documents, vectors, metadatas = zip(*upserts)
+                        self._apply(list(ids), list(documents), np.stack(vectors), list(metadatas))
+                    self._remove({chunk_id for chunk_id, entry in self._pending.items() if entry is None})
+                self._write_snapshot()
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if now - self._checked < self.refresh_seconds:
+            return
+        self._checked = now
+        mtime = self._snapshot_mtime()
+        if mtime is not None and mtime != self._loaded_mtime and not self._dirty:
+            with self._write_lock:
+                if not self._dirty:
+                    self._load_snapshot()
+
+    # --- Retriever interface ---
+
+    def max_batch_size(self):
+        return self.durable.max_batch_size()
+
+    def query(self, vector, k=3, text=None):
+        self._maybe_refresh()
+        matrix, _, documents, _ = self._state
+        if not len(matrix):
+            return []
+
+        scores = matrix @ self._normalize(vector)
+        k = min(k, len(matrix))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [documents[i] for i in top]
+
+    def _reserve(self, rows, dim):
+        """Make `_buffer` hold at least `rows` rows, doubling its capacity so
+        appends copy the existing rows O(log n) times in total."""
+        matrix = self._state[0]
+        if self._buffer is not None and len(self._buffer) >= rows:
+            return
+        buffer = np.empty((max(rows, 2 * len(matrix), 1024), dim), dtype=np.float32)
+        if len(matrix):
+            buffer[:len(matrix)] = matrix
+        self._buffer = buffer
+
+    def _apply(self, ids, documents, vectors, metadatas):
+        # Caller holds self._write_lock
+        matrix, all_ids, all_documents, all_metadatas = self._state
+        added = len({chunk_id for chunk_id in ids if chunk_id not in self._positions})
+        self._reserve(len(matrix) + added, vectors.shape[1])
+
+        for chunk_id, document, vector, metadata in zip(ids, documents, vectors, metadatas):
+            i = self._positions.get(chunk_id)
+            if i is None:
+                i = self._positions[chunk_id] = len(all_ids)
+                all_ids.append(chunk_id)
+                all_documents.append(document)
+                all_metadatas.append(metadata)
+            else:
+                all_documents[i] = document
+                all_metadatas[i] = metadata
+            self._buffer[i] = vector
+        self._state = (self._buffer[:len(all_ids)], all_ids, all_documents, all_metadatas)
+
+    def _remove(self, doomed):
+        # Caller holds self._write_lock
+        matrix, old_ids, old_documents, old_metadatas = self._state
+        keep = [i for i, chunk_id in enumerate(old_ids) if chunk_id not in doomed]
+        if len(keep) == len(old_ids):
+            return
+        ids = [old_ids[i] for i in keep]
+        self._buffer = np.array(matrix[keep], dtype=np.float32)
+        self._positions = {chunk_id: i for i, chunk_id in enumerate(ids)}
+        self._state = (self._buffer, ids, [old_documents[i] for i in keep], [old_metadatas[i] for i in keep])
+
+    def upsert(self, ids, documents, embeddings, metadatas):
+        self.durable.upsert(ids, documents, embeddings, metadatas)
+        vectors = self._normalize(embeddings)
+
+        with self._write_lock:
+            for chunk_id, document, vector, metadata in zip(ids, documents, vectors, metadatas):
+                self._pending[chunk_id] = (document, vector, metadata)
+            self._apply(ids, documents, vectors, metadatas)
+            self._dirty = True
+
+    def source_hashes(self, source):
+        return self.durable.source_hashes(source)
+
+    def documents(self):
+        _, ids, documents, _ = self._state
+        return list(ids), list(documents)
+
+    def delete(self, ids):
+        if not ids:
+            return
+        self.durable.delete(ids)
+
+        with self._write_lock:
+            for chunk_id in ids:
+                self._pending[chunk_id] = None
+            self._remove(set(ids))
+            self._dirty = True
+
+    def count(self):
+        return len(self._state[1])
+
+
+class HybridRetriever:
+    """A dense retriever plus an in-memory BM25 index kept in sync on writes.
+
+    Modes: "hybrid" fuses the dense and BM25 rankings with reciprocal rank
+    fusion; "lexical" answers from BM25 alone (dense if no term matches); "auto" takes the lexical path
+    for short keyword queries containing a rare term (a drug name, a phone
+    number) and uses hybrid otherwise; "dense" bypasses the index.
+    """
+
+    def __init__(self, dense, mode="hybrid", candidates=20, rrf_k=60, lexical_weight=1.0,
+                 keyword_max_terms=3, rare_term_df=0.01):
+        self.dense = dense
+        self.mode = mode
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.lexical_weight = lexical_weight
+        self.keyword_max_terms = keyword_max_terms
+        self.rare_term_df = rare_term_df
+        self.index = BM25Index()
+        self.paths = {"dense": 0, "lexical": 0, "hybrid": 0}
+
+        started = time.perf_counter()
+        self.index.add(*dense.documents())
+        self.build_seconds = time.perf_counter() - started
+
+    def is_keyword_query(self, text):
+        terms = set(tokenize(text))
+        if not terms or len(terms) > self.keyword_max_terms:
+            return False
+        if any(not self.index.document_frequency(term) for term in terms):
+            return False
+        rare = max(1, self.rare_term_df * len(self.index))
+        return any(self.index.document_frequency(term) <= rare for term in terms)
+
+    def query(self, vector, k=3, text=None):
+        mode = self.mode if text else "dense"
+        if mode == "auto":
+            mode = "lexical" if self.is_keyword_query(text) else "hybrid"
+        self.paths[mode] += 1
+
+        if mode == "dense":
+            return self.dense.query(vector, k)
+        if mode == "lexical":
+            hits = self.index.search(text, k)
+            if hits:
+                return [document for _, document in hits]
+            return self.dense.query(vector, k)
+
+        scores = {}
+        for rank, document in enumerate(self.dense.query(vector, self.candidates)):
+            scores[document] = scores.get(document, 0.0) + 1 / (self.rrf_k + rank + 1)
+        for rank, (_, document) in enumerate(self.index.search(text, self.candidates)):
+            scores[document] = scores.get(document, 0.0) + self.lexical_weight / (self.rrf_k + rank + 1)
+        return sorted(scores, key=scores.get, reverse=True)[:k]
+
+    # --- writes go to both sides ---
+
+    def max_batch_size(self):
+        return self.dense.max_batch_size()
+
+    def upsert(self, ids, documents, embeddings, metadatas):
+        self.dense.upsert(ids, documents, embeddings, metadatas)
+        self.index.add(ids, documents)
+
+    def source_hashes(self, source):
+        return self.dense.source_hashes(source)
+
+    def documents(self):
+        return self.dense.documents()
+
+    def delete(self, ids):
+        if not ids:
+            return
+        self.dense.delete(ids)
+        self.index.delete(ids)
+
+    def flush(self):
+        self.dense.flush()
+
+    def count(self):
+        return self.dense.count()
+
+    def stats(self):
+        return {"mode": self.mode, "paths": dict(self.paths), "build_seconds": round(self.build_seconds, 3),
+                **self.index.stats()}
@@ -0,0 +1,112 @@
+# semantic_cache.py
+#
+# Reuses replies for near-identical questions ("I feel anxious", "i feel so
+# anxious") by comparing query embeddings instead of exact text.
+
+from collections import OrderedDict
+import threading
+import time
+
+import numpy as np
+
+
+class SemanticCache:
+    """Similarity-keyed reply cache with a TTL and LRU eviction.
+
+    Vectors live in one preallocated (max_entries, dim) matrix so a lookup is a
+    single matrix-vector product over the rows of its namespace. Entries are
+    scoped by `namespace` (e.g. the name the reply addresses) so a cached
+    answer is never served across them.
+    """
+
+    def __init__(self, threshold=0.92, ttl_seconds=3600, max_entries=1000):
+        self.threshold = threshold
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._entries = OrderedDict()  # slot -> (namespace, reply, created, cost_seconds)
+        self._namespaces = {}          # namespace -> set of slots
+        self._free = list(range(max_entries - 1, -1, -1))
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.saved_seconds = 0.0
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _drop(self, slot):
+        namespace = self._entries.pop(slot)[0]
+        slots = self._namespaces[namespace]
+        slots.discard(slot)
+        if not slots:
+            del self._namespaces[namespace]
+        self._free.append(slot)
+
+    def lookup(self, vector, namespace=""):
+        """Return the cached reply closest to `vector`, or None on a miss."""
+        with self._lock:
+            slots = self._namespaces.get(namespace)
+            if not slots:
+                self.misses += 1
+                return None
+
+            # Only this namespace's rows are scored, so other namespaces'
+            # entries can't crowd its candidates out
+            slots = np.fromiter(slots, dtype=np.intp, count=len(slots))
+            scores = self._matrix[slots] @ self._normalize(vector)
+            now = time.monotonic()
+
+            # Walk candidates best-first; expired entries are dropped
+            for i in np.argsort(-scores):
+                if scores[i] < self.threshold:
+                    break
+                slot = int(slots[i])
+                _, reply, created, cost = self._entries[slot]
+                if now - created > self.ttl:
+                    self._drop(slot)
+                    self.expirations += 1
+                    continue
+                self._entries.move_to_end(slot)
+                self.hits += 1
+                self.saved_seconds += cost
+                return reply
+
+            self.misses += 1
+            return None
+
+    def store(self, vector, reply, namespace="", cost_seconds=0.0):
+        """Cache `reply`; `cost_seconds` is the work a future hit will save."""
+        vector = self._normalize(vector)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            if not self._free:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+            slot = self._free.pop()
+            self._matrix[slot] = vector
+            self._entries[slot] = (namespace, reply, time.monotonic(), cost_seconds)
+            self._namespaces.setdefault(namespace, set()).add(slot)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "latency_saved_seconds": round(self.saved_seconds, 3),
+        }
@@ -0,0 +1,103 @@
+# stubs.py
+#
+# Offline stand-ins for the Gemini model (CHAT_MODEL_BACKEND=stub) and the
+# embedding model (EMBEDDING_BACKEND=stub). They mirror the parts of
+# google.generativeai.GenerativeModel and SentenceTransformer that main.py uses.
+
+import asyncio
+import hashlib
+import random
+import re
+import time
+
+import numpy as np
+
+
+class StubResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class StubStream:
+    """Async iterator over reply chunks, like generate_content_async(stream=True)."""
+
+    def __init__(self, chunks, delay):
+        self._chunks = chunks
+        self._delay = delay
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for chunk in self._chunks:
+            await asyncio.sleep(self._delay)
+            yield StubResponse(chunk)
+
+
+class StubModelError(ConnectionError):
+    """Injected transient failure (see StubChatModel.failure_rate)."""
+
+
+class StubChatModel:
+    """Echo-style model with a configurable total latency (milliseconds).
+
+    `failure_rate` is the fraction of calls that raise StubModelError, for
+    exercising retries and the circuit breaker.
+    """
+
+    def __init__(self, latency_ms=0, chunk_words=4, failure_rate=0):
+        self.latency = latency_ms / 1000
+        self.chunk_words = chunk_words
+        self.failure_rate = failure_rate
+
+    def _maybe_fail(self):
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise StubModelError("Injected stub model failure")
+
+    def reply_for(self, prompt):
+        message = prompt.split("User's message:")[-1].strip().split("\n")[0]
+        return f"I hear you. You said: {message}. Take a slow breath; you are not alone in this."
+
+    def _chunks(self, text):
+        words = text.split(" ")
+        return [" ".join(words[i:i + self.chunk_words]) + (" " if i + self.chunk_words < len(words) else "")
+                for i in range(0, len(words), self.chunk_words)]
+
+    def generate_content(self, prompt, stream=False):
+        time.sleep(self.latency)
+        self._maybe_fail()
+        return StubResponse(self.reply_for(prompt))
+
+    async def generate_content_async(self, prompt, stream=False):
+        text = self.reply_for(prompt)
+        if stream:
+            self._maybe_fail()
+            chunks = self._chunks(text)
+            return StubStream(chunks, self.latency / max(len(chunks), 1))
+        await asyncio.sleep(self.latency)
+        self._maybe_fail()
+        return StubResponse(text)
+
+
+class StubEmbedder:
+    """Hashed bag-of-words vectors: deterministic, cheap, and texts sharing
+    words still land near each other. `latency_ms` is added per encode call."""
+
+    def __init__(self, dimension=384, latency_ms=0):
+        self.dimension = dimension
+        self.latency = latency_ms / 1000
+
+    def _vector(self, text):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest(), "little")
+            vector[digest % self.dimension] += 1.0 if digest >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+        single = isinstance(sentences, str)
+        vectors = np.stack([self._vector(text) for text in ([sentences] if single else sentences)])
+        return vectors[0] if single else vectors
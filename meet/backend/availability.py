@@ -0,0 +1,241 @@
+# availability.py
+#
+# Free appointment slots per therapist and day, computed once from the weekly
+# templates in available_slots and the non-cancelled appointments, then served
+# from memory. Writers call invalidate() for the therapist (and day) they
+# touched; a lookup that raced with an invalidation is not cached. Other
+# processes (more uvicorn workers) can't call invalidate() here, so triggers
+# record every schedule change in schedule_versions and the cache drops the
+# therapists changed elsewhere, checking at most every `sync_seconds`. search()
+# answers date-range queries across all therapists with two set-based
+# queries per page instead of one lookup per therapist per day.
+
+from collections import OrderedDict
+from datetime import date as date_type, timedelta
+import threading
+import time
+
+_BUMP = """INSERT OR REPLACE INTO schedule_versions (therapist_id, seq)
+           VALUES ({row}.therapist_id, (SELECT COALESCE(MAX(seq), 0) + 1 FROM schedule_versions));"""
+
+
+def _schedule_triggers(table, columns):
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_schedule_insert AFTER INSERT ON {table}
+            BEGIN {_BUMP.format(row="NEW")} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_schedule_update AFTER UPDATE OF {columns} ON {table}
+            BEGIN {_BUMP.format(row="OLD")} {_BUMP.format(row="NEW")} END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table}_schedule_delete AFTER DELETE ON {table}
+            BEGIN {_BUMP.format(row="OLD")} END""",
+    ]
+
+
+# Created by init_db(). Any change to a therapist's bookings or weekly
+# template gives them the next sequence number, whichever process made it.
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS schedule_versions (
+        therapist_id INTEGER PRIMARY KEY,
+        seq INTEGER NOT NULL
+    )""",
+    """CREATE INDEX IF NOT EXISTS idx_schedule_versions_seq ON schedule_versions (seq)""",
+] + _schedule_triggers("appointments", "therapist_id, scheduled_date, scheduled_time, status") \
+  + _schedule_triggers("available_slots", "therapist_id, day_of_week, start_time, end_time, is_available")
+
+
+def parse_minutes(value):
+    """ "HH:MM" -> minutes after midnight."""
+    hours, minutes = value.split(":")[:2]
+    return int(hours) * 60 + int(minutes)
+
+
+def format_minutes(minutes):
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class AvailabilityIndex:
+    """Cache of free "HH:MM" start times keyed by (therapist_id, date).
+
+    Weekly templates are cached per therapist, so filling in a new day costs
+    one query for that day's bookings. At most `max_days` days are kept,
+    least recently used first out. Changes made by other processes show up
+    within `sync_seconds` (0 checks on every lookup).
+    """
+
+    def __init__(self, pool, slot_minutes=60, max_days=20000, sync_seconds=1.0):
+        self.pool = pool
+        self.slot_minutes = slot_minutes
+        self.max_days = max_days
+        self.sync_seconds = sync_seconds
+        self._lock = threading.Lock()
+        self._templates = {}        # therapist_id -> {day_of_week: (start minutes, ...)}
+        self._days = OrderedDict()  # (therapist_id, "YYYY-MM-DD") -> ("HH:MM", ...)
+        self._versions = {}         # therapist_id -> bumped on every invalidation
+        self._seen_seq = None       # highest schedule_versions.seq already applied
+        self._synced_at = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.external_changes = 0
+
+    def _load_template(self, conn, therapist_id):
+        rows = conn.execute("""
+            SELECT day_of_week, start_time, end_time FROM available_slots
+            WHERE therapist_id = ? AND is_available = 1
+        """, (therapist_id,)).fetchall()
+        week = {}
+        for day_of_week, start, end in rows:
+            starts = week.setdefault(day_of_week, set())
+            starts.update(range(parse_minutes(start), parse_minutes(end), self.slot_minutes))
+        return {day_of_week: tuple(sorted(starts)) for day_of_week, starts in week.items()}
+
+    def _compute(self, therapist_id, day):
+        with self.pool.connection() as conn:
+            template = self._templates.get(therapist_id)
+            if template is None:
+                template = self._load_template(conn, therapist_id)
+            booked = {row[0] for row in conn.execute("""
+                SELECT scheduled_time FROM appointments
+                WHERE therapist_id = ? AND scheduled_date = ? AND status != 'cancelled'
+            """, (therapist_id, day.isoformat()))}
+        free = tuple(time for time in map(format_minutes, template.get(day.weekday(), ())) if time not in booked)
+        return template, free
+
+    def _sync(self):
+        """Forget therapists whose schedule changed since the last check,
+        possibly in another process."""
+        now = time.monotonic()
+        with self._lock:
+            if self._synced_at is not None and now - self._synced_at < self.sync_seconds:
+                return
+            self._synced_at = now
+            seen = self._seen_seq
+        with self.pool.connection() as conn:
+            if seen is None:
+                changed = []
+                latest = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM schedule_versions").fetchone()[0]
+            else:
+                changed = conn.execute("""
+                    SELECT therapist_id, seq FROM schedule_versions WHERE seq > ?
+                """, (seen,)).fetchall()
+                latest = max([seen] + [seq for _, seq in changed])
+        with self._lock:
+            self._seen_seq = max(latest, self._seen_seq or 0)
+            for therapist_id, _ in changed:
+                self.external_changes += 1
+                self._forget(therapist_id)
+
+    def free_slots(self, therapist_id, day):
+        """Free start times on `day` (a date), sorted."""
+        self._sync()
+        key = (therapist_id, day.isoformat())
+        with self._lock:
+            free = self._days.get(key)
+            if free is not None:
+                self._days.move_to_end(key)
+                self.hits += 1
+                return free
+            self.misses += 1
+            version = self._versions.get(therapist_id, 0)
+
+        template, free = self._compute(therapist_id, day)
+
+        with self._lock:
+            if self._versions.get(therapist_id, 0) == version:
+                self._templates[therapist_id] = template
+                self._days[key] = free
+                if len(self._days) > self.max_days:
+                    self._days.popitem(last=False)
+        return free
+
+    def invalidate(self, therapist_id, date=None):
+        """Forget one day of a therapist's bookings, or (no `date`) their
+        whole schedule, e.g. after the weekly template changed."""
+        with self._lock:
+            self.invalidations += 1
+            if date is not None:
+                self._versions[therapist_id] = self._versions.get(therapist_id, 0) + 1
+                self._days.pop((therapist_id, date), None)
+                return
+            self._forget(therapist_id)
+
+    def _forget(self, therapist_id):
+        # Caller holds self._lock
+        self._versions[therapist_id] = self._versions.get(therapist_id, 0) + 1
+        self._templates.pop(therapist_id, None)
+        for key in [key for key in self._days if key[0] == therapist_id]:
+            del self._days[key]
+
+    def search(self, start, end, specialization=None, tag=None, not_before=None, after=None, limit=50):
+        """Open slots across therapists between dates `start` and `end`
+        (inclusive), earliest first (ties by therapist id): one query for
+        the weekly templates and one for the bookings in the range.
+
+        `after` is the (date, time, therapist_id) key of the last slot on the
+        previous page. Returns the page and whether more slots follow.
+        """
+        filters, params = ["s.is_available = 1"], []
+        if specialization:
+            filters.append("t.specialization LIKE ?")
+            params.append(f"%{specialization}%")
+        if tag:
+            filters.append("(t.specialization LIKE ? OR t.bio LIKE ?)")
+            params += [f"%{tag}%", f"%{tag}%"]
+        where = " AND ".join(filters)
+
+        with self.pool.connection() as conn:
+            rows = conn.execute(f"""
+                SELECT s.therapist_id, t.name, t.specialization, s.day_of_week, s.start_time, s.end_time
+                FROM available_slots s JOIN therapists t ON t.id = s.therapist_id
+                WHERE {where}
+            """, params).fetchall()
+
+        therapists, week = {}, {}
+        for therapist_id, name, therapist_specialization, day_of_week, start_time, end_time in rows:
+            therapists[therapist_id] = {"therapist_id": therapist_id, "therapist_name": name,
+                                        "specialization": therapist_specialization}
+            week.setdefault(day_of_week, set()).update(
+                (minutes, therapist_id)
+                for minutes in range(parse_minutes(start_time), parse_minutes(end_time), self.slot_minutes))
+        week = {day_of_week: sorted(slots) for day_of_week, slots in week.items()}
+
+        if not_before is not None:
+            start = max(start, not_before.date())
+        if after is not None:
+            start = max(start, date_type.fromisoformat(after[0]))
+        if not week or start > end:
+            return [], False
+
+        with self.pool.connection() as conn:
+            booked = set(conn.execute(f"""
+                SELECT scheduled_date, therapist_id, scheduled_time FROM appointments
+                WHERE scheduled_date BETWEEN ? AND ? AND status != 'cancelled'
+                  AND therapist_id IN (
+                      SELECT s.therapist_id FROM available_slots s JOIN therapists t ON t.id = s.therapist_id
+                      WHERE {where})
+            """, [start.isoformat(), end.isoformat()] + params))
+
+        page = []
+        day = start
+        while day <= end and len(page) <= limit:
+            date = day.isoformat()
+            for minutes, therapist_id in week.get(day.weekday(), ()):
+                time = format_minutes(minutes)
+                if (date, therapist_id, time) in booked:
+                    continue
+                if not_before is not None and day == not_before.date() and time <= not_before.strftime("%H:%M"):
+                    continue
+                if after is not None and (date, time, therapist_id) <= after:
+                    continue
+                page.append({**therapists[therapist_id], "date": date, "time": time})
+                if len(page) > limit:
+                    break
+            day += timedelta(days=1)
+        return page[:limit], len(page) > limit
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"cached_days": len(self._days), "cached_therapists": len(self._templates),
+                    "hits": self.hits, "misses": self.misses,
+                    "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                    "invalidations": self.invalidations, "external_changes": self.external_changes}
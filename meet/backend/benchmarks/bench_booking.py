@@ -0,0 +1,185 @@
+# bench_booking.py
+#
+# Concurrent /book requests against a real server. Two scenarios:
+#
+#   hot slot  - `--clients` requests for the very same slot, fired at once,
+#               for `--rounds` different slots; exactly one may win each round
+#   contended - `--users` closed-loop clients booking random slots out of a
+#               small pool for `--duration` seconds (most requests collide)
+#
+# Afterwards the database is checked for slots with more than one live
+# booking. Prints one JSON document with counts, throughput and latencies.
+#
+#   cd meet/backend
+#   python benchmarks/bench_booking.py --clients 300 --rounds 5
+#   python benchmarks/bench_booking.py --workers 4
+#
+# --url points it at an already running server (with --db for the check).
+
+import argparse
+import asyncio
+from datetime import date, timedelta
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] if values else None
+
+
+def latency_summary(latencies):
+    if not latencies:
+        return {}
+    return {f"p{pct}_ms": round(percentile(latencies, pct) * 1000, 2) for pct in (50, 99)}
+
+
+def booking(therapist_id, day, time, n):
+    return {"therapist_id": therapist_id, "client_name": f"Client {n}", "client_email": f"c{n}@example.com",
+            "scheduled_date": day.isoformat(), "scheduled_time": time}
+
+
+async def book(client, payload, results):
+    started = time.perf_counter()
+    try:
+        response = await client.post("/book", json=payload)
+        status = response.status_code
+    except httpx.HTTPError:
+        status = "error"
+    results.append((status, time.perf_counter() - started))
+
+
+def tally(results, seconds):
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        "requests": len(results),
+        "statuses": statuses,
+        "throughput_rps": round(len(results) / seconds, 1),
+        "booked": latency_summary([s for status, s in results if status == 200]),
+        "conflict": latency_summary([s for status, s in results if status == 409]),
+    }
+
+
+async def hot_slot(client, therapist_id, days, args):
+    rounds = []
+    for n in range(args.rounds):
+        day = days[n % len(days)]
+        time_of_day = f"{9 + n // len(days) % 8:02d}:00"
+        results = []
+        started = time.perf_counter()
+        await asyncio.gather(*(book(client, booking(therapist_id, day, time_of_day, i), results)
+                               for i in range(args.clients)))
+        rounds.append({"slot": f"{day} {time_of_day}", **tally(results, time.perf_counter() - started)})
+    return rounds
+
+
+async def contended(client, therapist_id, days, args):
+    pool = [(day, f"{hour:02d}:00") for day in days for hour in range(9, 17)][:args.slots]
+    results = []
+    stop = time.perf_counter() + args.duration
+
+    async def user(n):
+        while time.perf_counter() < stop:
+            day, time_of_day = random.choice(pool)
+            await book(client, booking(therapist_id, day, time_of_day, n), results)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(n) for n in range(args.users)))
+    return {"slots": len(pool), **tally(results, time.perf_counter() - started)}
+
+
+def double_bookings(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("""
+            SELECT COUNT(*) FROM (
+                SELECT 1 FROM appointments WHERE status != 'cancelled'
+                GROUP BY therapist_id, scheduled_date, scheduled_time HAVING COUNT(*) > 1)
+        """).fetchone()[0]
+    finally:
+        conn.close()
+
+
+async def wait_ready(client, server, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError("Server exited during startup")
+        try:
+            if (await client.get("/therapists")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Server did not become ready")
+
+
+async def main(args):
+    server = workdir = None
+    base_url, db_path = args.url, args.db
+    if base_url is None:
+        workdir = tempfile.mkdtemp()
+        db_path = os.path.join(workdir, "therapy_booking.db")
+        env = dict(os.environ, DB_PATH=db_path, BOOKING_NOTICE_HOURS="0",
+                   PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get("PYTHONPATH")])))
+        server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(args.port),
+                                   "--workers", str(args.workers), "--log-level", "warning"],
+                                  cwd=workdir, env=env, stdout=subprocess.DEVNULL,
+                                  stderr=None if args.server_logs else subprocess.DEVNULL)
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            await wait_ready(client, server)
+            therapist = await client.post("/therapists", json={
+                "name": "Bench Therapist", "email": f"bench-{time.time_ns()}@example.com", "specialization": "Anxiety"})
+            therapist_id = therapist.json()["therapist_id"]
+            for day_of_week in range(7):
+                await client.post("/slots", json={"therapist_id": therapist_id, "day_of_week": day_of_week,
+                                                  "start_time": "09:00", "end_time": "17:00"})
+            days = [date.today() + timedelta(days=n) for n in range(2, 30)]
+
+            results = {"config": {"workers": args.workers, "clients": args.clients, "rounds": args.rounds,
+                                  "users": args.users, "slots": args.slots, "duration": args.duration},
+                       "hot_slot": await hot_slot(client, therapist_id, days, args),
+                       "contended": await contended(client, therapist_id, days[len(days) // 2:], args)}
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    if db_path:
+        results["slots_double_booked"] = double_bookings(db_path)
+    if workdir is not None:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=300, help="simultaneous requests per hot slot")
+    parser.add_argument("--rounds", type=int, default=5, help="hot slots to fight over")
+    parser.add_argument("--users", type=int, default=64, help="closed-loop clients in the contended run")
+    parser.add_argument("--slots", type=int, default=40, help="slots the contended run picks from")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--url", help="use a running server instead of starting one")
+    parser.add_argument("--db", help="database of the --url server, for the double-booking check")
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--server-logs", action="store_true")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,129 @@
+# bench_calendar.py
+#
+# Per-accept cost of creating the Meet event with the real googleapiclient
+# client, against fakes.CalendarAPIStandIn (calendar API + OAuth token
+# endpoint on localhost; --latency-ms adds a delay per API round trip).
+# A generated service-account key stands in for a therapist's credentials.
+#
+#   uncached - what every accept used to do: parse the credentials, build
+#              the client from the discovery document, fetch a token, insert
+#   cached   - CalendarClientCache: the client and its token are reused
+#   batched  - cached client, inserts sent `--batch-size` per batch request
+#
+# Prints one JSON document with per-event latency, events/second, API round
+# trips, token requests and client builds.
+#
+#   cd meet/backend
+#   python benchmarks/bench_calendar.py --events 200 --latency-ms 20
+
+import argparse
+import json
+import os
+import sys
+import time
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from google.oauth2 import service_account
+from googleapiclient.discovery import build
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from calendar_clients import CalendarClientCache  # noqa: E402
+from fakes import CalendarAPIStandIn  # noqa: E402
+
+SCOPES = ['https://www.googleapis.com/auth/calendar']
+
+
+def service_account_json(token_uri):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption()).decode()
+    return json.dumps({
+        "type": "service_account", "project_id": "bench", "private_key_id": "bench", "private_key": pem,
+        "client_email": "bench@bench.iam.gserviceaccount.com", "client_id": "1", "token_uri": token_uri,
+    })
+
+
+def event(n, run):
+    return {"id": f"mind{run}{n:08d}", "summary": f"Therapy Session - Client {n}",
+            "start": {"dateTime": "2026-11-02T10:00:00", "timeZone": "UTC"},
+            "end": {"dateTime": "2026-11-02T11:00:00", "timeZone": "UTC"},
+            "attendees": [{"email": "therapist@example.com"}, {"email": f"client{n}@example.com"}],
+            "conferenceData": {"createRequest": {"requestId": f"mind{run}{n:08d}",
+                                                 "conferenceSolutionKey": {"type": "hangoutsMeet"}}}}
+
+
+def insert(service, body):
+    return service.events().insert(calendarId='primary', body=body, conferenceDataVersion=1, sendUpdates='all')
+
+
+def uncached(stand_in, credentials, args):
+    latencies = []
+    for n in range(args.events):
+        started = time.perf_counter()
+        creds = service_account.Credentials.from_service_account_info(json.loads(credentials), scopes=SCOPES)
+        service = build('calendar', 'v3', credentials=creds,
+                        client_options={"api_endpoint": stand_in.root_url + "calendar/v3/"})
+        insert(service, event(n, "a")).execute()
+        latencies.append(time.perf_counter() - started)
+        service.close()
+    return latencies, 0
+
+
+def cached(stand_in, credentials, args):
+    clients = CalendarClientCache(SCOPES, api_root=stand_in.root_url)
+    latencies = []
+    for n in range(args.events):
+        started = time.perf_counter()
+        with clients.client(credentials) as service:
+            insert(service, event(n, "b")).execute()
+        latencies.append(time.perf_counter() - started)
+    return latencies, clients.stats()["builds"]
+
+
+def batched(stand_in, credentials, args):
+    clients = CalendarClientCache(SCOPES, api_root=stand_in.root_url)
+    latencies = []
+    for start in range(0, args.events, args.batch_size):
+        count = min(args.batch_size, args.events - start)
+        started = time.perf_counter()
+        with clients.client(credentials) as service:
+            results = clients.execute_batch(service, [insert(service, event(start + n, "c")) for n in range(count)])
+        assert not any(isinstance(result, Exception) for result in results), results
+        latencies += [(time.perf_counter() - started) / count] * count
+    return latencies, clients.stats()["builds"]
+
+
+def run(scenario, args):
+    stand_in = CalendarAPIStandIn(latency_ms=args.latency_ms).start()
+    credentials = service_account_json(stand_in.root_url + "token")
+    try:
+        started = time.perf_counter()
+        latencies, builds = scenario(stand_in, credentials, args)
+        seconds = time.perf_counter() - started
+    finally:
+        stand_in.stop()
+    assert stand_in.calendar.event_count() == args.events
+    latencies.sort()
+    return {"per_event_ms": {"mean": round(sum(latencies) / len(latencies) * 1000, 2),
+                             "p50": round(latencies[len(latencies) // 2] * 1000, 2),
+                             "p99": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000, 2)},
+            "events_per_second": round(args.events / seconds, 1),
+            "api_round_trips": stand_in.calendar.calls, "token_requests": stand_in.token_requests,
+            "client_builds": builds if scenario is not uncached else args.events}
+
+
+def main(args):
+    results = {"config": {"events": args.events, "batch_size": args.batch_size, "latency_ms": args.latency_ms}}
+    for scenario in (uncached, cached, batched):
+        results[scenario.__name__] = run(scenario, args)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=20, help="events per batched accept run")
+    parser.add_argument("--latency-ms", type=float, default=0, help="delay of each API round trip")
+    main(parser.parse_args())
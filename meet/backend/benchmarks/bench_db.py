@@ -0,0 +1,176 @@
+# bench_db.py
+#
+# Endpoint latency of the booking API as appointments pile up. For each size
+# a scratch database is filled with that many appointments for a fixed set of
+# therapists (mostly past, completed history) and the slots, search, dashboard, book
+# and accept endpoints are timed in-process, first without the secondary
+# indexes and then after init_db() has created them. Slot lookups bypass the
+# availability cache so every call hits the database.
+#
+#   cd meet/backend
+#   python benchmarks/bench_db.py --sizes 10000,100000,1000000
+
+import argparse
+import contextlib
+from datetime import date, timedelta
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TIMES = [f"{hour:02d}:00" for hour in range(9, 17)]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def populate(main, size, therapists, rng):
+    """Upcoming weeks about half booked (pending or accepted) and, behind
+    them, as much completed/cancelled history as `size` needs."""
+    per_therapist = size // therapists
+    today = date.today()
+    upcoming = [(today + timedelta(days=n)).isoformat() for n in range(1, 61) if (today + timedelta(days=n)).weekday() < 5]
+
+    with main.pool.connection() as conn:
+        conn.executemany("INSERT INTO therapists (name, email, specialization, bio) VALUES (?, ?, ?, ?)",
+                         [(f"Therapist {n}", f"t{n}@example.com", rng.choice(["Anxiety", "Depression", "Trauma"]),
+                           None) for n in range(therapists)])
+        conn.executemany("INSERT INTO available_slots (therapist_id, day_of_week, start_time, end_time) "
+                         "VALUES (?, ?, '09:00', '17:00')",
+                         [(t, d) for t in range(1, therapists + 1) for d in range(5)])
+        for therapist_id in range(1, therapists + 1):
+            rows = [(day, time, rng.choice(["pending", "accepted", "accepted"]))
+                    for day in upcoming for time in TIMES if rng.random() < 0.5][:per_therapist]
+            day = today
+            while len(rows) < per_therapist:
+                day -= timedelta(days=1)
+                if day.weekday() < 5:
+                    rows += [(day.isoformat(), time, "cancelled" if rng.random() < 0.15 else "completed")
+                             for time in TIMES][:per_therapist - len(rows)]
+            conn.executemany("""
+                INSERT INTO appointments (therapist_id, client_name, client_email, scheduled_date,
+                                          scheduled_time, status, issues_tags)
+                VALUES (?, 'Client', 'client@example.com', ?, ?, ?, '[]')
+            """, [(therapist_id, day, time, status) for day, time, status in rows])
+
+
+def measure(requests, repeat):
+    latencies = []
+    for _ in range(repeat):
+        prepare, send = next(requests)
+        prepare()
+        started = time.perf_counter()
+        response = send()
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code < 500, response.text
+    return {"p50_ms": round(percentile(latencies, 50) * 1000, 3), "p99_ms": round(percentile(latencies, 99) * 1000, 3)}
+
+
+def worker(args):
+    """Runs in a fresh process with DB_PATH set; prints one JSON result."""
+    sys.path.insert(0, BACKEND_DIR)
+    started = time.perf_counter()
+    import main
+    from fastapi.testclient import TestClient
+    init_seconds = time.perf_counter() - started
+
+    rng = random.Random(args.size)
+    with main.pool.connection() as conn:
+        empty = conn.execute("SELECT COUNT(*) FROM appointments").fetchone()[0] == 0
+    if empty:
+        for index in ("idx_appointments_therapist_day", "idx_appointments_therapist_status",
+                      "idx_available_slots_therapist_day"):
+            with main.pool.connection() as conn:
+                conn.execute(f"DROP INDEX IF EXISTS {index}")
+        populate(main, args.size, args.therapists, rng)
+    with main.pool.connection() as conn:
+        therapists = conn.execute("SELECT COUNT(*) FROM therapists").fetchone()[0]
+        pending = [row[0] for row in conn.execute("SELECT id FROM appointments WHERE status = 'pending'")]
+        indexes = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE name LIKE 'idx_%'")]
+    rng.shuffle(pending)
+
+    client = TestClient(main.app)
+    upcoming = [date.today() + timedelta(days=n) for n in range(2, 60) if (date.today() + timedelta(days=n)).weekday() < 5]
+    noop = lambda: None
+
+    def slots():
+        while True:
+            therapist_id, day = rng.randint(1, therapists), rng.choice(upcoming)
+            yield (lambda: main.availability.invalidate(therapist_id),
+                   lambda: client.get(f"/therapists/{therapist_id}/slots", params={"date": day.isoformat()}))
+
+    def search():
+        while True:
+            day = rng.choice(upcoming)
+            yield noop, lambda: client.get("/availability/search", params={
+                "start_date": day.isoformat(), "end_date": (day + timedelta(days=13)).isoformat(), "limit": 50})
+
+    def dashboard():
+        while True:
+            therapist_id = rng.randint(1, therapists)
+            yield noop, lambda: client.get(f"/therapist/{therapist_id}/dashboard")
+
+    def book():
+        while True:
+            yield noop, lambda: client.post("/book", json={
+                "therapist_id": rng.randint(1, therapists), "client_name": "Bench", "client_email": "b@example.com",
+                "scheduled_date": rng.choice(upcoming).isoformat(), "scheduled_time": rng.choice(TIMES)})
+
+    def accept():
+        for appointment_id in pending:
+            yield noop, lambda: client.post("/therapist/accept", json={"appointment_id": appointment_id})
+
+    results = {"appointments": args.size, "therapists": therapists, "indexes": indexes,
+               "startup_seconds": round(init_seconds, 2), "endpoints": {}}
+    # accept() logs calendar/email failures (no credentials here); keep them out of the output
+    with contextlib.redirect_stdout(io.StringIO()):
+        for name, requests in (("slots", slots()), ("search", search()), ("dashboard", dashboard()),
+                               ("book", book()), ("accept", accept())):
+            results["endpoints"][name] = measure(requests, min(args.repeat, len(pending)) if name == "accept"
+                                                 else args.repeat)
+    print(json.dumps(results))
+
+
+def run(size, db_path, args):
+    env = dict(os.environ, DB_PATH=db_path)
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--worker", "--size", str(size),
+                             "--therapists", str(args.therapists), "--repeat", str(args.repeat)],
+                            env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main(args):
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (int(s) for s in args.sizes.split(",")):
+            db_path = os.path.join(tmp, f"bench_{size}.db")
+            # First run fills the database without indexes, the second gets
+            # them from init_db() on startup (startup_seconds includes the build)
+            before = run(size, db_path, args)
+            after = run(size, db_path, args)
+            report[size] = {"no_indexes": before, "indexed": after}
+            print(f"{size}: " + ", ".join(f"{name} {before['endpoints'][name]['p50_ms']} -> "
+                                          f"{after['endpoints'][name]['p50_ms']} ms"
+                                          for name in after["endpoints"]), file=sys.stderr)
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(db_path + suffix):
+                    os.unlink(db_path + suffix)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="appointment counts")
+    parser.add_argument("--therapists", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    worker(args) if args.worker else main(args)
@@ -0,0 +1,109 @@
+# bench_mailer.py
+#
+# Confirmation email throughput against the local SMTP stand-in, which can
+# delay its greeting and login to mimic the round trips (TCP, STARTTLS, AUTH)
+# of a remote provider. Three ways of sending the same messages:
+#
+#   per_message - a new connection and login for every message (what
+#                 send_email used to do)
+#   pooled      - Mailer.send from `--threads` threads sharing the pool
+#   batched     - Mailer.send_batch, `--batch-size` messages per call, as the
+#                 outbox worker sends queued emails
+#
+# Prints one JSON document with messages/second, connections and logins.
+#
+#   cd meet/backend
+#   python benchmarks/bench_mailer.py --messages 500 --handshake-latency-ms 50
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import smtplib
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fakes import SMTPStandIn  # noqa: E402
+from mailer import EmailTemplate, Mailer  # noqa: E402
+
+TEMPLATE = EmailTemplate("Therapy Appointment Confirmed", """
+    <h2>Appointment Confirmed!</h2>
+    <p>Dear {client_name},</p>
+    <p><strong>Date:</strong> {sched_date}</p>
+    <p><strong>Google Meet Link:</strong> <a href="{meet_link}">{meet_link}</a></p>
+    """)
+
+
+def messages(mailer, count):
+    out = []
+    for n in range(count):
+        subject, body = TEMPLATE.render(client_name=f"Client {n}", sched_date="2026-11-02",
+                                        meet_link=f"https://meet.google.com/bench-{n}")
+        out.append(mailer.build(f"client{n}@example.com", subject, body, f"<bench-{n}@wellmind>"))
+    return out
+
+
+def per_message(server, args, batch):
+    def send(message):
+        with smtplib.SMTP(server.host, server.port, timeout=30) as smtp:
+            smtp.login("bench", "bench")
+            smtp.send_message(message)
+
+    with ThreadPoolExecutor(args.threads) as executor:
+        list(executor.map(send, batch))
+
+
+def pooled(mailer, args, batch):
+    with ThreadPoolExecutor(args.threads) as executor:
+        list(executor.map(mailer.send, batch))
+
+
+def batched(mailer, args, batch):
+    chunks = [batch[i:i + args.batch_size] for i in range(0, len(batch), args.batch_size)]
+    with ThreadPoolExecutor(args.pool_size) as executor:
+        for results in executor.map(mailer.send_batch, chunks):
+            assert not any(results), results
+
+
+def run(name, args):
+    server = SMTPStandIn(latency_ms=args.latency_ms, handshake_latency_ms=args.handshake_latency_ms).start()
+    mailer = Mailer(server.host, server.port, "bench", "bench", starttls=False, pool_size=args.pool_size)
+    batch = messages(mailer, args.messages)
+    try:
+        started = time.perf_counter()
+        if name == "per_message":
+            per_message(server, args, batch)
+        elif name == "pooled":
+            pooled(mailer, args, batch)
+        else:
+            batched(mailer, args, batch)
+        seconds = time.perf_counter() - started
+    finally:
+        mailer.close()
+        server.stop()
+    assert len(server.messages) == args.messages, (name, len(server.messages))
+    return {"messages_per_second": round(args.messages / seconds, 1), "seconds": round(seconds, 3),
+            "connections": server.connections, "logins": server.logins}
+
+
+def main(args):
+    results = {"config": {"messages": args.messages, "threads": args.threads, "pool_size": args.pool_size,
+                          "batch_size": args.batch_size, "handshake_latency_ms": args.handshake_latency_ms,
+                          "latency_ms": args.latency_ms}}
+    for name in ("per_message", "pooled", "batched"):
+        results[name] = run(name, args)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--threads", type=int, default=4, help="concurrent senders (per_message, pooled)")
+    parser.add_argument("--pool-size", type=int, default=2, help="Mailer sessions")
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--handshake-latency-ms", type=float, default=50,
+                        help="delay of the stand-in's greeting and login")
+    parser.add_argument("--latency-ms", type=float, default=0, help="delay of each accepted message")
+    main(parser.parse_args())
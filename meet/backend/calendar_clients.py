@@ -0,0 +1,122 @@
+# calendar_clients.py
+#
+# Google Calendar clients cached per therapist. Building one means parsing
+# the service-account JSON, creating credentials, loading the (large)
+# discovery document and, on first use, fetching an access token; a cached
+# client skips all of that and keeps its token (refreshed by google-auth when
+# it expires) and its HTTP connection. Clients are built from the discovery
+# document bundled with google-api-python-client, never fetched, and are
+# dropped after `ttl_seconds` or when the cache is full.
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import hashlib
+import json
+import threading
+import time
+
+from google.oauth2 import service_account
+from googleapiclient.discovery import build
+from googleapiclient.http import BatchHttpRequest
+
+# Most requests the Calendar API accepts in one batch
+BATCH_LIMIT = 50
+
+
+class _Client:
+    def __init__(self):
+        self.service = None
+        self.created = time.monotonic()
+        self.lock = threading.Lock()
+
+
+class CalendarClientCache:
+    """Calendar clients keyed by the credentials they were built from, so
+    a therapist who updates their credentials gets a new client. `api_root`
+    points the clients at another server (e.g. fakes.CalendarAPIStandIn)."""
+
+    def __init__(self, scopes, ttl_seconds=3600, max_clients=256, api_root=None):
+        self.scopes = scopes
+        self.ttl_seconds = ttl_seconds
+        self.max_clients = max_clients
+        self.api_root = api_root
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.builds = self.evictions = 0
+
+    def _entry(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is not None and now - entry.created < self.ttl_seconds:
+                self._clients.move_to_end(key)
+                self.hits += 1
+                return entry
+            entry = self._clients[key] = _Client()
+            self._clients.move_to_end(key)
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+                self.evictions += 1
+            self.misses += 1
+            return entry
+
+    def _build(self, credentials_json):
+        try:
+            creds = service_account.Credentials.from_service_account_info(
+                json.loads(credentials_json), scopes=self.scopes
+            )
+            client_options = {"api_endpoint": self.api_root + "calendar/v3/"} if self.api_root else None
+            service = build('calendar', 'v3', credentials=creds, static_discovery=True, cache_discovery=False,
+                            client_options=client_options)
+        except Exception as e:
+            print(f"Calendar service error: {e}")
+            return None
+        with self._lock:
+            self.builds += 1
+        return service
+
+    @contextmanager
+    def client(self, credentials_json):
+        """The client for these credentials, or None if they are unusable.
+        It is held exclusively for the block: its httplib2 connection is
+        not thread-safe."""
+        if not credentials_json:
+            yield None
+            return
+        entry = self._entry(hashlib.sha256(credentials_json.encode()).hexdigest())
+        with entry.lock:
+            if entry.service is None:
+                # Failed builds aren't kept, so the next call tries again
+                entry.service = self._build(credentials_json)
+            yield entry.service
+
+    def execute_batch(self, service, requests):
+        """Run `requests` (HttpRequests of `service`) in as few batch
+        requests as the API allows. Returns one entry per request: the
+        response, or the exception it failed with."""
+        results = [None] * len(requests)
+
+        def collect(request_id, response, exception):
+            results[int(request_id)] = response if exception is None else exception
+
+        for start in range(0, len(requests), BATCH_LIMIT):
+            if self.api_root:
+                batch = BatchHttpRequest(callback=collect, batch_uri=self.api_root + "batch/calendar/v3")
+            else:
+                batch = service.new_batch_http_request(callback=collect)
+            chunk = range(start, min(start + BATCH_LIMIT, len(requests)))
+            for i in chunk:
+                batch.add(requests[i], request_id=str(i))
+            try:
+                batch.execute()
+            except Exception as e:
+                for i in chunk:
+                    results[i] = e
+        return results
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"clients": len(self._clients), "max_clients": self.max_clients, "hits": self.hits,
+                    "misses": self.misses, "builds": self.builds, "evictions": self.evictions,
+                    "hit_rate": round(self.hits / lookups, 3) if lookups else None}
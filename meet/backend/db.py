@@ -0,0 +1,109 @@
+# db.py
+#
+# Shared SQLite access for the booking backend: a small pool of long-lived
+# connections in WAL mode (readers never wait on the writer), each with its
+# own prepared-statement cache, so endpoints stop paying connect + schema
+# parse + statement compile on every request.
+
+from contextlib import contextmanager
+import queue
+import sqlite3
+import threading
+
+# Composite indexes for the hot lookups; created by init_db()
+INDEXES = [
+    # Booked times of one therapist on one day (slots, availability, booking);
+    # status is included so these lookups never touch the table
+    """CREATE INDEX IF NOT EXISTS idx_appointments_therapist_day
+       ON appointments (therapist_id, scheduled_date, scheduled_time, status)""",
+    # Dashboard: a therapist's appointments in one status, in schedule order
+    """CREATE INDEX IF NOT EXISTS idx_appointments_therapist_status
+       ON appointments (therapist_id, status, scheduled_date, scheduled_time)""",
+    # At most one live (not cancelled) booking per therapist, day and time;
+    # this is what makes /book safe under concurrent requests
+    """CREATE UNIQUE INDEX IF NOT EXISTS idx_appointments_active_slot
+       ON appointments (therapist_id, scheduled_date, scheduled_time) WHERE status != 'cancelled'""",
+    # Outbox jobs that are due, in order
+    """CREATE INDEX IF NOT EXISTS idx_outbox_due
+       ON outbox (status, next_attempt_at)""",
+    # Weekly templates of one therapist
+    """CREATE INDEX IF NOT EXISTS idx_available_slots_therapist_day
+       ON available_slots (therapist_id, day_of_week)""",
+]
+
+
+class ConnectionPool:
+    """Up to `size` connections shared between threads; a caller that finds
+    them all busy waits up to `timeout` seconds for one to come back."""
+
+    def __init__(self, path, size=8, timeout=30):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._created = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if create:
+            try:
+                return self._connect()
+            except BaseException:
+                with self._lock:
+                    self._created -= 1
+                raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError("Timed out waiting for a database connection") from None
+
+    @contextmanager
+    def connection(self):
+        """A pooled connection; the block's writes are committed when it
+        exits normally and rolled back if it raises."""
+        conn = self._acquire()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """A pooled connection inside BEGIN IMMEDIATE, for read-then-write
+        blocks. Writers of this process queue on a lock rather than in
+        SQLite's busy handler, which backs off by sleeping."""
+        with self._write_lock:
+            with self.connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                yield conn
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._created -= 1
+
+    def stats(self):
+        return {"size": self.size, "open": self._created, "idle": self._idle.qsize()}
@@ -0,0 +1,416 @@
+# fakes.py
+#
+# Local stand-ins for the external services, for running the booking flow
+# end to end without Google or a mail account:
+#
+#   FakeCalendarService - the slice of the Calendar v3 client used here
+#                         (events().insert/get/delete(...).execute() and
+#                         batches);
+#                         selected with CALENDAR_BACKEND=fake
+#   CalendarAPIStandIn  - the same calendar behind HTTP, with an OAuth token
+#                         endpoint, for driving the real googleapiclient
+#                         client (point CALENDAR_API_ROOT and the service
+#                         account's token_uri at it)
+#   SMTPStandIn         - a tiny SMTP server that accepts any login and keeps
+#                         the messages it receives (no STARTTLS, so run the
+#                         API with SMTP_STARTTLS=0)
+#
+#   cd meet/backend
+#   python fakes.py smtp --port 1025 --maildir /tmp/wellmind-mail
+#   python fakes.py calendar --port 8085
+#
+# Both can inject latency and transient failures to exercise retries (the
+# calendar also "loses" responses to calls that succeeded).
+
+import argparse
+import email
+from email import policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import random
+import re
+import socketserver
+import threading
+import time
+import urllib.parse
+import uuid
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+
+# Client-supplied event ids the real API accepts (base32hex)
+EVENT_ID = re.compile(r"[a-v0-9]{5,1024}")
+
+
+def http_error(status, reason):
+    return HttpError(httplib2.Response({"status": status, "reason": reason}), reason.encode(), uri="fake://calendar")
+
+
+class _Request:
+    def __init__(self, call, service):
+        self._call = call
+        self._service = service
+
+    def execute(self, num_retries=0):
+        return self._service._run(self._call)
+
+
+class _Batch:
+    """One round trip for all the added requests, each of which can still
+    fail on its own."""
+
+    def __init__(self, service, callback):
+        self._service = service
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self._requests.append((str(len(self._requests)) if request_id is None else request_id, request,
+                               callback or self._callback))
+
+    def execute(self):
+        self._service._round_trip()
+        for request_id, request, callback in self._requests:
+            try:
+                response, error = self._service._outcome(request._call), None
+            except HttpError as e:
+                response, error = None, e
+            if callback is not None:
+                callback(request_id, response, error)
+
+
+class _Events:
+    def __init__(self, service):
+        self._service = service
+
+    def insert(self, calendarId, body, conferenceDataVersion=0, sendUpdates=None):
+        return _Request(lambda: self._service._insert(calendarId, body), self._service)
+
+    def get(self, calendarId, eventId):
+        return _Request(lambda: self._service._get(calendarId, eventId), self._service)
+
+    def delete(self, calendarId, eventId, sendUpdates=None):
+        return _Request(lambda: self._service._delete(calendarId, eventId), self._service)
+
+
+class FakeCalendarService:
+    """In-memory calendar. Like the real API, inserting an event whose
+    client-supplied id isn't base32hex fails with 400, and one whose id
+    already exists with 409."""
+
+    def __init__(self, latency_ms=0.0, failure_rate=0.0):
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.calendars = {}  # calendar id -> {event id: event}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def events(self):
+        return _Events(self)
+
+    def new_batch_http_request(self, callback=None):
+        return _Batch(self, callback)
+
+    def _run(self, call):
+        self._round_trip()
+        return self._outcome(call)
+
+    def _round_trip(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+
+    def _outcome(self, call):
+        if self.failure_rate and random.random() < self.failure_rate:
+            # Half the failures happen after the call went through, as when
+            # a response is lost on the way back
+            if random.random() < 0.5:
+                call()
+            raise http_error(503, "Backend Error")
+        return call()
+
+    def _insert(self, calendar_id, body):
+        with self._lock:
+            events = self.calendars.setdefault(calendar_id, {})
+            event_id = body.get("id") or uuid.uuid4().hex
+            if not EVENT_ID.fullmatch(event_id):
+                raise http_error(400, "Invalid resource id value.")
+            if event_id in events:
+                raise http_error(409, "The requested identifier already exists.")
+            event = dict(body, id=event_id, status="confirmed",
+                         hangoutLink=f"https://meet.google.com/fake-{event_id[:10]}")
+            events[event_id] = event
+            return event
+
+    def _get(self, calendar_id, event_id):
+        with self._lock:
+            event = self.calendars.get(calendar_id, {}).get(event_id)
+        if event is None:
+            raise http_error(404, "Not Found")
+        return event
+
+    def _delete(self, calendar_id, event_id):
+        with self._lock:
+            if self.calendars.get(calendar_id, {}).pop(event_id, None) is None:
+                raise http_error(404, "Not Found")
+        return ""
+
+    def event_count(self):
+        with self._lock:
+            return sum(len(events) for events in self.calendars.values())
+
+
+class _CalendarAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _send(self, status, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        stand_in = self.server.stand_in
+        path = urllib.parse.urlparse(self.path).path
+        if path == "/token":
+            self._body()
+            with stand_in._lock:
+                stand_in.token_requests += 1
+            self._send(200, {"access_token": uuid.uuid4().hex, "expires_in": 3600, "token_type": "Bearer"})
+        elif path == "/batch/calendar/v3":
+            self._send(200, *self._batch(self.headers["Content-Type"], self._body()))
+        else:
+            self._send(*self._call("POST", path, self._body(), round_trip=True))
+
+    def do_GET(self):
+        self._send(*self._call("GET", urllib.parse.urlparse(self.path).path, b"", round_trip=True))
+
+    def do_DELETE(self):
+        status, response = self._call("DELETE", urllib.parse.urlparse(self.path).path, b"", round_trip=True)
+        self._send(204 if status == 200 else status, b"" if status == 200 else response)
+
+    def _call(self, method, path, body, round_trip):
+        """(status, response) of one Calendar API call"""
+        calendar = self.server.stand_in.calendar
+        parts = [urllib.parse.unquote(part) for part in path.strip("/").split("/")]
+        if parts[:3] != ["calendar", "v3", "calendars"] or len(parts) < 5 or parts[4] != "events":
+            return 404, {"error": {"code": 404, "message": "Not Found"}}
+        if method == "POST" and len(parts) == 5:
+            call = lambda: calendar._insert(parts[3], json.loads(body))  # noqa: E731
+        elif method == "GET" and len(parts) == 6:
+            call = lambda: calendar._get(parts[3], parts[5])  # noqa: E731
+        elif method == "DELETE" and len(parts) == 6:
+            call = lambda: calendar._delete(parts[3], parts[5])  # noqa: E731
+        else:
+            return 405, {"error": {"code": 405, "message": "Method Not Allowed"}}
+        try:
+            return 200, calendar._run(call) if round_trip else calendar._outcome(call)
+        except HttpError as e:
+            return e.resp.status, {"error": {"code": e.resp.status, "message": e.resp.reason}}
+
+    def _batch(self, content_type, body):
+        """multipart/mixed response to a multipart/mixed batch request"""
+        self.server.stand_in.calendar._round_trip()
+        request = email.message_from_bytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+        boundary = uuid.uuid4().hex
+        out = []
+        for part in request.get_payload():
+            status_line, rest = part.get_payload().split("\n", 1)
+            method, target, _ = status_line.split(" ", 2)
+            inner = email.message_from_string(rest)
+            status, response = self._call(method, urllib.parse.urlparse(target).path,
+                                          inner.get_payload().encode(), round_trip=False)
+            content_id = part["Content-ID"].replace("<", "<response-", 1)
+            out.append(f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: {content_id}\r\n\r\n"
+                       f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                       f"Content-Type: application/json\r\n\r\n{json.dumps(response)}\r\n")
+        out.append(f"--{boundary}--\r\n")
+        return "".join(out).encode(), f"multipart/mixed; boundary={boundary}"
+
+
+class CalendarAPIStandIn:
+    """Calendar v3 events insert/get/delete, batch requests and an OAuth token
+    endpoint over HTTP on a background thread, backed by a
+    FakeCalendarService (`calendar`) that adds its latency per round trip."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=0.0, failure_rate=0.0):
+        self.calendar = FakeCalendarService(latency_ms, failure_rate)
+        self.token_requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _CalendarAPIHandler)
+        self._server.daemon_threads = True
+        self._server.stand_in = self
+        self.host, self.port = self._server.server_address[:2]
+        self.root_url = f"http://{self.host}:{self.port}/"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="calendar-stand-in").start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    # Replies are written line by line; don't let Nagle hold them back
+    disable_nagle_algorithm = True
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        server = self.server.stand_in
+        if server.handshake_latency_ms:
+            time.sleep(server.handshake_latency_ms / 1000)
+        self.reply("220 wellmind-smtp-stand-in ESMTP")
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip()
+            verb = command.split(" ", 1)[0].upper()
+            if verb in ("EHLO", "HELO"):
+                self.reply("250-wellmind-smtp-stand-in")
+                self.reply("250 AUTH PLAIN LOGIN")
+            elif verb == "AUTH":
+                parts = command.split()
+                if len(parts) == 2 and parts[1].upper() == "LOGIN":
+                    # Username and password prompts; any values are accepted
+                    for _ in range(2):
+                        self.reply("334 ")
+                        self.rfile.readline()
+                elif len(parts) == 2:
+                    self.reply("334 ")
+                    self.rfile.readline()
+                if server.handshake_latency_ms:
+                    time.sleep(server.handshake_latency_ms / 1000)
+                server.logins += 1
+                self.reply("235 Authentication successful")
+            elif verb == "MAIL":
+                sender, recipients = command[10:].strip("<> "), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command[8:].strip("<> "))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = bytearray()
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk in (b".\r\n", b".\n"):
+                        break
+                    data += chunk[1:] if chunk.startswith(b"..") else chunk
+                if server.latency_ms:
+                    time.sleep(server.latency_ms / 1000)
+                if server.failure_rate and random.random() < server.failure_rate:
+                    self.reply("451 Temporary failure, try again later")
+                else:
+                    server.deliver(sender, recipients, bytes(data))
+                    self.reply("250 OK: queued")
+            elif verb == "RSET":
+                sender, recipients = None, []
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPStandIn:
+    """SMTP server on a background thread. Received messages are kept in
+    `messages` (and written to `maildir` as .eml files if given).
+    `handshake_latency_ms` delays the greeting and the login, standing in
+    for the round trips of connecting to a remote server."""
+
+    def __init__(self, host="127.0.0.1", port=0, maildir=None, latency_ms=0.0, failure_rate=0.0,
+                 handshake_latency_ms=0.0):
+        self.maildir = maildir
+        self.latency_ms = latency_ms
+        self.handshake_latency_ms = handshake_latency_ms
+        self.failure_rate = failure_rate
+        self.messages = []
+        self.connections = 0
+        self.logins = 0
+        self._lock = threading.Lock()
+        self._server = _ThreadingTCPServer((host, port), _SMTPHandler)
+        self._server.stand_in = self
+        self.host, self.port = self._server.server_address[:2]
+        if maildir:
+            os.makedirs(maildir, exist_ok=True)
+
+    def deliver(self, sender, recipients, data):
+        message = email.message_from_bytes(data, policy=policy.default)
+        with self._lock:
+            self.messages.append({"from": sender, "to": recipients, "message": message})
+            count = len(self.messages)
+        if self.maildir:
+            with open(os.path.join(self.maildir, f"{count:06d}.eml"), "wb") as f:
+                f.write(data)
+
+    def start(self):
+        self._server.verify_request = self._count_connection
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="smtp-stand-in").start()
+        return self
+
+    def _count_connection(self, request, client_address):
+        with self._lock:
+            self.connections += 1
+        return True
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="service", required=True)
+    smtp = sub.add_parser("smtp", help="run the SMTP stand-in")
+    smtp.add_argument("--host", default="127.0.0.1")
+    smtp.add_argument("--port", type=int, default=1025)
+    smtp.add_argument("--maildir", help="also save received messages here")
+    smtp.add_argument("--latency-ms", type=float, default=0)
+    smtp.add_argument("--failure-rate", type=float, default=0)
+    smtp.add_argument("--handshake-latency-ms", type=float, default=0)
+    calendar = sub.add_parser("calendar", help="run the Calendar API stand-in")
+    calendar.add_argument("--host", default="127.0.0.1")
+    calendar.add_argument("--port", type=int, default=8085)
+    calendar.add_argument("--latency-ms", type=float, default=0)
+    calendar.add_argument("--failure-rate", type=float, default=0)
+    args = parser.parse_args()
+
+    if args.service == "smtp":
+        server = SMTPStandIn(args.host, args.port, args.maildir, args.latency_ms, args.failure_rate,
+                             args.handshake_latency_ms).start()
+        print(f"SMTP stand-in listening on {server.host}:{server.port}", flush=True)
+    else:
+        server = CalendarAPIStandIn(args.host, args.port, args.latency_ms, args.failure_rate).start()
+        print(f"Calendar API stand-in at {server.root_url} (token_uri {server.root_url}token)", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
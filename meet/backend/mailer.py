@@ -0,0 +1,225 @@
+# mailer.py
+#
+# Outgoing email over a small pool of authenticated SMTP sessions. Opening a
+# session (TCP connect, STARTTLS, login) costs several round trips, so
+# sessions are kept and reused: a batch of messages goes out on one session,
+# a session that went stale is replaced transparently, and each session is
+# recycled after a number of messages (providers cap this). Templates are
+# parsed once and only the per-recipient fields are filled in per message.
+
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+import html
+import queue
+import smtplib
+from string import Formatter
+import threading
+import time
+
+# Errors after which a session can't be trusted and is replaced
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, OSError)
+
+
+def _dropped(error):
+    """True if `error` means the connection is gone, rather than the server
+    refusing a message (SMTPException subclasses OSError)."""
+    return isinstance(error, smtplib.SMTPServerDisconnected) or not isinstance(error, smtplib.SMTPException)
+
+
+class EmailTemplate:
+    """Subject and HTML body with {field} placeholders, parsed once. Field
+    values are HTML-escaped in the body."""
+
+    def __init__(self, subject, body):
+        self._subject = self._parse(subject)
+        self._body = self._parse(body)
+
+    @staticmethod
+    def _parse(text):
+        return [(literal, field) for literal, field, _, _ in Formatter().parse(text)]
+
+    @staticmethod
+    def _fill(parts, fields, escape):
+        out = []
+        for literal, field in parts:
+            out.append(literal)
+            if field is not None:
+                value = str(fields[field])
+                out.append(html.escape(value) if escape else value)
+        return "".join(out)
+
+    def render(self, **fields):
+        """(subject, body) for these fields."""
+        return self._fill(self._subject, fields, False), self._fill(self._body, fields, True)
+
+
+class _Session:
+    def __init__(self, smtp):
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+
+class Mailer:
+    """Thread-safe sender keeping up to `pool_size` SMTP sessions open."""
+
+    def __init__(self, host, port, username, password, sender=None, starttls=True, pool_size=2, timeout=30,
+                 max_messages_per_session=100, idle_check_seconds=30):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.sender = sender or username
+        self.starttls = starttls
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_messages_per_session = max_messages_per_session
+        self.idle_check_seconds = idle_check_seconds
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+        self.counters = {"sent": 0, "failed": 0, "batches": 0, "sessions_opened": 0, "reconnects": 0,
+                         "send_seconds": 0.0}
+
+    def _count(self, **increments):
+        with self._lock:
+            for name, value in increments.items():
+                self.counters[name] += value
+
+    # --- sessions ---
+
+    def _open(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            smtp.login(self.username, self.password)
+        except BaseException:
+            smtp.close()
+            raise
+        self._count(sessions_opened=1)
+        return _Session(smtp)
+
+    @staticmethod
+    def _close(session):
+        try:
+            session.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            session.smtp.close()
+
+    def _checkout(self):
+        """An open session; blocks while all `pool_size` are in use."""
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    session = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._open()
+                if time.monotonic() - session.last_used < self.idle_check_seconds:
+                    return session
+                # Idle for a while: the server may have dropped it
+                try:
+                    if session.smtp.noop()[0] == 250:
+                        return session
+                except CONNECTION_ERRORS:
+                    pass
+                session.smtp.close()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _checkin(self, session, healthy):
+        if healthy and session.sent < self.max_messages_per_session:
+            session.last_used = time.monotonic()
+            self._idle.put(session)
+        elif healthy:
+            self._close(session)
+        else:
+            session.smtp.close()
+        self._slots.release()
+
+    # --- sending ---
+
+    def build(self, to_email, subject, body, message_id=None):
+        msg = MIMEMultipart()
+        msg['From'] = self.sender
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        if message_id:
+            msg['Message-ID'] = message_id
+        msg.attach(MIMEText(body, 'html'))
+        return msg
+
+    def _send_on(self, session, message):
+        """Send one message; a dropped session is replaced and the message
+        retried once. Returns the session to keep using."""
+        try:
+            session.smtp.send_message(message)
+        except CONNECTION_ERRORS as e:
+            if not _dropped(e):
+                raise
+            session.smtp.close()
+            self._count(reconnects=1)
+            session = self._open()
+            session.smtp.send_message(message)
+        session.sent += 1
+        return session
+
+    def send_batch(self, messages):
+        """Send messages on one session, in order. Returns one entry per
+        message: None if it was accepted, else the exception it failed with.
+        One refused message doesn't stop the rest."""
+        if not messages:
+            return []
+        started = time.perf_counter()
+        results = []
+        session = self._checkout()
+        healthy = True
+        try:
+            for message in messages:
+                if session.sent >= self.max_messages_per_session:
+                    self._close(session)
+                    session = self._open()
+                try:
+                    session = self._send_on(session, message)
+                    results.append(None)
+                except smtplib.SMTPException as e:
+                    # The server refused this message; the session is fine
+                    results.append(e)
+                    try:
+                        session.smtp.rset()
+                    except CONNECTION_ERRORS:
+                        session.smtp.close()
+                        session = self._open()
+        except BaseException as e:
+            healthy = False
+            results += [e] * (len(messages) - len(results))
+            if not isinstance(e, Exception):
+                raise
+        finally:
+            self._checkin(session, healthy)
+            failed = sum(result is not None for result in results)
+            self._count(sent=len(results) - failed, failed=failed, batches=1,
+                        send_seconds=time.perf_counter() - started)
+        return results
+
+    def send(self, message):
+        """Send one message; raises on failure."""
+        error = self.send_batch([message])[0]
+        if error is not None:
+            raise error
+
+    def close(self):
+        while True:
+            try:
+                self._close(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        seconds = counters.pop("send_seconds")
+        return {**counters, "open_sessions": self._idle.qsize(), "pool_size": self.pool_size,
+                "messages_per_second": round(counters["sent"] / seconds, 1) if seconds else None}
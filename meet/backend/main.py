@@ -1,6 +1,11 @@
 import fastapi
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+import hashlib
 from fastapi import FastAPI, Request, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from datetime import datetime, timedelta
@@ -9,63 +14,39 @@ import os
 from dotenv import load_dotenv
 import json
 
+from availability import SCHEMA as availability_schema, AvailabilityIndex, format_minutes, parse_minutes
+from calendar_clients import CalendarClientCache
+from db import INDEXES, ConnectionPool
+from fakes import FakeCalendarService
+from mailer import EmailTemplate, Mailer
+import outbox
+from outbox import OutboxWorker, PermanentError, enqueue
+
 # Google APIs
 from google.oauth2.credentials import Credentials
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
 from google.auth.transport.requests import Request as GoogleRequest
+from googleapiclient.errors import HttpError
 import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 
 load_dotenv()
-app = FastAPI()
-
-from datetime import datetime, timedelta
-
-@app.get("/therapists/{therapist_id}/slots")
-async def get_available_slots(therapist_id: int, date: str):
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    target_date = datetime.fromisoformat(date)
-    day_of_week = target_date.weekday()
-
-    # Get therapist's available time slots
-    cursor.execute("""
-        SELECT start_time, end_time FROM available_slots 
-        WHERE therapist_id = ? AND day_of_week = ? AND is_available = 1
-    """, (therapist_id, day_of_week))
-    slots = cursor.fetchall()
 
-    # Get booked appointments for that date
-    cursor.execute("""
-        SELECT scheduled_time FROM appointments 
-        WHERE therapist_id = ? AND scheduled_date = ? AND status != 'cancelled'
-    """, (therapist_id, date))
-    booked_times = [row[0] for row in cursor.fetchall()]
-    conn.close()
-
-    # Filter out slots within next 24 hours
-    now = datetime.utcnow()
-    cutoff = now + timedelta(hours=24)
-
-    available_slots = []
-    for start, end in slots:
-        current = datetime.strptime(start, "%H:%M")
-        end_time = datetime.strptime(end, "%H:%M")
-
-        while current < end_time:
-            time_str = current.strftime("%H:%M")
-            slot_datetime = datetime.combine(target_date.date(), current.time())
-
-            if time_str not in booked_times and slot_datetime > cutoff:
-                available_slots.append(time_str)
-
-            current += timedelta(hours=1)
-
-    return {"available_slots": available_slots}
+@asynccontextmanager
+async def lifespan(app):
+    global calendar_executor
+    calendar_executor = ThreadPoolExecutor(CALENDAR_CONCURRENCY)
+    # Drains calendar/email jobs queued by the endpoints
+    task = asyncio.create_task(outbox_worker.run())
+    yield
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    calendar_executor.shutdown(wait=False)
+    if mailer is not None:
+        mailer.close()
 
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -75,7 +56,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-DB_PATH = "therapy_booking.db"
+DB_PATH = os.getenv("DB_PATH", "therapy_booking.db")
+
+pool = ConnectionPool(DB_PATH, size=int(os.getenv("DB_POOL_SIZE", "8")))
 
 def init_db():
     conn = sqlite3.connect(DB_PATH)
@@ -127,11 +110,39 @@ def init_db():
     )
     """)
     
+    # Side effects waiting to run (see outbox.py)
+    cursor.execute(outbox.SCHEMA)
+    
+    # Schedule change counter shared by all processes (see availability.py)
+    for statement in availability_schema:
+        cursor.execute(statement)
+    
+    for index in INDEXES:
+        try:
+            cursor.execute(index)
+        except sqlite3.IntegrityError as e:
+            # Existing double bookings; /book still checks before inserting
+            print(f"Could not create index, resolve duplicate bookings first: {e}")
+    
     conn.commit()
     conn.close()
 
 init_db()
 
+# Slots inside this window can no longer be booked
+BOOKING_NOTICE_HOURS = float(os.getenv("BOOKING_NOTICE_HOURS", "24"))
+
+# Free slots offered when a booking loses the race for its slot
+BOOKING_ALTERNATIVES = int(os.getenv("BOOKING_ALTERNATIVES", "5"))
+BOOKING_ALTERNATIVE_DAYS = int(os.getenv("BOOKING_ALTERNATIVE_DAYS", "14"))
+
+# Limits for /availability/search
+SEARCH_MAX_DAYS = int(os.getenv("SEARCH_MAX_DAYS", "62"))
+SEARCH_PAGE_MAX = int(os.getenv("SEARCH_PAGE_MAX", "200"))
+
+# Other workers' changes reach this process's cache within this many seconds
+availability = AvailabilityIndex(pool, sync_seconds=float(os.getenv("AVAILABILITY_SYNC_SECONDS", "1")))
+
 # Models
 class Therapist(BaseModel):
     name: str
@@ -158,115 +169,355 @@ class BookingRequest(BaseModel):
 class AcceptAppointment(BaseModel):
     appointment_id: int
 
+class CancelAppointment(BaseModel):
+    appointment_id: int
+
 # Google Calendar & Meet Integration
 SCOPES = ['https://www.googleapis.com/auth/calendar']
 
-def get_calendar_service(credentials_json):
-    """Get Google Calendar service"""
-    try:
-        creds_dict = json.loads(credentials_json)
-        creds = service_account.Credentials.from_service_account_info(
-            creds_dict, scopes=SCOPES
-        )
-        service = build('calendar', 'v3', credentials=creds)
-        return service
-    except Exception as e:
-        print(f"Calendar service error: {e}")
-        return None
-
-def create_meet_event(therapist_email, client_email, client_name, date, time, therapist_credentials):
-    """Create Google Calendar event with Meet link"""
-    try:
-        service = get_calendar_service(therapist_credentials)
-        if not service:
-            return None, None
-        
-        start_datetime = datetime.fromisoformat(f"{date}T{time}")
-        end_datetime = start_datetime + timedelta(hours=1)
-        
-        event = {
-            'summary': f'Therapy Session - {client_name}',
-            'description': f'Therapy session with {client_name}',
-            'start': {
-                'dateTime': start_datetime.isoformat(),
-                'timeZone': 'UTC',
-            },
-            'end': {
-                'dateTime': end_datetime.isoformat(),
-                'timeZone': 'UTC',
-            },
-            'attendees': [
-                {'email': therapist_email},
-                {'email': client_email},
+# "fake" swaps in the in-memory calendar from fakes.py for local runs
+CALENDAR_BACKEND = os.getenv("CALENDAR_BACKEND", "google")
+fake_calendar = FakeCalendarService(
+    latency_ms=float(os.getenv("FAKE_CALENDAR_LATENCY_MS", "0")),
+    failure_rate=float(os.getenv("FAKE_CALENDAR_FAILURE_RATE", "0"))
+) if CALENDAR_BACKEND == "fake" else None
+
+# Calendar API statuses worth retrying; other errors fall back to a manual link
+RETRYABLE_HTTP_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# Clients are cached per therapist credentials and built from the bundled
+# discovery document; CALENDAR_API_ROOT points them at another server
+calendar_clients = CalendarClientCache(
+    SCOPES,
+    ttl_seconds=float(os.getenv("CALENDAR_CLIENT_TTL_SECONDS", "3600")),
+    max_clients=int(os.getenv("CALENDAR_CLIENT_CACHE_SIZE", "256")),
+    api_root=os.getenv("CALENDAR_API_ROOT"),
+)
+
+# Runs the calendar requests of different therapists side by side; created
+# by lifespan()
+CALENDAR_CONCURRENCY = int(os.getenv("CALENDAR_CONCURRENCY", "4"))
+calendar_executor = None
+
+@contextmanager
+def calendar_service(credentials_json):
+    """The therapist's Google Calendar service, held for the block; None if
+    the credentials are unusable"""
+    if fake_calendar is not None:
+        yield fake_calendar
+        return
+    with calendar_clients.client(credentials_json) as service:
+        yield service
+
+def calendar_event_id(idempotency_key):
+    """Event id derived from the job's idempotency key, so a retried insert
+    can't add a second event. The API only takes base32hex ids (a-v, 0-9):
+    the prefix and the lowercase hex digest both qualify."""
+    return "mind" + hashlib.sha1(idempotency_key.encode()).hexdigest()
+
+def meet_event(therapist_email, client_email, client_name, date, time, idempotency_key):
+    """Calendar event body with a Meet conference"""
+    event_id = calendar_event_id(idempotency_key)
+    start_datetime = datetime.fromisoformat(f"{date}T{time}")
+    end_datetime = start_datetime + timedelta(hours=1)
+    
+    return {
+        'id': event_id,
+        'summary': f'Therapy Session - {client_name}',
+        'description': f'Therapy session with {client_name}',
+        'start': {
+            'dateTime': start_datetime.isoformat(),
+            'timeZone': 'UTC',
+        },
+        'end': {
+            'dateTime': end_datetime.isoformat(),
+            'timeZone': 'UTC',
+        },
+        'attendees': [
+            {'email': therapist_email},
+            {'email': client_email},
+        ],
+        'conferenceData': {
+            'createRequest': {
+                'requestId': event_id,
+                'conferenceSolutionKey': {'type': 'hangoutsMeet'}
+            }
+        },
+        'reminders': {
+            'useDefault': False,
+            'overrides': [
+                {'method': 'email', 'minutes': 24 * 60},
+                {'method': 'popup', 'minutes': 30},
             ],
-            'conferenceData': {
-                'createRequest': {
-                    'requestId': f"meet-{datetime.now().timestamp()}",
-                    'conferenceSolutionKey': {'type': 'hangoutsMeet'}
-                }
-            },
-            'reminders': {
-                'useDefault': False,
-                'overrides': [
-                    {'method': 'email', 'minutes': 24 * 60},
-                    {'method': 'popup', 'minutes': 30},
-                ],
-            },
-        }
+        },
+    }
+
+def create_meet_events(therapist_credentials, appointments):
+    """Create Google Calendar events with Meet links for one therapist's
+    appointments, given as (therapist_email, client_email, client_name, date,
+    time, idempotency_key) tuples, in one batch request. Returns one entry
+    per appointment: (meet_link, event_id), (None, None) if the therapist has
+    no usable credentials, or the exception it failed with."""
+    with calendar_service(therapist_credentials) as service:
+        if not service:
+            return [(None, None)] * len(appointments)
         
-        event = service.events().insert(
+        events = [meet_event(*appointment) for appointment in appointments]
+        requests = [service.events().insert(
             calendarId='primary',
             body=event,
             conferenceDataVersion=1,
             sendUpdates='all'
-        ).execute()
+        ) for event in events]
+        if len(requests) == 1:
+            try:
+                results = [requests[0].execute()]
+            except Exception as e:
+                results = [e]
+        else:
+            results = calendar_clients.execute_batch(service, requests)
         
-        meet_link = event.get('hangoutLink', 'N/A')
-        event_id = event.get('id')
-        
-        return meet_link, event_id
-    except Exception as e:
-        print(f"Error creating event: {e}")
-        return None, None
+        for i, result in enumerate(results):
+            if isinstance(result, HttpError) and result.resp.status == 409:
+                # An earlier attempt created it but its response was lost
+                try:
+                    results[i] = service.events().get(calendarId='primary', eventId=events[i]['id']).execute()
+                except Exception as e:
+                    results[i] = e
+    
+    return [result if isinstance(result, Exception) else (result.get('hangoutLink', 'N/A'), result.get('id'))
+            for result in results]
+
+SENDER_EMAIL = os.getenv("SENDER_EMAIL")
+SENDER_PASSWORD = os.getenv("SENDER_PASSWORD")
+
+# Long-lived SMTP sessions shared by all sends; None without credentials
+mailer = Mailer(
+    os.getenv("SMTP_SERVER", "smtp.gmail.com"),
+    int(os.getenv("SMTP_PORT", "587")),
+    SENDER_EMAIL,
+    SENDER_PASSWORD,
+    starttls=os.getenv("SMTP_STARTTLS", "1") != "0",
+    pool_size=int(os.getenv("SMTP_POOL_SIZE", "2")),
+    timeout=float(os.getenv("SMTP_TIMEOUT", "30")),
+    max_messages_per_session=int(os.getenv("SMTP_MAX_MESSAGES_PER_SESSION", "100")),
+) if SENDER_EMAIL and SENDER_PASSWORD else None
+
+def send_email(to_email, subject, body, message_id=None):
+    """Send email notification; raises on failure"""
+    if mailer is None:
+        raise PermanentError("Email credentials not configured")
+    mailer.send(mailer.build(to_email, subject, body, message_id))
+
+CLIENT_CONFIRMATION = EmailTemplate("Therapy Appointment Confirmed", """
+    <h2>Appointment Confirmed!</h2>
+    <p>Dear {client_name},</p>
+    <p>Your therapy session has been confirmed.</p>
+    <p><strong>Therapist:</strong> {therapist_name}</p>
+    <p><strong>Date:</strong> {sched_date}</p>
+    <p><strong>Time:</strong> {sched_time}</p>
+    <p><strong>Google Meet Link:</strong> <a href="{meet_link}">{meet_link}</a></p>
+    """)
+
+THERAPIST_CONFIRMATION = EmailTemplate("Appointment Accepted", """
+    <h2>Appointment Accepted</h2>
+    <p>You have accepted an appointment with {client_name}</p>
+    <p><strong>Date:</strong> {sched_date}</p>
+    <p><strong>Time:</strong> {sched_time}</p>
+    <p><strong>Google Meet Link:</strong> <a href="{meet_link}">{meet_link}</a></p>
+    """)
 
-def send_email(to_email, subject, body):
-    """Send email notification"""
+def confirmation_emails(client_name, client_email, therapist_name, therapist_email, sched_date, sched_time,
+                        meet_link):
+    """(role, recipient, subject, body) of the emails sent on acceptance"""
+    fields = dict(client_name=client_name, therapist_name=therapist_name, sched_date=sched_date,
+                  sched_time=sched_time, meet_link=meet_link)
+    return [
+        ("client", client_email, *CLIENT_CONFIRMATION.render(**fields)),
+        ("therapist", therapist_email, *THERAPIST_CONFIRMATION.render(**fields)),
+    ]
+
+# Outbox jobs; they run on worker threads and may run more than once
+
+def run_calendar_jobs(jobs):
+    """Create the Meet events for accepted appointments, one batch request
+    per therapist, then queue the confirmation emails"""
+    appointment_ids = [payload["appointment_id"] for payload, _ in jobs]
+    with pool.connection() as conn:
+        rows = {row[0]: row[1:] for row in conn.execute(f"""
+            SELECT a.id, a.status, a.client_name, a.client_email, a.scheduled_date, a.scheduled_time,
+                   a.meet_link, a.calendar_event_id, t.email, t.google_credentials, t.name
+            FROM appointments a
+            JOIN therapists t ON a.therapist_id = t.id
+            WHERE a.id IN ({",".join("?" * len(appointment_ids))})
+        """, appointment_ids)}
+    
+    results = [None] * len(jobs)
+    ready = []  # (appointment_id, meet_link, event_id, row)
+    by_therapist = {}  # credentials -> [(job index, appointment_id, row, create_meet_events tuple)]
+    for i, (appointment_id, (_, key)) in enumerate(zip(appointment_ids, jobs)):
+        row = rows.get(appointment_id)
+        if row is None or row[0] != 'accepted':
+            # Cancelled since it was accepted
+            continue
+        (_, client_name, client_email, sched_date, sched_time, meet_link, event_id,
+         therapist_email, creds, _) = row
+        if event_id:
+            ready.append((appointment_id, meet_link, event_id, row))
+        else:
+            by_therapist.setdefault(creds, []).append((i, appointment_id, row, (
+                therapist_email, client_email, client_name, sched_date, sched_time, key)))
+    
+    def create(creds):
+        return create_meet_events(creds, [appointment for _, _, _, appointment in by_therapist[creds]])
+    
+    for creds, outcomes in zip(by_therapist, calendar_executor.map(create, by_therapist)):
+        for (i, appointment_id, row, _), outcome in zip(by_therapist[creds], outcomes):
+            if isinstance(outcome, HttpError) and outcome.resp.status not in RETRYABLE_HTTP_STATUSES:
+                print(f"Error creating event: {outcome}")
+                outcome = (None, None)
+            if isinstance(outcome, Exception):
+                results[i] = outcome
+                continue
+            meet_link, event_id = outcome
+            ready.append((appointment_id, meet_link or "Manual setup required", event_id, row))
+    
+    if ready:
+        with pool.transaction() as conn:
+            for appointment_id, meet_link, event_id, row in ready:
+                (_, client_name, client_email, sched_date, sched_time, _, _,
+                 therapist_email, _, therapist_name) = row
+                conn.execute("""
+                    UPDATE appointments SET meet_link = ?, calendar_event_id = ? WHERE id = ?
+                """, (meet_link, event_id, appointment_id))
+                status = conn.execute("""
+                    SELECT status FROM appointments WHERE id = ?
+                """, (appointment_id,)).fetchone()[0]
+                if status != 'accepted':
+                    # Cancelled while the event was being created; its
+                    # calendar_delete job removes the event
+                    continue
+                for role, recipient, subject, body in confirmation_emails(
+                        client_name, client_email, therapist_name, therapist_email, sched_date, sched_time,
+                        meet_link):
+                    enqueue(conn, "email", {"to": recipient, "subject": subject, "body": body},
+                            f"email:{appointment_id}:{role}")
+        outbox_worker.wake()
+    return results
+
+def run_calendar_delete_job(payload, key):
+    """Delete the Meet event of a cancelled appointment"""
+    appointment_id = payload["appointment_id"]
+    with pool.connection() as conn:
+        row = conn.execute("""
+            SELECT a.calendar_event_id, t.google_credentials
+            FROM appointments a
+            JOIN therapists t ON a.therapist_id = t.id
+            WHERE a.id = ?
+        """, (appointment_id,)).fetchone()
+        creating = conn.execute("""
+            SELECT 1 FROM outbox WHERE idempotency_key = ? AND status IN ('pending', 'in_flight')
+        """, (f"calendar:{appointment_id}",)).fetchone()
+    if creating:
+        # Retried with backoff until the event id is known
+        raise RuntimeError("Event creation still in progress")
+    if row is None:
+        return
+    
+    # The id is known even if the insert's response was lost and never recorded
+    event_id, creds = row[0] or calendar_event_id(f"calendar:{appointment_id}"), row[1]
+    with calendar_service(creds) as service:
+        if not service:
+            # No usable credentials, so no event was created
+            return
+        try:
+            service.events().delete(calendarId='primary', eventId=event_id, sendUpdates='all').execute()
+        except HttpError as e:
+            if e.resp.status in (404, 410):
+                # Already gone
+                return
+            if e.resp.status in RETRYABLE_HTTP_STATUSES:
+                raise
+            raise PermanentError(str(e)) from e
+
+def email_error(error):
+    """Refusals that a retry won't change become PermanentError"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return PermanentError(str(error))
+    if isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600:
+        return PermanentError(f"{error.smtp_code} {error.smtp_error!r}")
+    return error
+
+def email_message(payload, key):
+    # A stable Message-ID lets mail clients drop a duplicate from a re-run
+    message_id = f"<{hashlib.sha1(key.encode()).hexdigest()}@wellmind>"
+    return mailer.build(payload["to"], payload["subject"], payload["body"], message_id)
+
+def run_email_jobs(jobs):
+    """Send every due email over one SMTP session, skipping those whose
+    appointment was cancelled since they were queued"""
+    if mailer is None:
+        raise PermanentError("Email credentials not configured")
+    appointment_ids = [int(key.split(":")[1]) for _, key in jobs]
+    with pool.connection() as conn:
+        accepted = {row[0] for row in conn.execute(f"""
+            SELECT id FROM appointments WHERE status = 'accepted' AND id IN ({",".join("?" * len(jobs))})
+        """, appointment_ids)}
+    sending = [i for i, appointment_id in enumerate(appointment_ids) if appointment_id in accepted]
     try:
-        smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-        smtp_port = int(os.getenv("SMTP_PORT", "587"))
-        sender_email = os.getenv("SENDER_EMAIL")
-        sender_password = os.getenv("SENDER_PASSWORD")
-        
-        if not sender_email or not sender_password:
-            print("Email credentials not configured")
-            return False
-        
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        msg.attach(MIMEText(body, 'html'))
-        
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        server.send_message(msg)
-        server.quit()
-        return True
-    except Exception as e:
-        print(f"Error sending email: {e}")
-        return False
+        sent = mailer.send_batch([email_message(*jobs[i]) for i in sending])
+    except smtplib.SMTPException as e:
+        # Couldn't get a session at all, e.g. the login was refused
+        raise email_error(e) from e
+    results = [None] * len(jobs)
+    for i, error in zip(sending, sent):
+        results[i] = None if error is None else email_error(error)
+    return results
+
+outbox_worker = OutboxWorker(
+    pool,
+    {"calendar_delete": run_calendar_delete_job},
+    batch_handlers={"calendar_event": run_calendar_jobs, "email": run_email_jobs},
+    concurrency=int(os.getenv("OUTBOX_CONCURRENCY", "4")),
+    batch_size=int(os.getenv("OUTBOX_BATCH_SIZE", "50")),
+    max_attempts=int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8")),
+    base_delay=float(os.getenv("OUTBOX_BASE_DELAY_SECONDS", "2")),
+)
+
+LIVE_BOOKING_SQL = """
+    SELECT 1 FROM appointments
+    WHERE therapist_id = ? AND scheduled_date = ? AND scheduled_time = ? AND status != 'cancelled'
+"""
+
+def bookable_slots(therapist_id, day):
+    """Free slots on `day`, minus those inside the booking notice window"""
+    free = availability.free_slots(therapist_id, day)
+    cutoff = datetime.utcnow() + timedelta(hours=BOOKING_NOTICE_HOURS)
+    if day < cutoff.date():
+        return ()
+    if day == cutoff.date():
+        return tuple(t for t in free if t > cutoff.strftime("%H:%M"))
+    return free
+
+def alternative_slots(therapist_id, day):
+    """The therapist's next few bookable slots from `day` on"""
+    alternatives = []
+    for offset in range(BOOKING_ALTERNATIVE_DAYS):
+        current = day + timedelta(days=offset)
+        alternatives += [{"date": current.isoformat(), "time": t} for t in bookable_slots(therapist_id, current)]
+        if len(alternatives) >= BOOKING_ALTERNATIVES:
+            break
+    return alternatives[:BOOKING_ALTERNATIVES]
 
 # API Endpoints
 
 @app.get("/therapists")
-async def get_therapists():
+def get_therapists():
     """Get list of all therapists"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, name, email, specialization, bio FROM therapists")
-    therapists = cursor.fetchall()
-    conn.close()
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, name, email, specialization, bio FROM therapists")
+        therapists = cursor.fetchall()
     
     return {
         "therapists": [
@@ -281,71 +532,99 @@ async def get_therapists():
     }
 
 @app.get("/therapists/{therapist_id}/slots")
-async def get_available_slots(therapist_id: int, date: str):
+def get_available_slots(therapist_id: int, date: str):
     """Get available slots for a therapist on a specific date"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    target_date = datetime.fromisoformat(date)
-    day_of_week = target_date.weekday()
-    
-    # Get therapist's available time slots
-    cursor.execute("""
-        SELECT start_time, end_time FROM available_slots 
-        WHERE therapist_id = ? AND day_of_week = ? AND is_available = 1
-    """, (therapist_id, day_of_week))
-    
-    slots = cursor.fetchall()
-    
-    # Get booked appointments for that date
-    cursor.execute("""
-        SELECT scheduled_time FROM appointments 
-        WHERE therapist_id = ? AND scheduled_date = ? AND status != 'cancelled'
-    """, (therapist_id, date))
-    
-    booked_times = [row[0] for row in cursor.fetchall()]
-    conn.close()
-    
-    available_slots = []
-    for start, end in slots:
-        current = datetime.strptime(start, "%H:%M")
-        end_time = datetime.strptime(end, "%H:%M")
-        
-        while current < end_time:
-            time_str = current.strftime("%H:%M")
-            if time_str not in booked_times:
-                available_slots.append(time_str)
-            current += timedelta(hours=1)
-    
-    return {"available_slots": available_slots}
+    try:
+        target_date = datetime.fromisoformat(date).date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="date must be YYYY-MM-DD")
+
+    return {"available_slots": list(bookable_slots(therapist_id, target_date))}
+
+@app.get("/availability/search")
+def search_availability(start_date: str, end_date: str, specialization: Optional[str] = None,
+                        tag: Optional[str] = None, after: Optional[str] = None, limit: int = 50):
+    """Open slots across all therapists in a date range, earliest first.
+    Pass the returned next_after as `after` to get the next page."""
+    try:
+        start = datetime.fromisoformat(start_date).date()
+        end = datetime.fromisoformat(end_date).date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start_date and end_date must be YYYY-MM-DD")
+    if end < start or (end - start).days >= SEARCH_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range must be 1-{SEARCH_MAX_DAYS} days")
+
+    cursor = None
+    if after:
+        try:
+            after_date, after_time, after_therapist = after.split(",")
+            # Times compare as strings, so "9:00" must become "09:00"
+            cursor = (datetime.fromisoformat(after_date).date().isoformat(),
+                      format_minutes(parse_minutes(after_time)), int(after_therapist))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid after cursor")
+
+    limit = max(1, min(limit, SEARCH_PAGE_MAX))
+    not_before = datetime.utcnow() + timedelta(hours=BOOKING_NOTICE_HOURS)
+    slots, more = availability.search(start, end, specialization, tag, not_before, cursor, limit)
+
+    next_after = None
+    if more:
+        last = slots[-1]
+        next_after = f"{last['date']},{last['time']},{last['therapist_id']}"
+    return {"slots": slots, "next_after": next_after}
 
 @app.post("/book")
-async def create_booking(booking: BookingRequest):
+def create_booking(booking: BookingRequest):
     """Create a new appointment booking"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    issues_tags_json = json.dumps(booking.issues_tags)
-    
-    cursor.execute("""
-        INSERT INTO appointments 
-        (therapist_id, client_name, client_email, client_phone, scheduled_date, 
-         scheduled_time, issues_tags, report_file, status)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'pending')
-    """, (
-        booking.therapist_id,
-        booking.client_name,
-        booking.client_email,
-        booking.client_phone,
-        booking.scheduled_date,
-        booking.scheduled_time,
-        issues_tags_json,
-        booking.report_file
-    ))
-    
-    conn.commit()
-    appointment_id = cursor.lastrowid
-    conn.close()
+    try:
+        sched_date = datetime.fromisoformat(booking.scheduled_date).date()
+        sched_time = format_minutes(parse_minutes(booking.scheduled_time))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="scheduled_date must be YYYY-MM-DD and scheduled_time HH:MM")
+    
+    slot = (booking.therapist_id, sched_date.isoformat(), sched_time)
+    
+    # Losers of a race are turned away by a plain read, without queueing
+    # for the write lock
+    with pool.connection() as conn:
+        taken = conn.execute(LIVE_BOOKING_SQL, slot).fetchone() is not None
+    
+    # Re-check and insert in one write transaction; the unique index on
+    # live bookings backs this up, so two requests can never both win
+    appointment_id = None
+    if not taken:
+        try:
+            with pool.transaction() as conn:
+                if conn.execute(LIVE_BOOKING_SQL, slot).fetchone() is None:
+                    appointment_id = conn.execute("""
+                        INSERT INTO appointments 
+                        (therapist_id, client_name, client_email, client_phone, scheduled_date, 
+                         scheduled_time, issues_tags, report_file, status)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 'pending')
+                    """, (
+                        booking.therapist_id,
+                        booking.client_name,
+                        booking.client_email,
+                        booking.client_phone,
+                        sched_date.isoformat(),
+                        sched_time,
+                        json.dumps(booking.issues_tags),
+                        booking.report_file
+                    )).lastrowid
+        except sqlite3.IntegrityError:
+            pass
+    booked = appointment_id is not None
+    
+    # A conflict means the cached day was stale if it still offered the slot
+    if booked or sched_time in availability.free_slots(booking.therapist_id, sched_date):
+        availability.invalidate(booking.therapist_id, sched_date.isoformat())
+    
+    if not booked:
+        return JSONResponse(status_code=409, content={
+            "detail": "This slot has just been booked",
+            "alternatives": alternative_slots(booking.therapist_id, sched_date)
+        })
     
     return {
         "message": "Booking request sent successfully",
@@ -354,33 +633,32 @@ async def create_booking(booking: BookingRequest):
     }
 
 @app.get("/therapist/{therapist_id}/dashboard")
-async def get_therapist_dashboard(therapist_id: int):
+def get_therapist_dashboard(therapist_id: int):
     """Get therapist's dashboard data"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Get pending appointments
-    cursor.execute("""
-        SELECT id, client_name, client_email, client_phone, scheduled_date, 
-               scheduled_time, issues_tags, report_file, created_at
-        FROM appointments 
-        WHERE therapist_id = ? AND status = 'pending'
-        ORDER BY scheduled_date, scheduled_time
-    """, (therapist_id,))
-    
-    pending = cursor.fetchall()
-    
-    # Get accepted appointments
-    cursor.execute("""
-        SELECT id, client_name, client_email, scheduled_date, scheduled_time, 
-               issues_tags, report_file, meet_link, status
-        FROM appointments 
-        WHERE therapist_id = ? AND status = 'accepted'
-        ORDER BY scheduled_date, scheduled_time
-    """, (therapist_id,))
-    
-    accepted = cursor.fetchall()
-    conn.close()
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+
+        # Get pending appointments
+        cursor.execute("""
+            SELECT id, client_name, client_email, client_phone, scheduled_date, 
+                   scheduled_time, issues_tags, report_file, created_at
+            FROM appointments 
+            WHERE therapist_id = ? AND status = 'pending'
+            ORDER BY scheduled_date, scheduled_time
+        """, (therapist_id,))
+
+        pending = cursor.fetchall()
+
+        # Get accepted appointments
+        cursor.execute("""
+            SELECT id, client_name, client_email, scheduled_date, scheduled_time, 
+                   issues_tags, report_file, meet_link, status
+            FROM appointments 
+            WHERE therapist_id = ? AND status = 'accepted'
+            ORDER BY scheduled_date, scheduled_time
+        """, (therapist_id,))
+
+        accepted = cursor.fetchall()
     
     return {
         "pending": [
@@ -412,104 +690,127 @@ async def get_therapist_dashboard(therapist_id: int):
     }
 
 @app.post("/therapist/accept")
-async def accept_appointment(accept: AcceptAppointment):
-    """Accept appointment and create Meet link"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Get appointment details
-    cursor.execute("""
-        SELECT a.therapist_id, a.client_name, a.client_email, a.scheduled_date, 
-               a.scheduled_time, t.email, t.google_credentials, t.name
-        FROM appointments a
-        JOIN therapists t ON a.therapist_id = t.id
-        WHERE a.id = ?
-    """, (accept.appointment_id,))
-    
-    result = cursor.fetchone()
-    if not result:
-        conn.close()
-        raise HTTPException(status_code=404, detail="Appointment not found")
-    
-    therapist_id, client_name, client_email, sched_date, sched_time, therapist_email, creds, therapist_name = result
-    
-    # Create Google Meet event
-    meet_link, event_id = create_meet_event(
-        therapist_email, client_email, client_name, 
-        sched_date, sched_time, creds
-    )
-    
-    if not meet_link:
-        meet_link = "Manual setup required"
-    
-    # Update appointment
-    cursor.execute("""
-        UPDATE appointments 
-        SET status = 'accepted', meet_link = ?, calendar_event_id = ?
-        WHERE id = ?
-    """, (meet_link, event_id, accept.appointment_id))
-    
-    conn.commit()
-    conn.close()
-    
-    # Send emails
-    client_body = f"""
-    <h2>Appointment Confirmed!</h2>
-    <p>Dear {client_name},</p>
-    <p>Your therapy session has been confirmed.</p>
-    <p><strong>Therapist:</strong> {therapist_name}</p>
-    <p><strong>Date:</strong> {sched_date}</p>
-    <p><strong>Time:</strong> {sched_time}</p>
-    <p><strong>Google Meet Link:</strong> <a href="{meet_link}">{meet_link}</a></p>
-    """
-    
-    therapist_body = f"""
-    <h2>Appointment Accepted</h2>
-    <p>You have accepted an appointment with {client_name}</p>
-    <p><strong>Date:</strong> {sched_date}</p>
-    <p><strong>Time:</strong> {sched_time}</p>
-    <p><strong>Google Meet Link:</strong> <a href="{meet_link}">{meet_link}</a></p>
-    """
+def accept_appointment(accept: AcceptAppointment):
+    """Accept appointment; the Meet link and emails follow in the background"""
+    with pool.transaction() as conn:
+        result = conn.execute("""
+            SELECT therapist_id, scheduled_date, status FROM appointments WHERE id = ?
+        """, (accept.appointment_id,)).fetchone()
+        if not result:
+            raise HTTPException(status_code=404, detail="Appointment not found")
+        
+        therapist_id, sched_date, status = result
+        if status == 'cancelled':
+            raise HTTPException(status_code=409, detail="Appointment was cancelled")
+        
+        # Status change and its side effects commit together; accepting
+        # twice queues nothing new
+        conn.execute("""
+            UPDATE appointments SET status = 'accepted' WHERE id = ?
+        """, (accept.appointment_id,))
+        enqueue(conn, "calendar_event", {"appointment_id": accept.appointment_id},
+                f"calendar:{accept.appointment_id}")
     
-    send_email(client_email, "Therapy Appointment Confirmed", client_body)
-    send_email(therapist_email, "Appointment Accepted", therapist_body)
+    availability.invalidate(therapist_id, sched_date)
+    outbox_worker.wake()
     
     return {
-        "message": "Appointment accepted successfully",
-        "meet_link": meet_link,
-        "calendar_event_id": event_id
+        "message": "Appointment accepted successfully; the Meet link will be emailed shortly",
+        "appointment_id": accept.appointment_id,
+        "status": "accepted"
     }
 
+@app.post("/therapist/cancel")
+def cancel_appointment(cancel: CancelAppointment):
+    """Cancel appointment and free its slot; an accepted one also loses its
+    Meet event and any confirmation emails not sent yet"""
+    with pool.transaction() as conn:
+        result = conn.execute("""
+            SELECT therapist_id, scheduled_date, status FROM appointments WHERE id = ?
+        """, (cancel.appointment_id,)).fetchone()
+        if not result:
+            raise HTTPException(status_code=404, detail="Appointment not found")
+        
+        therapist_id, sched_date, status = result
+        if status == 'cancelled':
+            raise HTTPException(status_code=409, detail="Appointment is already cancelled")
+        
+        conn.execute("""
+            UPDATE appointments SET status = 'cancelled' WHERE id = ?
+        """, (cancel.appointment_id,))
+        if status == 'accepted':
+            conn.execute("""
+                DELETE FROM outbox WHERE kind = 'email' AND idempotency_key LIKE ? AND status = 'pending'
+            """, (f"email:{cancel.appointment_id}:%",))
+            enqueue(conn, "calendar_delete", {"appointment_id": cancel.appointment_id},
+                    f"calendar_delete:{cancel.appointment_id}")
+    
+    availability.invalidate(therapist_id, sched_date)
+    if status == 'accepted':
+        outbox_worker.wake()
+    
+    return {"message": "Appointment cancelled", "appointment_id": cancel.appointment_id}
+
 @app.post("/therapists")
-async def add_therapist(therapist: Therapist):
+def add_therapist(therapist: Therapist):
     """Add new therapist (admin endpoint)"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        INSERT INTO therapists (name, email, specialization, bio)
-        VALUES (?, ?, ?, ?)
-    """, (therapist.name, therapist.email, therapist.specialization, therapist.bio))
-    
-    conn.commit()
-    therapist_id = cursor.lastrowid
-    conn.close()
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            INSERT INTO therapists (name, email, specialization, bio)
+            VALUES (?, ?, ?, ?)
+        """, (therapist.name, therapist.email, therapist.specialization, therapist.bio))
+
+        therapist_id = cursor.lastrowid
     
     return {"message": "Therapist added", "therapist_id": therapist_id}
 
 @app.post("/slots")
-async def add_slot(slot: AvailableSlot):
+def add_slot(slot: AvailableSlot):
     """Add available slot for therapist"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        INSERT INTO available_slots (therapist_id, day_of_week, start_time, end_time)
-        VALUES (?, ?, ?, ?)
-    """, (slot.therapist_id, slot.day_of_week, slot.start_time, slot.end_time))
-    
-    conn.commit()
-    conn.close()
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            INSERT INTO available_slots (therapist_id, day_of_week, start_time, end_time)
+            VALUES (?, ?, ?, ?)
+        """, (slot.therapist_id, slot.day_of_week, slot.start_time, slot.end_time))
+
+    availability.invalidate(slot.therapist_id)
     
     return {"message": "Slot added successfully"}
 
+@app.get("/stats/availability")
+def availability_stats():
+    """Availability cache hit rate and size"""
+    return {**availability.stats(), "db_pool": pool.stats()}
+
+@app.get("/stats/calendar")
+def calendar_stats():
+    """Cached Google Calendar clients and their hit rate"""
+    return calendar_clients.stats()
+
+@app.get("/stats/mailer")
+def mailer_stats():
+    """SMTP sessions opened and reused, and send throughput"""
+    if mailer is None:
+        return {"configured": False}
+    return {"configured": True, **mailer.stats()}
+
+@app.get("/outbox/stats")
+def outbox_stats():
+    """Queued, finished and dead-lettered side-effect jobs"""
+    return outbox_worker.stats()
+
+@app.get("/outbox/dead")
+def outbox_dead_letters(limit: int = 50):
+    """Most recent jobs that gave up"""
+    return {"jobs": outbox_worker.dead_letters(max(1, min(limit, 500)))}
+
+@app.post("/outbox/{job_id}/retry")
+def retry_outbox_job(job_id: int):
+    """Put a dead-lettered job back in the queue"""
+    if not outbox_worker.retry(job_id):
+        raise HTTPException(status_code=404, detail="No dead job with this id")
+    return {"message": "Job queued", "job_id": job_id}
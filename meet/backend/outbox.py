@@ -0,0 +1,235 @@
+# outbox.py
+#
+# Transactional outbox for side effects (calendar events, emails). A request
+# handler writes its state change and the outbox rows in one transaction and
+# returns; OutboxWorker drains the table in the background, retrying failed
+# jobs with jittered exponential backoff and dead-lettering those that keep
+# failing. Each job carries an idempotency key: enqueueing the same key twice
+# is a no-op, and handlers use it to make a re-run harmless (a job may run
+# again if a worker dies mid-job and its lease expires).
+
+import asyncio
+import json
+import random
+import time
+import traceback
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    idempotency_key TEXT UNIQUE NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL,
+    last_error TEXT,
+    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+    completed_at TEXT
+)
+"""
+
+
+class PermanentError(Exception):
+    """Raised by a handler when retrying cannot help; the job is
+    dead-lettered right away."""
+
+
+def enqueue(conn, kind, payload, idempotency_key, delay=0):
+    """Add a job inside the caller's transaction. Returns False if a job with
+    this key already exists."""
+    cursor = conn.execute("""
+        INSERT OR IGNORE INTO outbox (kind, idempotency_key, payload, next_attempt_at)
+        VALUES (?, ?, ?, ?)
+    """, (kind, idempotency_key, json.dumps(payload), time.time() + delay))
+    return cursor.rowcount == 1
+
+
+class OutboxWorker:
+    """Runs jobs through `handlers` ({kind: handler(payload, key)}), which
+    are blocking and run in threads, at most `concurrency` at a time.
+    Kinds in `batch_handlers` ({kind: handler([(payload, key), ...])}) are
+    handed over together, up to `batch_size` per call; the handler returns
+    one entry per job, None for success or the exception it failed with.
+
+    Jobs are claimed with a lease, so several processes can drain the same
+    table; a job whose worker died is picked up again once its lease ends.
+    """
+
+    def __init__(self, pool, handlers, batch_handlers=None, concurrency=4, batch_size=50, max_attempts=8,
+                 base_delay=2.0, max_delay=600.0, lease_seconds=300.0, poll_seconds=1.0):
+        self.pool = pool
+        self.handlers = handlers
+        self.batch_handlers = batch_handlers or {}
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+        self.poll_seconds = poll_seconds
+        self._loop = None
+        self._wakeup = None
+        self._claimed = set()
+        self.processed = {"done": 0, "retried": 0, "dead": 0, "batches": 0}
+
+    def wake(self):
+        """Start on new jobs now rather than at the next poll; safe to call
+        from any thread."""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        try:
+            await self._run()
+        finally:
+            # Cancelled (shutdown): hand unfinished jobs back now rather than
+            # when their lease ends
+            self._release()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                jobs = await asyncio.to_thread(self._claim, self.batch_size if self.batch_handlers
+                                               else self.concurrency)
+            except Exception:
+                traceback.print_exc()
+                jobs = []
+            if jobs:
+                batches, singles = {}, []
+                for job in jobs:
+                    if job[1] in self.batch_handlers:
+                        batches.setdefault(job[1], []).append(job)
+                    else:
+                        singles.append(job)
+                slots = asyncio.Semaphore(self.concurrency)
+                outcomes = await asyncio.gather(
+                    *(self._process_batch(kind, batch) for kind, batch in batches.items()),
+                    *(self._process(job, slots) for job in singles), return_exceptions=True)
+                # e.g. the database was locked while recording a result; those
+                # jobs run again once their lease ends. Back off until the
+                # next poll rather than let the loop die.
+                failures = [outcome for outcome in outcomes if isinstance(outcome, Exception)]
+                for error in failures:
+                    traceback.print_exception(type(error), error, error.__traceback__)
+                if not failures:
+                    continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+
+    def _claim(self, limit):
+        now = time.time()
+        with self.pool.transaction() as conn:
+            jobs = conn.execute("""
+                SELECT id, kind, idempotency_key, payload, attempts FROM outbox
+                WHERE (status = 'pending' AND next_attempt_at <= ?)
+                   OR (status = 'in_flight' AND lease_until <= ?)
+                ORDER BY next_attempt_at
+                LIMIT ?
+            """, (now, now, limit)).fetchall()
+            conn.executemany("""
+                UPDATE outbox SET status = 'in_flight', lease_until = ?, attempts = attempts + 1 WHERE id = ?
+            """, [(now + self.lease_seconds, job[0]) for job in jobs])
+        self._claimed.update(job[0] for job in jobs)
+        return jobs
+
+    def _release(self):
+        claimed, self._claimed = list(self._claimed), set()
+        if not claimed:
+            return
+        try:
+            with self.pool.connection() as conn:
+                conn.executemany("""
+                    UPDATE outbox SET status = 'pending', lease_until = NULL, next_attempt_at = ?
+                    WHERE id = ? AND status = 'in_flight'
+                """, [(time.time(), job_id) for job_id in claimed])
+        except Exception:
+            traceback.print_exc()
+
+    async def _process(self, job, slots):
+        job_id, kind, key, payload, attempts = job
+        async with slots:
+            try:
+                handler = self.handlers.get(kind)
+                if handler is None:
+                    raise PermanentError(f"No handler for {kind!r}")
+                await asyncio.to_thread(handler, json.loads(payload), key)
+                error = None
+            except Exception as e:
+                error = e
+        await asyncio.to_thread(self._record, [(job, error)])
+
+    async def _process_batch(self, kind, jobs):
+        try:
+            errors = await asyncio.to_thread(self.batch_handlers[kind],
+                                             [(json.loads(payload), key) for _, _, key, payload, _ in jobs])
+        except Exception as e:
+            errors = [e] * len(jobs)
+        self.processed["batches"] += 1
+        await asyncio.to_thread(self._record, list(zip(jobs, errors)))
+
+    def _record(self, outcomes):
+        """Mark jobs done, or schedule a retry / dead-letter the failed ones."""
+        now = time.time()
+        updates = []
+        for (job_id, kind, _, _, attempts), error in outcomes:
+            attempts += 1
+            if error is None:
+                updates.append(("done", now, None, "done", job_id))
+                self.processed["done"] += 1
+                continue
+            message = f"{type(error).__name__}: {error}"
+            print(f"Outbox job {job_id} ({kind}) failed on attempt {attempts}: {message}")
+            if isinstance(error, PermanentError) or attempts >= self.max_attempts:
+                updates.append(("dead", now, message, "dead", job_id))
+                self.processed["dead"] += 1
+            else:
+                delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempts))
+                updates.append(("pending", now + delay, message, "pending", job_id))
+                self.processed["retried"] += 1
+        with self.pool.connection() as conn:
+            conn.executemany("""
+                UPDATE outbox SET status = ?, next_attempt_at = ?, lease_until = NULL, last_error = ?,
+                                  completed_at = CASE WHEN ? = 'done' THEN CURRENT_TIMESTAMP END
+                WHERE id = ?
+            """, updates)
+        self._claimed.difference_update(update[-1] for update in updates)
+
+    def retry(self, job_id):
+        """Put a dead job back in the queue. Returns False if there is no
+        dead job with this id."""
+        with self.pool.connection() as conn:
+            cursor = conn.execute("""
+                UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = ?
+                WHERE id = ? AND status = 'dead'
+            """, (time.time(), job_id))
+        if cursor.rowcount:
+            self.wake()
+        return cursor.rowcount == 1
+
+    def dead_letters(self, limit=50):
+        with self.pool.connection() as conn:
+            rows = conn.execute("""
+                SELECT id, kind, idempotency_key, attempts, last_error, created_at FROM outbox
+                WHERE status = 'dead' ORDER BY id DESC LIMIT ?
+            """, (limit,)).fetchall()
+        return [{"id": r[0], "kind": r[1], "idempotency_key": r[2], "attempts": r[3], "last_error": r[4],
+                 "created_at": r[5]} for r in rows]
+
+    def stats(self):
+        with self.pool.connection() as conn:
+            counts = conn.execute("SELECT kind, status, COUNT(*) FROM outbox GROUP BY kind, status").fetchall()
+            oldest = conn.execute("""
+                SELECT MIN(next_attempt_at) FROM outbox WHERE status IN ('pending', 'in_flight')
+            """).fetchone()[0]
+        by_kind = {}
+        for kind, status, count in counts:
+            by_kind.setdefault(kind, {})[status] = count
+        return {"jobs": by_kind, "processed": dict(self.processed),
+                "oldest_due_seconds": round(max(0.0, time.time() - oldest), 1) if oldest else None}